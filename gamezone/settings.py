@@ -73,6 +73,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'rentals.caching.cache_versions',
             ],
         },
     },
@@ -90,6 +91,42 @@ DATABASES = {
 }
 
 
+# Cache
+# CACHE_BACKEND is 'locmem' (per process), 'file' (shared by the processes of one
+# host) or 'redis' (shared by every host; needs the redis package). Defaults to
+# redis when REDIS_URL is set
+REDIS_URL = os.environ.get('REDIS_URL', '')
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'redis' if REDIS_URL else 'locmem')
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'gamezone',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', '/var/tmp/gamezone_cache'),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL or 'redis://127.0.0.1:6379/0',
+    },
+}
+CACHES = {
+    'default': {
+        **CACHE_BACKENDS.get(CACHE_BACKEND, CACHE_BACKENDS['locmem']),
+        'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', 'gamezone'),
+        'TIMEOUT': 300,
+    },
+}
+
+# Anonymous page cache (see rentals/caching.py)
+PAGE_CACHE_SECONDS = int(os.environ.get('PAGE_CACHE_SECONDS', '300'))  # Fresh for this long
+PAGE_CACHE_STALE_FACTOR = 12  # Kept this many times longer, to serve while re-rendering
+PAGE_CACHE_LOCK_SECONDS = 30  # Longest a single re-render holds off others
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -201,6 +238,23 @@ SESSION_SAVE_EVERY_REQUEST = True
 PAYPAL_CLIENT_ID = os.environ.get('PAYPAL_CLIENT_ID', 'your-paypal-client-id')
 PAYPAL_CLIENT_SECRET = os.environ.get('PAYPAL_CLIENT_SECRET', 'your-paypal-client-secret')
 PAYPAL_MODE = os.environ.get('PAYPAL_MODE', 'sandbox')
+PAYPAL_BASE_URL = os.environ.get('PAYPAL_BASE_URL', '')  # Overrides the PAYPAL_MODE host, e.g. a local `manage.py fake_paypal`
+PAYPAL_CONNECT_TIMEOUT = float(os.environ.get('PAYPAL_CONNECT_TIMEOUT', '3.05'))
+PAYPAL_READ_TIMEOUT = float(os.environ.get('PAYPAL_READ_TIMEOUT', '15'))
+PAYPAL_MAX_RETRIES = int(os.environ.get('PAYPAL_MAX_RETRIES', '2'))  # Retries of idempotent calls on connection errors, 429 and 5xx
+PAYPAL_POOL_SIZE = int(os.environ.get('PAYPAL_POOL_SIZE', '10'))  # Kept-alive connections per worker
+PAYPAL_TOKEN_REFRESH_SECONDS = int(os.environ.get('PAYPAL_TOKEN_REFRESH_SECONDS', '300'))  # Replace cached OAuth tokens this long before they expire
+PAYPAL_CAPTURE_MAX_ATTEMPTS = int(os.environ.get('PAYPAL_CAPTURE_MAX_ATTEMPTS', '8'))
+PAYPAL_WEBHOOK_ID = os.environ.get('PAYPAL_WEBHOOK_ID', '')  # From the app's webhook settings; signatures are bound to it
+PAYPAL_CERT_CACHE_SECONDS = int(os.environ.get('PAYPAL_CERT_CACHE_SECONDS', '86400'))  # Webhook signing certificates
+
+# Background jobs (see rentals/jobs.py; run with `manage.py run_jobs`)
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '5'))
+JOB_RETRY_BACKOFF_SECONDS = float(os.environ.get('JOB_RETRY_BACKOFF_SECONDS', '30'))  # Doubled per attempt, with jitter
+JOB_RETRY_MAX_SECONDS = float(os.environ.get('JOB_RETRY_MAX_SECONDS', '3600'))
+JOB_LOCK_SECONDS = int(os.environ.get('JOB_LOCK_SECONDS', '300'))  # A running job is reclaimed after this long
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', '2'))
+JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', '7'))  # Succeeded jobs are deleted after this many days
 
 # Sensor Configuration
 SENSOR_READING_INTERVAL = 60  # minutes
@@ -209,6 +263,31 @@ SENSOR_ALERT_THRESHOLDS = {
     'humidity': {'min': 0, 'max': 100},
     'battery': {'min': 10, 'max': 100},
 }
+SENSOR_INGEST_BATCH_SIZE = int(os.environ.get('SENSOR_INGEST_BATCH_SIZE', '1000'))
+SENSOR_INGEST_TOKEN = os.environ.get('SENSOR_INGEST_TOKEN', '')  # Shared secret for device uploads
+SENSOR_STALE_CHECK_MINUTES = int(os.environ.get('SENSOR_STALE_CHECK_MINUTES', '15'))  # Schedule of check_sensor_alerts
+
+# Sensor data retention (see rentals/sensor_retention.py)
+SENSOR_RAW_RETENTION_DAYS = int(os.environ.get('SENSOR_RAW_RETENTION_DAYS', '30'))
+SENSOR_HOURLY_ROLLUP_RETENTION_DAYS = int(os.environ.get('SENSOR_HOURLY_ROLLUP_RETENTION_DAYS', '365'))
+SENSOR_PRUNE_BATCH_SIZE = int(os.environ.get('SENSOR_PRUNE_BATCH_SIZE', '5000'))
+SENSOR_READING_PARTITIONED = os.environ.get('SENSOR_READING_PARTITIONED', 'False').lower() == 'true'
+
+# Catalog facet counts (see rentals/facets.py)
+CATALOG_FACET_CACHE_SECONDS = int(os.environ.get('CATALOG_FACET_CACHE_SECONDS', '60'))
+
+# Proximity search (see rentals/nearby.py)
+NEARBY_DEFAULT_RADIUS_KM = float(os.environ.get('NEARBY_DEFAULT_RADIUS_KM', '25'))
+NEARBY_MAX_RADIUS_KM = float(os.environ.get('NEARBY_MAX_RADIUS_KM', '200'))
+NEARBY_MAX_DELIVERY_RADIUS_KM = float(os.environ.get('NEARBY_MAX_DELIVERY_RADIUS_KM', '100'))  # Longer delivery radii are capped
+
+# Buffered listing view counts (see rentals/view_counts.py)
+VIEW_COUNT_FLUSH_SECONDS = float(os.environ.get('VIEW_COUNT_FLUSH_SECONDS', '30'))
+VIEW_COUNT_FLUSH_MAX_PENDING = int(os.environ.get('VIEW_COUNT_FLUSH_MAX_PENDING', '1000'))  # Flush early once this many views are buffered
+
+# Admin list pages (see rentals/pagination.py)
+ADMIN_LIST_PAGE_SIZE = int(os.environ.get('ADMIN_LIST_PAGE_SIZE', '20'))
+ADMIN_LIST_COUNT = os.environ.get('ADMIN_LIST_COUNT', 'exact')  # 'exact', 'estimate' or 'none'
 
 # Security settings for production
 if not DEBUG:
@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from .models import (
     CustomUser, UserProfile, EquipmentCategory, Equipment, EquipmentImage,
-    Rental, Payment, Review, Message, Wishlist
+    Rental, Payment, Review, Message, Wishlist, Job
 )
 
 @admin.register(CustomUser)
@@ -83,3 +83,10 @@ class WishlistAdmin(admin.ModelAdmin):
     list_display = ['user', 'equipment', 'notify_when_available', 'max_daily_rate', 'created_at']
     list_filter = ['notify_when_available', 'created_at']
     search_fields = ['user__username', 'equipment__title']
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'key', 'status', 'attempts', 'max_attempts', 'run_after', 'finished_at']
+    list_filter = ['kind', 'status']
+    search_fields = ['key', 'last_error']
+    readonly_fields = ['created_at', 'finished_at', 'locked_by', 'locked_until']
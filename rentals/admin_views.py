@@ -2,52 +2,96 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib import messages
-from django.db.models import Count, Sum, Q, Avg
+from django.db.models import Count, Sum, Q, Avg, Min, Max, F, OuterRef, Subquery
 from django.utils import timezone
-from django.http import JsonResponse
-from django.core.paginator import Paginator
-from django.contrib.auth.models import User
+from django.utils.dateparse import parse_datetime
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from .models import Equipment, Rental, UserProfile, EquipmentCategory, Sensor, SensorReading, Payment
+from .facets import category_counts
+from .pagination import paginate_request
 from .paypal_service import initiate_payment
-from datetime import datetime, timedelta
+from .analytics import (
+    count_buckets, daily_series, monthly_revenue as monthly_revenue_series,
+    platform_totals, status_histogram, sum_daily
+)
+from .search import apply_full_text
+from .sensor_alerts import rules_for
+from .sensor_series import DEFAULT_MAX_POINTS, sensor_series
+from datetime import datetime, timedelta, timezone as dt_timezone
 import json
 
+User = get_user_model()
+
+# Longest user-growth window the dashboard accepts via ?days=
+MAX_GROWTH_WINDOW_DAYS = 365
+
+# Longest revenue trend the analytics page and API accept via ?months=
+MAX_REVENUE_WINDOW_MONTHS = 120
+
+# Bounds for the sensor chart API (?hours= and ?max_points=)
+MAX_SERIES_WINDOW_DAYS = 3660
+MAX_SERIES_POINTS = 5000
+
+def _paginate(request, queryset, ordering):
+    """Cursor page of an admin list, counted per settings.ADMIN_LIST_COUNT"""
+    return paginate_request(
+        request, queryset, ordering,
+        per_page=getattr(settings, 'ADMIN_LIST_PAGE_SIZE', 20),
+        count=getattr(settings, 'ADMIN_LIST_COUNT', 'exact'),
+    )
+
+def _int_param(request, name, default, minimum, maximum):
+    """Read an integer query parameter clamped to [minimum, maximum]; ValueError if malformed"""
+    value = request.GET.get(name)
+    if not value:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name} '{value}'") from None
+    return max(minimum, min(value, maximum))
+
 def superuser_required(user):
     return user.is_superuser
 
 @user_passes_test(lambda u: u.is_staff)
 def admin_dashboard(request):
     """Main admin dashboard with overview statistics"""
+    try:
+        growth_days = _int_param(request, 'days', 30, 1, MAX_GROWTH_WINDOW_DAYS)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
     
     # Get current date and calculate date ranges
     today = timezone.now().date()
     thirty_days_ago = today - timedelta(days=30)
     seven_days_ago = today - timedelta(days=7)
     
+    # Snapshot totals plus a live delta for anything changed since the last refresh
+    totals = platform_totals()
+    equipment_by_status = totals['equipment_by_status']
+    rentals_by_status = totals['rentals_by_status']
+    
     # User statistics
-    total_users = User.objects.count()
-    new_users_30d = User.objects.filter(date_joined__gte=thirty_days_ago).count()
+    total_users = totals['total_users']
+    new_users_30d = sum_daily(totals, 'new_users', thirty_days_ago)
     active_users = User.objects.filter(last_login__gte=seven_days_ago).count()
     
     # Equipment statistics
-    total_equipment = Equipment.objects.count()
-    active_equipment = Equipment.objects.filter(status='active').count()
-    pending_equipment = Equipment.objects.filter(status='pending').count()
+    total_equipment = totals['total_equipment']
+    active_equipment = equipment_by_status.get('active', 0)
+    pending_equipment = equipment_by_status.get('pending', 0)
     
     # Rental statistics
-    total_rentals = Rental.objects.count()
-    active_rentals = Rental.objects.filter(status__in=['confirmed', 'active']).count()
-    completed_rentals = Rental.objects.filter(status='completed').count()
+    total_rentals = totals['total_rentals']
+    active_rentals = rentals_by_status.get('confirmed', 0) + rentals_by_status.get('active', 0)
+    completed_rentals = rentals_by_status.get('completed', 0)
     
     # Revenue statistics
-    total_revenue = Rental.objects.filter(status='completed').aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
-    
-    monthly_revenue = Rental.objects.filter(
-        status='completed',
-        created_at__gte=thirty_days_ago
-    ).aggregate(total=Sum('total_amount'))['total'] or 0
+    total_revenue = totals['completed_revenue']
+    monthly_revenue = sum_daily(totals, 'completed_revenue', thirty_days_ago)
     
     # Recent activity (last 10 items)
     recent_users = User.objects.order_by('-date_joined')[:5]
@@ -55,15 +99,11 @@ def admin_dashboard(request):
     recent_rentals = Rental.objects.select_related('equipment', 'renter').order_by('-created_at')[:5]
     
     # Charts data for dashboard
-    # User growth over last 30 days
-    user_growth_data = []
-    for i in range(30):
-        date = today - timedelta(days=29-i)
-        count = User.objects.filter(date_joined__date=date).count()
-        user_growth_data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'count': count
-        })
+    # User growth over the requested window (30 days by default), one grouped query
+    user_growth_data = [
+        {'date': date.strftime('%Y-%m-%d'), 'count': count}
+        for date, count in daily_series(User.objects.all(), 'date_joined', growth_days, end=today)
+    ]
     
     # Equipment by category
     equipment_by_category = list(Equipment.objects.values('category__name').annotate(
@@ -86,7 +126,9 @@ def admin_dashboard(request):
         'recent_equipment': recent_equipment,
         'recent_rentals': recent_rentals,
         'user_growth_data': json.dumps(user_growth_data),
+        'growth_days': growth_days,
         'equipment_by_category': json.dumps(equipment_by_category),
+        'stats_snapshot_at': totals['snapshot_at'],
     }
     
     return render(request, 'admin/dashboard.html', context)
@@ -102,8 +144,8 @@ def admin_users(request):
     
     # Base queryset
     users = User.objects.select_related('userprofile').annotate(
-        equipment_count=Count('equipment'),
-        rental_count=Count('rental_as_renter')
+        equipment_count=Count('owned_equipment', distinct=True),
+        rental_count=Count('rentals_as_renter', distinct=True)
     )
     
     # Apply filters
@@ -128,9 +170,7 @@ def admin_users(request):
         users = users.filter(is_active=False)
     
     # Pagination
-    paginator = Paginator(users.order_by('-date_joined'), 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = _paginate(request, users, ['-date_joined', '-id'])
     
     context = {
         'page_obj': page_obj,
@@ -168,13 +208,13 @@ def admin_user_detail(request, user_id):
     user_rentals_as_renter = Rental.objects.filter(renter=user).select_related('equipment').order_by('-created_at')
     user_rentals_as_owner = Rental.objects.filter(equipment__owner=user).select_related('equipment', 'renter').order_by('-created_at')
     
-    total_earned = user_rentals_as_owner.filter(status='completed').aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
-    
-    total_spent = user_rentals_as_renter.filter(status='completed').aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
+    user_totals = count_buckets(
+        Rental.objects.filter(Q(renter=user) | Q(equipment__owner=user)),
+        earned=Sum('total_amount', filter=Q(status='completed', equipment__owner=user)),
+        spent=Sum('total_amount', filter=Q(status='completed', renter=user))
+    )
+    total_earned = user_totals['earned'] or 0
+    total_spent = user_totals['spent'] or 0
     
     context = {
         'user_obj': user,
@@ -203,12 +243,7 @@ def admin_equipment(request):
     
     # Apply filters
     if search_query:
-        equipment = equipment.filter(
-            Q(title__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(brand__icontains=search_query) |
-            Q(model__icontains=search_query)
-        )
+        equipment, _ = apply_full_text(equipment, search_query, rank=False)
     
     if category_filter != 'all':
         equipment = equipment.filter(category__name=category_filter)
@@ -220,9 +255,7 @@ def admin_equipment(request):
     categories = EquipmentCategory.objects.filter(is_active=True)
     
     # Pagination
-    paginator = Paginator(equipment.order_by('-created_at'), 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = _paginate(request, equipment, ['-created_at', '-id'])
     
     context = {
         'page_obj': page_obj,
@@ -263,10 +296,13 @@ def admin_equipment_detail(request, equipment_id):
     equipment_rentals = Rental.objects.filter(equipment=equipment).select_related('renter').order_by('-created_at')
     
     # Calculate statistics
-    total_rentals = equipment_rentals.count()
-    total_revenue = equipment_rentals.filter(status='completed').aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
+    rental_stats = count_buckets(
+        equipment_rentals,
+        total=Count('pk'),
+        revenue=Sum('total_amount', filter=Q(status='completed'))
+    )
+    total_rentals = rental_stats['total']
+    total_revenue = rental_stats['revenue'] or 0
     
     context = {
         'equipment': equipment,
@@ -311,9 +347,7 @@ def admin_rentals(request):
         rentals = rentals.filter(created_at__date__gte=month_ago)
     
     # Pagination
-    paginator = Paginator(rentals.order_by('-created_at'), 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = _paginate(request, rentals, ['-created_at', '-id'])
     
     context = {
         'page_obj': page_obj,
@@ -381,9 +415,10 @@ def admin_categories(request):
         
         return redirect('admin_categories')
     
-    categories = EquipmentCategory.objects.annotate(
-        equipment_count=Count('equipment')
-    ).order_by('-is_active', 'name')
+    categories = list(EquipmentCategory.objects.order_by('-is_active', 'name'))
+    counts = category_counts()
+    for category in categories:
+        category.equipment_count = counts.get(category.pk, 0)
     
     context = {
         'categories': categories,
@@ -394,33 +429,39 @@ def admin_categories(request):
 @user_passes_test(lambda u: u.is_staff)
 def admin_analytics(request):
     """Analytics and reporting page"""
+    try:
+        revenue_months = _int_param(request, 'months', 12, 1, MAX_REVENUE_WINDOW_MONTHS)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
     
     # Date range calculations
     today = timezone.now().date()
     thirty_days_ago = today - timedelta(days=30)
     
+    totals = platform_totals()
+    equipment_by_status = totals['equipment_by_status']
+    rentals_by_status = totals['rentals_by_status']
+    
     # User analytics
     user_stats = {
-        'total_users': User.objects.count(),
-        'new_users_this_month': User.objects.filter(date_joined__gte=thirty_days_ago).count(),
+        'total_users': totals['total_users'],
+        'new_users_this_month': sum_daily(totals, 'new_users', thirty_days_ago),
         'active_users': User.objects.filter(last_login__gte=thirty_days_ago).count(),
     }
     
     # Equipment analytics
     equipment_stats = {
-        'total_equipment': Equipment.objects.count(),
-        'active_equipment': Equipment.objects.filter(status='active').count(),
-        'pending_approval': Equipment.objects.filter(status='pending').count(),
+        'total_equipment': totals['total_equipment'],
+        'active_equipment': equipment_by_status.get('active', 0),
+        'pending_approval': equipment_by_status.get('pending', 0),
     }
     
     # Rental analytics
     rental_stats = {
-        'total_rentals': Rental.objects.count(),
-        'active_rentals': Rental.objects.filter(status__in=['confirmed', 'active']).count(),
-        'completed_rentals': Rental.objects.filter(status='completed').count(),
-        'total_revenue': Rental.objects.filter(status='completed').aggregate(
-            total=Sum('total_amount')
-        )['total'] or 0,
+        'total_rentals': totals['total_rentals'],
+        'active_rentals': rentals_by_status.get('confirmed', 0) + rentals_by_status.get('active', 0),
+        'completed_rentals': rentals_by_status.get('completed', 0),
+        'total_revenue': totals['completed_revenue'],
     }
     
     # Top categories
@@ -429,28 +470,16 @@ def admin_analytics(request):
     ).order_by('-count')[:5])
     
     # Top equipment owners
+    completed_earnings = Rental.objects.filter(
+        owner=OuterRef('pk'), status='completed'
+    ).order_by().values('owner').annotate(total=Sum('total_amount')).values('total')
     top_owners = list(User.objects.annotate(
-        equipment_count=Count('equipment'),
-        total_earned=Sum('equipment__rental__total_amount', filter=Q(equipment__rental__status='completed'))
-    ).filter(equipment_count__gt=0).order_by('-total_earned')[:5])
-    
-    # Monthly revenue trend (last 12 months)
-    monthly_revenue = []
-    for i in range(12):
-        month_start = today.replace(day=1) - timedelta(days=30*i)
-        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        
-        revenue = Rental.objects.filter(
-            status='completed',
-            created_at__date__range=[month_start, month_end]
-        ).aggregate(total=Sum('total_amount'))['total'] or 0
-        
-        monthly_revenue.append({
-            'month': month_start.strftime('%Y-%m'),
-            'revenue': float(revenue)
-        })
+        equipment_count=Count('owned_equipment'),
+        total_earned=Subquery(completed_earnings)
+    ).filter(equipment_count__gt=0).order_by(F('total_earned').desc(nulls_last=True))[:5])
     
-    monthly_revenue.reverse()
+    # Monthly revenue trend (last 12 calendar months by default), one grouped query
+    monthly_revenue = monthly_revenue_series(months=revenue_months, end=today)
     
     context = {
         'user_stats': user_stats,
@@ -459,10 +488,52 @@ def admin_analytics(request):
         'top_categories': json.dumps(top_categories),
         'top_owners': top_owners,
         'monthly_revenue': json.dumps(monthly_revenue),
+        'revenue_months': revenue_months,
+        'stats_snapshot_at': totals['snapshot_at'],
     }
     
     return render(request, 'admin/analytics.html', context)
 
+@user_passes_test(lambda u: u.is_staff)
+def admin_revenue_api(request):
+    """Monthly completed-rental revenue as JSON for finance dashboards"""
+    try:
+        months = _int_param(request, 'months', 12, 1, MAX_REVENUE_WINDOW_MONTHS)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'months': months,
+        'revenue': monthly_revenue_series(months=months),
+    })
+
+def _datetime_param(request, name, default):
+    """Read an ISO 8601 datetime query parameter; naive values are taken as UTC"""
+    value = request.GET.get(name)
+    if not value:
+        return default
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"Invalid {name} '{value}'")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+@user_passes_test(lambda u: u.is_staff)
+def admin_sensor_series(request, sensor_id):
+    """Downsampled numeric readings of one sensor as JSON for charts"""
+    sensor = get_object_or_404(Sensor, id=sensor_id)
+    now = timezone.now()
+    try:
+        hours = _int_param(request, 'hours', 24, 1, MAX_SERIES_WINDOW_DAYS * 24)
+        max_points = _int_param(request, 'max_points', DEFAULT_MAX_POINTS, 10, MAX_SERIES_POINTS)
+        end = _datetime_param(request, 'end', now)
+        start = _datetime_param(request, 'start', end - timedelta(hours=hours))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if start >= end:
+        return JsonResponse({'error': 'start must be before end'}, status=400)
+    return JsonResponse(sensor_series(sensor, start, end, max_points=max_points, now=now))
+
 @user_passes_test(lambda u: u.is_staff)
 def admin_settings(request):
     """Admin settings and configuration"""
@@ -486,11 +557,10 @@ def admin_sensors(request):
     search_query = request.GET.get('search', '')
     sensor_type_filter = request.GET.get('type', 'all')
     status_filter = request.GET.get('status', 'all')
+    online_filter = request.GET.get('online', 'all')
     
     # Base queryset
-    sensors = Sensor.objects.select_related('equipment').annotate(
-        reading_count=Count('readings')
-    )
+    sensors = Sensor.objects.all()
     
     # Apply filters
     if search_query:
@@ -506,24 +576,38 @@ def admin_sensors(request):
     if status_filter != 'all':
         sensors = sensors.filter(status=status_filter)
     
-    # Pagination
-    paginator = Paginator(sensors.order_by('-created_at'), 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Statistics for the filtered set, computed before the connectivity facet is applied
+    now = timezone.now()
+    sensor_counts = status_histogram(
+        sensors,
+        online=Sensor.objects.connectivity_q('online', now),
+        stale=Sensor.objects.connectivity_q('stale', now),
+        offline=Sensor.objects.connectivity_q('offline', now),
+    )
+    total_sensors = sensor_counts['total']
+    active_sensors = sensor_counts['active']
+    online_sensors = sensor_counts['online']
     
-    # Statistics
-    total_sensors = sensors.count()
-    active_sensors = sensors.filter(status='active').count()
-    online_sensors = sum(1 for sensor in sensors if sensor.is_online())
+    online_states = {'true': 'online', 'false': 'not_online', 'stale': 'stale', 'offline': 'offline'}
+    if online_filter in online_states:
+        sensors = sensors.filter(Sensor.objects.connectivity_q(online_states[online_filter], now))
+    
+    # Pagination
+    page_queryset = sensors.select_related('equipment').with_connectivity(now)
+    page_obj = _paginate(request, page_queryset, ['-created_at', '-id'])
     
     context = {
         'page_obj': page_obj,
         'search_query': search_query,
         'sensor_type_filter': sensor_type_filter,
         'status_filter': status_filter,
+        'online_filter': online_filter,
         'total_sensors': total_sensors,
         'active_sensors': active_sensors,
         'online_sensors': online_sensors,
+        'not_online_sensors': total_sensors - online_sensors,
+        'stale_sensors': sensor_counts['stale'],
+        'offline_sensors': sensor_counts['offline'],
         'sensor_types': Sensor.SENSOR_TYPES,
     }
     
@@ -555,15 +639,38 @@ def admin_sensor_detail(request, sensor_id):
     # Get sensor readings (last 50)
     sensor_readings = SensorReading.objects.filter(sensor=sensor).order_by('-timestamp')[:50]
     
-    # Calculate statistics
-    total_readings = sensor_readings.count()
-    avg_quality = sensor_readings.aggregate(avg=Avg('quality_score'))['avg'] or 0
+    # Calculate statistics in the database over the last 24 hours of typed values
+    window_start = timezone.now() - timedelta(hours=24)
+    rules = rules_for(sensor)
+    buckets = {
+        'count': Count('pk'),
+        'avg_value': Avg('numeric_value'),
+        'min_value': Min('numeric_value'),
+        'max_value': Max('numeric_value'),
+        'avg_quality': Avg('quality_score'),
+        'alerts': Q(is_alert=True),
+    }
+    out_of_range = Q()
+    if rules.min_value is not None:
+        out_of_range |= Q(numeric_value__lt=rules.min_value)
+    if rules.max_value is not None:
+        out_of_range |= Q(numeric_value__gt=rules.max_value)
+    if out_of_range:
+        buckets['out_of_range'] = out_of_range
+    window_stats = count_buckets(
+        SensorReading.objects.filter(sensor=sensor, timestamp__gte=window_start), **buckets
+    )
+    
+    total_readings = sensor.reading_count
+    avg_quality = window_stats['avg_quality'] or 0
     
     context = {
         'sensor': sensor,
         'sensor_readings': sensor_readings,
         'total_readings': total_readings,
         'avg_quality': avg_quality,
+        'window_stats': window_stats,
+        'alert_rules': rules,
     }
     
     return render(request, 'admin/sensor_detail.html', context)
@@ -623,14 +730,16 @@ def admin_payments(request):
         payments = payments.filter(payment_method=payment_method_filter)
     
     # Pagination
-    paginator = Paginator(payments.order_by('-created_at'), 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = _paginate(request, payments, ['-created_at', '-id'])
     
     # Statistics
-    total_payments = payments.count()
-    total_amount = payments.filter(status='completed').aggregate(total=Sum('amount'))['total'] or 0
-    pending_payments = payments.filter(status='pending').count()
+    payment_counts = status_histogram(
+        payments,
+        completed_amount=Sum('amount', filter=Q(status='completed'))
+    )
+    total_payments = payment_counts['total']
+    total_amount = payment_counts['completed_amount'] or 0
+    pending_payments = payment_counts['pending']
     
     context = {
         'page_obj': page_obj,
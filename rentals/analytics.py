@@ -0,0 +1,374 @@
+"""
+Aggregation helpers for the admin dashboards
+Rationale: Dashboards chart whole date ranges, so every series is computed with a
+single grouped query and gaps are filled in Python instead of one query per bucket
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import models
+from django.db.models import Count, Sum, Max, Q
+from django.db.models.functions import TruncDate, TruncDay, TruncWeek, TruncMonth
+from django.utils import timezone
+from .models import DailyPlatformStats, Equipment, Rental
+
+User = get_user_model()
+
+TRUNC_FUNCTIONS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+def bucket_start(value, interval='day'):
+    """Return the first day of the bucket containing value"""
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        value = value.date()
+    if interval == 'week':
+        return value - timedelta(days=value.weekday())
+    if interval == 'month':
+        return value.replace(day=1)
+    return value
+
+
+def next_bucket(value, interval='day'):
+    """Return the first day of the bucket following value"""
+    if interval == 'week':
+        return value + timedelta(days=7)
+    if interval == 'month':
+        if value.month == 12:
+            return value.replace(year=value.year + 1, month=1, day=1)
+        return value.replace(month=value.month + 1, day=1)
+    return value + timedelta(days=1)
+
+
+def add_months(value, months):
+    """Shift the first-of-month date value by a (possibly negative) number of months"""
+    month_index = value.year * 12 + (value.month - 1) + months
+    return value.replace(year=month_index // 12, month=month_index % 12 + 1, day=1)
+
+
+def bucket_range(start, end, interval='day'):
+    """List every bucket start between start and end (inclusive)"""
+    buckets = []
+    current = bucket_start(start, interval)
+    while current <= end:
+        buckets.append(current)
+        current = next_bucket(current, interval)
+    return buckets
+
+
+def count_buckets(queryset, **buckets):
+    """
+    Count the rows matching each Q in buckets with a single aggregate query
+    A bucket may also be an aggregate expression (e.g. Sum with a filter) to fetch it in the same pass
+    """
+    aggregates = {
+        name: Count('pk', filter=condition) if isinstance(condition, Q) else condition
+        for name, condition in buckets.items()
+    }
+    return queryset.order_by().aggregate(**aggregates)
+
+
+def status_histogram(queryset, field='status', choices=None, **extra):
+    """
+    Count rows per choice of `field`, plus 'total', in one query
+    Extra keyword buckets are passed through to count_buckets
+    """
+    if choices is None:
+        choices = queryset.model._meta.get_field(field).choices
+    buckets = {value: Q(**{field: value}) for value, _ in choices}
+    buckets.update(extra)
+    buckets['total'] = Count('pk')
+    return count_buckets(queryset, **buckets)
+
+
+def _day_bounds(start, end):
+    """Return the [start, end] date span as datetimes suitable for DateTimeField lookups"""
+    lower_bound = datetime.combine(start, time.min)
+    upper_bound = datetime.combine(end + timedelta(days=1), time.min)
+    if settings.USE_TZ:
+        lower_bound = timezone.make_aware(lower_bound)
+        upper_bound = timezone.make_aware(upper_bound)
+    return lower_bound, upper_bound
+
+
+def _range_filter(queryset, date_field, start, end):
+    """Filter queryset to [start, end] using an index-friendly range on date_field"""
+    field = queryset.model._meta.get_field(date_field)
+    if isinstance(field, models.DateTimeField):
+        lower_bound, upper_bound = _day_bounds(start, end)
+        return queryset.filter(**{f'{date_field}__gte': lower_bound, f'{date_field}__lt': upper_bound})
+    return queryset.filter(**{f'{date_field}__gte': start, f'{date_field}__lt': end + timedelta(days=1)})
+
+
+def _days_q(date_field, days):
+    """Q matching rows whose datetime falls on any of days, merged into contiguous ranges"""
+    condition = Q()
+    spans = []
+    for day in sorted(days):
+        if spans and day == spans[-1][1] + timedelta(days=1):
+            spans[-1][1] = day
+        else:
+            spans.append([day, day])
+    for start, end in spans:
+        lower_bound, upper_bound = _day_bounds(start, end)
+        condition |= Q(**{f'{date_field}__gte': lower_bound, f'{date_field}__lt': upper_bound})
+    return condition
+
+
+def time_series(queryset, date_field, start, end, interval='day', aggregate=None, default=0):
+    """
+    Bucket queryset rows by date_field between start and end in one GROUP BY query
+    Returns a list of (bucket_date, value) pairs with empty buckets filled with default
+    """
+    if interval not in TRUNC_FUNCTIONS:
+        raise ValueError(f"Unsupported interval '{interval}'")
+    if isinstance(start, datetime):
+        start = bucket_start(start)
+    if isinstance(end, datetime):
+        end = bucket_start(end)
+
+    aggregate = aggregate if aggregate is not None else Count('pk')
+    trunc = TRUNC_FUNCTIONS[interval](date_field)
+    rows = (
+        _range_filter(queryset, date_field, start, end)
+        .order_by()
+        .annotate(bucket=trunc)
+        .values('bucket')
+        .annotate(value=aggregate)
+        .values_list('bucket', 'value')
+    )
+
+    totals = {}
+    for bucket, value in rows:
+        key = bucket_start(bucket, interval)
+        totals[key] = totals.get(key, default) + (value or default)
+
+    return [(bucket, totals.get(bucket, default)) for bucket in bucket_range(start, end, interval)]
+
+
+def daily_series(queryset, date_field, days, end=None, aggregate=None):
+    """Time series for the last `days` days ending today (inclusive)"""
+    end = end or timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    return time_series(queryset, date_field, start, end, interval='day', aggregate=aggregate)
+
+
+def monthly_revenue(months=12, end=None, queryset=None):
+    """
+    Completed rental revenue per calendar month, oldest first
+    Covers the `months` calendar months up to and including the month of `end`
+    """
+    end = end or timezone.localdate()
+    start = add_months(end.replace(day=1), -(months - 1))
+    if queryset is None:
+        queryset = Rental.objects.filter(status='completed')
+    series = time_series(
+        queryset, 'created_at', start, end,
+        interval='month', aggregate=Sum('total_amount'), default=Decimal('0.00')
+    )
+    return [
+        {'month': month.strftime('%Y-%m'), 'revenue': float(revenue)}
+        for month, revenue in series
+    ]
+
+
+def _empty_day():
+    return {
+        'new_users': 0,
+        'new_equipment': 0,
+        'new_rentals': 0,
+        'equipment_by_status': {},
+        'rentals_by_status': {},
+        'completed_revenue': Decimal('0.00'),
+    }
+
+
+def collect_daily_stats(days=None):
+    """
+    Compute per-day KPI buckets with one grouped query per model
+    Rows are bucketed by creation day; pass `days` to limit the work to those days
+    """
+    users = User.objects.all()
+    equipment = Equipment.objects.all()
+    rentals = Rental.objects.all()
+    if days is not None:
+        if not days:
+            return {}
+        users = users.filter(_days_q('date_joined', days))
+        equipment = equipment.filter(_days_q('created_at', days))
+        rentals = rentals.filter(_days_q('created_at', days))
+
+    stats = defaultdict(_empty_day)
+    for day in days or []:
+        stats[day]
+
+    user_rows = (
+        users.order_by().annotate(day=TruncDate('date_joined'))
+        .values('day').annotate(count=Count('pk')).values_list('day', 'count')
+    )
+    for day, count in user_rows:
+        stats[day]['new_users'] = count
+
+    equipment_rows = (
+        equipment.order_by().annotate(day=TruncDate('created_at'))
+        .values('day', 'status').annotate(count=Count('pk'))
+        .values_list('day', 'status', 'count')
+    )
+    for day, status, count in equipment_rows:
+        stats[day]['new_equipment'] += count
+        stats[day]['equipment_by_status'][status] = count
+
+    rental_rows = (
+        rentals.order_by().annotate(day=TruncDate('created_at'))
+        .values('day', 'status').annotate(count=Count('pk'), revenue=Sum('total_amount'))
+        .values_list('day', 'status', 'count', 'revenue')
+    )
+    for day, status, count, revenue in rental_rows:
+        stats[day]['new_rentals'] += count
+        stats[day]['rentals_by_status'][status] = count
+        if status == 'completed':
+            stats[day]['completed_revenue'] += revenue or Decimal('0.00')
+
+    return dict(stats)
+
+
+def changed_days(since):
+    """Creation days of every user, listing or rental added or modified after `since`"""
+    days = set()
+    days.update(
+        User.objects.filter(date_joined__gt=since).order_by()
+        .annotate(day=TruncDate('date_joined')).values_list('day', flat=True).distinct()
+    )
+    for model in (Equipment, Rental):
+        days.update(
+            model.objects.filter(updated_at__gt=since).order_by()
+            .annotate(day=TruncDate('created_at')).values_list('day', flat=True).distinct()
+        )
+    return days
+
+
+def stale_days():
+    """Snapshot days flagged by a deletion since they were last computed"""
+    return set(DailyPlatformStats.objects.filter(stale=True).values_list('date', flat=True))
+
+
+def mark_stale(created):
+    """Flag the snapshot row for the day `created` falls on after a row from it is deleted"""
+    DailyPlatformStats.objects.filter(date=timezone.localdate(created), stale=False).update(stale=True)
+
+
+def snapshot_watermark():
+    """Time of the most recent DailyPlatformStats refresh, or None if never refreshed"""
+    return DailyPlatformStats.objects.aggregate(latest=Max('refreshed_at'))['latest']
+
+
+def refresh_daily_stats(full=False):
+    """
+    Bring the DailyPlatformStats snapshot up to date
+    Only days containing rows changed since the last refresh, plus days flagged
+    stale by a deletion, are recomputed unless `full` is set; days left without
+    any rows are dropped either way
+    Returns the number of days written
+    """
+    started_at = timezone.now()
+    watermark = None if full else snapshot_watermark()
+    days = None if watermark is None else changed_days(watermark) | stale_days()
+    stats = collect_daily_stats(days)
+    emptied = [
+        day for day, values in stats.items()
+        if not (values['new_users'] or values['new_equipment'] or values['new_rentals'])
+    ]
+    for day in emptied:
+        del stats[day]
+
+    existing = DailyPlatformStats.objects.in_bulk(list(stats), field_name='date')
+    to_create, to_update = [], []
+    for day, values in stats.items():
+        row = existing.get(day) or DailyPlatformStats(date=day)
+        for field, value in values.items():
+            setattr(row, field, value)
+        row.refreshed_at = started_at
+        row.stale = False
+        (to_update if row.pk else to_create).append(row)
+
+    DailyPlatformStats.objects.bulk_create(to_create, batch_size=500)
+    DailyPlatformStats.objects.bulk_update(
+        to_update, list(_empty_day()) + ['refreshed_at', 'stale'], batch_size=500
+    )
+    if full:
+        DailyPlatformStats.objects.exclude(date__in=list(stats)).delete()
+    else:
+        DailyPlatformStats.objects.filter(date__in=emptied).delete()
+    return len(stats)
+
+
+def _merge_counts(target, counts):
+    for key, count in counts.items():
+        target[key] = target.get(key, 0) + count
+
+
+def platform_totals():
+    """
+    Platform-wide KPIs read from the DailyPlatformStats snapshot
+    Days touched since the last refresh, and days flagged stale by a deletion, are
+    recomputed live and replace their snapshot rows, so the figures are current
+    without full-table counts
+    """
+    rows = DailyPlatformStats.objects.values_list(
+        'date', 'new_users', 'new_equipment', 'new_rentals',
+        'equipment_by_status', 'rentals_by_status', 'completed_revenue', 'refreshed_at', 'stale'
+    )
+    daily = {}
+    stale = set()
+    watermark = None
+    for date, new_users, new_equipment, new_rentals, equipment_by_status, rentals_by_status, revenue, refreshed_at, is_stale in rows:
+        daily[date] = {
+            'new_users': new_users,
+            'new_equipment': new_equipment,
+            'new_rentals': new_rentals,
+            'equipment_by_status': equipment_by_status,
+            'rentals_by_status': rentals_by_status,
+            'completed_revenue': revenue,
+        }
+        watermark = refreshed_at if watermark is None else max(watermark, refreshed_at)
+        if is_stale:
+            stale.add(date)
+
+    if watermark is None:
+        daily = collect_daily_stats()
+    else:
+        daily.update(collect_daily_stats(changed_days(watermark) | stale))
+
+    totals = {
+        'total_users': 0,
+        'total_equipment': 0,
+        'total_rentals': 0,
+        'equipment_by_status': {},
+        'rentals_by_status': {},
+        'completed_revenue': Decimal('0.00'),
+        'snapshot_at': watermark,
+        'daily': daily,
+    }
+    for values in daily.values():
+        totals['total_users'] += values['new_users']
+        totals['total_equipment'] += values['new_equipment']
+        totals['total_rentals'] += values['new_rentals']
+        _merge_counts(totals['equipment_by_status'], values['equipment_by_status'])
+        _merge_counts(totals['rentals_by_status'], values['rentals_by_status'])
+        totals['completed_revenue'] += values['completed_revenue']
+    return totals
+
+
+def sum_daily(totals, key, since):
+    """Sum a per-day KPI from platform_totals() over days on or after `since`"""
+    return sum(
+        (values[key] for day, values in totals['daily'].items() if day >= since),
+        Decimal('0.00') if key == 'completed_revenue' else 0
+    )
@@ -0,0 +1,176 @@
+"""
+Machine-facing JSON endpoints (device telemetry, integrations)
+"""
+import hmac
+import json
+import logging
+import math
+import uuid
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.dateparse import parse_date
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_GET, require_POST
+from .availability import available_equipment
+from .models import Equipment, UserProfile
+from .nearby import nearby_page
+from .pagination import InvalidCursor
+from .paypal_webhooks import WebhookVerificationError, record_event, verify_signature
+from .sensor_service import ingest_readings, parse_readings_payload
+
+logger = logging.getLogger(__name__)
+
+
+def _has_device_token(request):
+    expected = getattr(settings, 'SENSOR_INGEST_TOKEN', '')
+    supplied = request.headers.get('X-Sensor-Token', '')
+    return bool(expected) and hmac.compare_digest(expected, supplied)
+
+
+def _ingest(request):
+    try:
+        records = parse_readings_payload(request.body, request.content_type or '')
+    except ValueError as e:
+        return JsonResponse({'error': f'Invalid payload: {e}'}, status=400)
+
+    summary = ingest_readings(records)
+    status = 200 if summary['accepted'] or not summary['rejected'] else 400
+    return JsonResponse(summary, status=status)
+
+
+@csrf_exempt
+@require_POST
+def sensor_readings_ingest(request):
+    """
+    Bulk sensor reading ingestion
+    Accepts a JSON array (or {"readings": [...]}) or NDJSON body
+    Devices authenticate with the X-Sensor-Token header and need no CSRF token;
+    staff sessions are CSRF-checked, since any site can make a browser POST here
+    """
+    if _has_device_token(request):
+        return _ingest(request)
+    if request.user.is_authenticated and request.user.is_staff:
+        return csrf_protect(_ingest)(request)
+    return JsonResponse({'error': 'Authentication required'}, status=401)
+
+
+@require_GET
+def equipment_availability(request):
+    """
+    Which equipment is free for [start, end)
+    Checks the listed ?id= values (repeatable or comma separated), or every active
+    listing when none are given, with a single range-overlap query
+    """
+    try:
+        start = parse_date(request.GET.get('start', ''))
+        end = parse_date(request.GET.get('end', ''))
+    except ValueError:
+        start = end = None
+    if start is None or end is None:
+        return JsonResponse({'error': 'start and end must be YYYY-MM-DD dates'}, status=400)
+    if end <= start:
+        return JsonResponse({'error': 'end must be after start'}, status=400)
+
+    equipment = Equipment.objects.filter(status='active')
+    raw_ids = [value for param in request.GET.getlist('id') for value in param.split(',') if value]
+    if raw_ids:
+        try:
+            equipment = equipment.filter(pk__in=[uuid.UUID(value) for value in raw_ids])
+        except ValueError:
+            return JsonResponse({'error': 'Invalid equipment id'}, status=400)
+
+    available = available_equipment(start, end, equipment).values_list('pk', flat=True)
+    return JsonResponse({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'available': [str(pk) for pk in available],
+    })
+
+
+def _float_param(request, name):
+    value = request.GET.get(name, '')
+    if value == '':
+        return None
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(name)
+    return number
+
+
+@require_GET
+def equipment_nearby(request):
+    """
+    Active listings within ?radius_km= of (?lat=, ?lng=), closest first
+    The point defaults to the signed-in user's profile location. Listings further
+    away whose delivery radius covers the point are included with delivers=true
+    """
+    try:
+        latitude = _float_param(request, 'lat')
+        longitude = _float_param(request, 'lng')
+        radius_km = _float_param(request, 'radius_km')
+    except ValueError:
+        return JsonResponse({'error': 'lat, lng and radius_km must be numbers'}, status=400)
+
+    if (latitude is None or longitude is None) and request.user.is_authenticated:
+        profile = UserProfile.objects.filter(user=request.user).values_list('latitude', 'longitude').first()
+        if profile and None not in profile:
+            latitude, longitude = float(profile[0]), float(profile[1])
+    if latitude is None or longitude is None:
+        return JsonResponse({'error': 'lat and lng are required'}, status=400)
+
+    if radius_km is None:
+        radius_km = settings.NEARBY_DEFAULT_RADIUS_KM
+    if not 0 < radius_km <= settings.NEARBY_MAX_RADIUS_KM:
+        return JsonResponse({'error': f'radius_km must be in (0, {settings.NEARBY_MAX_RADIUS_KM:g}]'}, status=400)
+
+    try:
+        page = nearby_page(latitude, longitude, radius_km, cursor=request.GET.get('cursor') or None)
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'lat': latitude,
+        'lng': longitude,
+        'radius_km': radius_km,
+        'results': [{
+            'id': str(equipment.pk),
+            'title': equipment.title,
+            'category': equipment.category.name,
+            'daily_rate': str(equipment.daily_rate),
+            'location_city': equipment.location_city,
+            'location_state': equipment.location_state,
+            'distance_km': round(equipment.distance_km, 2),
+            'delivers': equipment.delivers,
+            'delivery_fee': str(equipment.delivery_fee) if equipment.delivers else None,
+        } for equipment in page],
+        'next_cursor': page.next_cursor,
+    })
+
+
+@csrf_exempt
+@require_POST
+def paypal_webhook(request):
+    """
+    PayPal webhook receiver (see rentals/paypal_webhooks.py)
+    Verifies, stores and queues the event, then acknowledges; redeliveries of a
+    stored event are acknowledged without further work
+    """
+    if not settings.PAYPAL_WEBHOOK_ID:
+        return JsonResponse({'error': 'Webhooks are not configured'}, status=503)
+    try:
+        verify_signature(request.headers, request.body)
+    except WebhookVerificationError as e:
+        logger.warning('Rejected PayPal webhook: %s', e)
+        return JsonResponse({'error': 'Invalid signature'}, status=400)
+
+    try:
+        event = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid payload'}, status=400)
+    if not isinstance(event, dict) or not event.get('id'):
+        return JsonResponse({'error': 'Invalid payload'}, status=400)
+
+    webhook_event, created = record_event(event)
+    return JsonResponse({'received': True, 'duplicate': not created})
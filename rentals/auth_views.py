@@ -15,6 +15,8 @@ from .forms import (
     RoleChangeForm, AdminUserForm
 )
 from .models import CustomUser, UserProfile
+from .analytics import status_histogram
+from .pagination import paginate_request
 import secrets
 from django.utils import timezone
 
@@ -67,17 +69,22 @@ class DashboardView(TemplateView):
                 'wishlist_count': user.wishlist.count(),
             })
         elif user.is_vendor():
+            rental_counts = status_histogram(user.rentals_as_owner.all())
             context.update({
                 'my_equipment': user.owned_equipment.all()[:5],
-                'pending_requests': user.rentals_as_owner.filter(status='pending').count(),
-                'active_rentals': user.rentals_as_owner.filter(status='active').count(),
+                'pending_requests': rental_counts['pending'],
+                'active_rentals': rental_counts['active'],
             })
         elif user.is_admin_user():
+            user_counts = status_histogram(
+                User.objects.all(), field='role',
+                unverified=Q(is_email_verified=False)
+            )
             context.update({
-                'total_users': User.objects.count(),
-                'total_customers': User.objects.filter(role='customer').count(),
-                'total_vendors': User.objects.filter(role='vendor').count(),
-                'pending_verifications': User.objects.filter(is_email_verified=False).count(),
+                'total_users': user_counts['total'],
+                'total_customers': user_counts['customer'],
+                'total_vendors': user_counts['vendor'],
+                'pending_verifications': user_counts['unverified'],
             })
         
         return context
@@ -249,14 +256,19 @@ class AdminDashboardView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # User statistics
+        # User statistics, all buckets from one aggregate query
+        user_counts = status_histogram(
+            User.objects.all(), field='role',
+            verified=Q(is_email_verified=True),
+            unverified=Q(is_email_verified=False)
+        )
         context.update({
-            'total_users': User.objects.count(),
-            'customers': User.objects.filter(role='customer').count(),
-            'vendors': User.objects.filter(role='vendor').count(),
-            'admins': User.objects.filter(role='admin').count(),
-            'verified_users': User.objects.filter(is_email_verified=True).count(),
-            'unverified_users': User.objects.filter(is_email_verified=False).count(),
+            'total_users': user_counts['total'],
+            'customers': user_counts['customer'],
+            'vendors': user_counts['vendor'],
+            'admins': user_counts['admin'],
+            'verified_users': user_counts['verified'],
+            'unverified_users': user_counts['unverified'],
             'recent_users': User.objects.order_by('-date_joined')[:10],
         })
         
@@ -270,10 +282,18 @@ class AdminUserListView(ListView):
     model = User
     template_name = 'rentals/admin/user_list.html'
     context_object_name = 'users'
-    paginate_by = 20
+    paginate_by = settings.ADMIN_LIST_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, page_size):
+        """Cursor pagination on (date_joined, id) in place of OFFSET pages"""
+        page = paginate_request(
+            self.request, queryset, ['-date_joined', '-id'],
+            per_page=page_size, count=settings.ADMIN_LIST_COUNT,
+        )
+        return None, page, page.object_list, page.has_other_pages()
     
     def get_queryset(self):
-        queryset = User.objects.all().order_by('-date_joined')
+        queryset = User.objects.all()
         
         # Search functionality
         search = self.request.GET.get('search')
@@ -0,0 +1,93 @@
+"""
+Equipment availability
+Rationale: Rentals in Rental.BLOCKING_STATUSES hold their equipment, so availability
+is a range-overlap test against those rows, served by the partial
+rental_booked_interval_idx index and answered for any number of items in one query
+
+Booked intervals are half-open [start_date, end_date): end_date is the return day
+(total_days = end_date - start_date), so a rental may start the day another ends.
+On PostgreSQL the rental_no_double_booking exclusion constraint enforces this in
+the database as well.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from .models import Equipment, Rental
+
+
+class BookingConflict(Exception):
+    """The requested dates overlap an existing booking of the equipment"""
+
+
+def validate_range(start, end):
+    if end <= start:
+        raise ValueError('end_date must be after start_date')
+
+
+def overlapping_rentals(start, end, queryset=None):
+    """Blocking rentals whose booked interval overlaps [start, end)"""
+    if queryset is None:
+        queryset = Rental.objects.all()
+    return queryset.filter(
+        status__in=Rental.BLOCKING_STATUSES, start_date__lt=end, end_date__gt=start
+    )
+
+
+def available_equipment(start, end, queryset=None):
+    """Equipment from queryset with no blocking rental overlapping [start, end), as one query"""
+    validate_range(start, end)
+    if queryset is None:
+        queryset = Equipment.objects.all()
+    booked = overlapping_rentals(start, end).filter(equipment=OuterRef('pk'))
+    return queryset.filter(~Exists(booked))
+
+
+def free_equipment_ids(equipment_ids, start, end):
+    """The subset of equipment_ids that is free for [start, end)"""
+    queryset = Equipment.objects.filter(pk__in=equipment_ids)
+    return set(available_equipment(start, end, queryset).values_list('pk', flat=True))
+
+
+def is_available(equipment, start, end, exclude_rental=None):
+    """Whether equipment (instance or id) is free for [start, end)"""
+    validate_range(start, end)
+    rentals = overlapping_rentals(start, end).filter(equipment=equipment)
+    if exclude_rental is not None:
+        rentals = rentals.exclude(pk=exclude_rental.pk)
+    return not rentals.exists()
+
+
+def booked_intervals(equipment, start=None, end=None):
+    """Merged [(start_date, end_date), ...] booked intervals of equipment, oldest first"""
+    rentals = Rental.objects.filter(equipment=equipment, status__in=Rental.BLOCKING_STATUSES)
+    if start is not None:
+        rentals = rentals.filter(end_date__gt=start)
+    if end is not None:
+        rentals = rentals.filter(start_date__lt=end)
+    intervals = []
+    for booked_start, booked_end in rentals.order_by('start_date').values_list('start_date', 'end_date'):
+        if intervals and booked_start <= intervals[-1][1]:
+            intervals[-1][1] = max(intervals[-1][1], booked_end)
+        else:
+            intervals.append([booked_start, booked_end])
+    return [tuple(interval) for interval in intervals]
+
+
+def hold_rental(rental, status):
+    """
+    Move rental into a blocking status, raising BookingConflict on a double booking
+    The equipment row is locked so concurrent holds are serialized; on PostgreSQL the
+    exclusion constraint rejects any overlap that slips past the check
+    """
+    if status not in Rental.BLOCKING_STATUSES:
+        raise ValueError(f"'{status}' does not hold equipment")
+    with transaction.atomic():
+        list(Equipment.objects.select_for_update().filter(pk=rental.equipment_id).values_list('pk'))
+        if not is_available(rental.equipment_id, rental.start_date, rental.end_date, exclude_rental=rental):
+            raise BookingConflict('Equipment is already booked for some of these dates')
+        rental.status = status
+        try:
+            with transaction.atomic():
+                rental.save()
+        except IntegrityError as e:
+            raise BookingConflict('Equipment is already booked for some of these dates') from e
+    return rental
@@ -0,0 +1,111 @@
+"""
+Anonymous page and fragment caching
+Rationale: The catalog and marketing pages are identical for every anonymous
+visitor, so they are rendered once per version instead of once per request
+
+Entries are keyed by URL and tagged with a version per group; saving or deleting
+catalog content (see rentals/signals.py) bumps the 'catalog' version instead of
+hunting down keys. An outdated or expired entry is still served to everyone but the
+one request that wins a short lock and re-renders it, so a burst of traffic after
+an edit does not stampede the database.
+
+Pages are only cached for anonymous GET/HEAD requests that produced a plain 200
+response without pending messages, cookies or a CSRF token.
+"""
+import hashlib
+import time
+from functools import wraps
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+CATALOG = 'catalog'
+PAGES = 'pages'
+
+
+def _version_key(group):
+    return f'cache-version:{group}'
+
+
+def get_version(group):
+    """Current version of group; starts from the clock so a lost key never goes backwards"""
+    version = cache.get(_version_key(group))
+    if version is None:
+        cache.add(_version_key(group), time.time_ns(), None)
+        version = cache.get(_version_key(group))
+    return version
+
+
+def bump_version(group):
+    """Invalidate every page and fragment cached for group"""
+    try:
+        return cache.incr(_version_key(group))
+    except ValueError:
+        version = time.time_ns()
+        cache.set(_version_key(group), version, None)
+        return version
+
+
+def page_key(group, request):
+    url = f'{request.scheme}://{request.get_host()}{request.get_full_path()}'
+    return f'page:{group}:{request.method}:{hashlib.sha1(url.encode("utf-8")).hexdigest()}'
+
+
+def _cacheable(request, response):
+    return (
+        response.status_code == 200
+        and not getattr(response, 'streaming', False)
+        and not response.cookies
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+        and not response.has_header('Cache-Control')
+    )
+
+
+def cache_for_anonymous(group=CATALOG, timeout=None):
+    """
+    View decorator serving anonymous visitors from the shared page cache
+    Fresh for timeout seconds (default PAGE_CACHE_SECONDS) at the group's current
+    version; past that the entry is served stale while one request re-renders it
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or request.user.is_authenticated \
+                    or len(messages.get_messages(request)):
+                return view(request, *args, **kwargs)
+
+            fresh_for = timeout if timeout is not None else settings.PAGE_CACHE_SECONDS
+            key = page_key(group, request)
+            version = get_version(group)
+            entry = cache.get(key)
+            locked = False
+            if entry is not None:
+                entry_version, stored_at, response = entry
+                if entry_version == version and time.time() - stored_at < fresh_for:
+                    return response
+                if not cache.add(f'{key}:lock', 1, settings.PAGE_CACHE_LOCK_SECONDS):
+                    return response
+                locked = True
+
+            try:
+                response = view(request, *args, **kwargs)
+                if hasattr(response, 'render') and callable(response.render):
+                    response = response.render()
+                if _cacheable(request, response):
+                    cache.set(key, (version, time.time(), response), fresh_for * settings.PAGE_CACHE_STALE_FACTOR)
+            finally:
+                # Released even when rendering fails, so the next request retries at once
+                if locked:
+                    cache.delete(f'{key}:lock')
+            return response
+        return wrapped
+    return decorator
+
+
+def cache_versions(request):
+    """Template context processor: versions and timeout for {% cache %} fragment keys"""
+    return {
+        'catalog_cache_version': SimpleLazyObject(lambda: str(get_version(CATALOG))),
+        'fragment_cache_seconds': settings.PAGE_CACHE_SECONDS,
+    }
@@ -0,0 +1,36 @@
+"""
+Database constraints only some backends can enforce
+Rationale: The no-double-booking rule is an exclusion constraint, which only
+PostgreSQL has; declaring it on the model keeps it in migration state while other
+backends (SQLite in development and tests) skip it and rely on the locked check in
+availability.hold_rental
+"""
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class PostgresExclusionConstraint(ExclusionConstraint):
+    """ExclusionConstraint that is created and validated on PostgreSQL only"""
+
+    @staticmethod
+    def _supported(connection):
+        return connection.vendor == 'postgresql'
+
+    def constraint_sql(self, model, schema_editor):
+        if not self._supported(schema_editor.connection):
+            return None
+        return super().constraint_sql(model, schema_editor)
+
+    def create_sql(self, model, schema_editor):
+        if not self._supported(schema_editor.connection):
+            return None
+        return super().create_sql(model, schema_editor)
+
+    def remove_sql(self, model, schema_editor):
+        if not self._supported(schema_editor.connection):
+            return None
+        return super().remove_sql(model, schema_editor)
+
+    def validate(self, model, instance, exclude=None, using=DEFAULT_DB_ALIAS):
+        if self._supported(connections[using]):
+            super().validate(model, instance, exclude=exclude, using=using)
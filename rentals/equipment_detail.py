@@ -0,0 +1,90 @@
+"""
+Equipment detail read model
+Rationale: The detail page shows the listing with its owner, owner profile,
+category, images, recent reviews with their authors, the viewer's wishlist state
+and upcoming bookings; loading those lazily from the template costs a query per
+relation and per review, so the page is assembled here from a fixed query plan
+
+Queries, independent of how many images or reviews a listing has:
+1. the listing joined to owner, owner profile and category, with the public review
+   count and wishlist flag as subqueries
+2. its images
+3. its most recent public reviews joined to their reviewers
+4. its booked intervals over the next AVAILABILITY_WINDOW_DAYS
+"""
+from datetime import timedelta
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import BooleanField, Count, Exists, IntegerField, OuterRef, Prefetch, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .availability import booked_intervals
+from .models import Equipment, EquipmentImage, Review, Wishlist
+
+RECENT_REVIEW_LIMIT = 10
+AVAILABILITY_WINDOW_DAYS = 90
+
+# Reviews about the listing, as opposed to owners reviewing renters
+EQUIPMENT_REVIEW_Q = Q(is_public=True) & ~Q(reviewer_type='owner_to_renter')
+
+
+class EquipmentDetail:
+    """Everything the equipment detail page renders, loaded up front"""
+
+    def __init__(self, equipment, owner_profile, images, reviews, review_count,
+                 is_wishlisted, booked, window_end):
+        self.equipment = equipment
+        self.owner = equipment.owner
+        self.owner_profile = owner_profile
+        self.category = equipment.category
+        self.images = images
+        self.primary_image = images[0] if images else None
+        self.reviews = reviews
+        self.review_count = review_count
+        self.is_wishlisted = is_wishlisted
+        self.booked = booked
+        self.window_end = window_end
+
+
+def detail_queryset(viewer=None):
+    """Equipment with the select_related/prefetch plan of the detail page"""
+    public_reviews = Review.objects.filter(EQUIPMENT_REVIEW_Q, equipment=OuterRef('pk'))
+    if viewer is not None and viewer.is_authenticated:
+        wishlisted = Exists(Wishlist.objects.filter(user=viewer, equipment=OuterRef('pk')))
+    else:
+        wishlisted = Value(False, output_field=BooleanField())
+    return Equipment.objects.select_related(
+        'owner', 'owner__userprofile', 'category',
+    ).annotate(
+        public_review_count=Coalesce(Subquery(
+            public_reviews.order_by().values('equipment').annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField(),
+        ), 0),
+        is_wishlisted=wishlisted,
+    ).prefetch_related(
+        Prefetch('images', queryset=EquipmentImage.objects.order_by('-is_primary', 'uploaded_at'),
+                 to_attr='image_list'),
+        Prefetch('reviews', queryset=Review.objects.filter(EQUIPMENT_REVIEW_Q).select_related('reviewer')
+                 .order_by('-created_at')[:RECENT_REVIEW_LIMIT], to_attr='recent_reviews'),
+    )
+
+
+def build_equipment_detail(equipment_id, viewer=None, queryset=None):
+    """EquipmentDetail for equipment_id; raises Equipment.DoesNotExist"""
+    queryset = detail_queryset(viewer) if queryset is None else queryset
+    equipment = queryset.get(pk=equipment_id)
+    try:
+        owner_profile = equipment.owner.userprofile
+    except ObjectDoesNotExist:
+        owner_profile = None
+    today = timezone.localdate()
+    window_end = today + timedelta(days=AVAILABILITY_WINDOW_DAYS)
+    return EquipmentDetail(
+        equipment,
+        owner_profile=owner_profile,
+        images=equipment.image_list,
+        reviews=equipment.recent_reviews,
+        review_count=equipment.public_review_count,
+        is_wishlisted=equipment.is_wishlisted,
+        booked=booked_intervals(equipment.pk, start=today, end=window_end),
+        window_end=window_end,
+    )
@@ -0,0 +1,186 @@
+"""
+Catalog facet counts
+Rationale: Counting each facet value separately costs one COUNT per category,
+condition, price band and availability flag on every catalog page; instead one
+grouped query returns the listing count for every combination of facet values and
+the per-facet counts are summed from it in Python
+
+Counts are disjunctive: each facet is counted with every current filter except its
+own, so the other values of a selected facet keep their counts. Price filters are
+free-form, so when one is set the price bands come from a second grouped query.
+Results are cached for CATALOG_FACET_CACHE_SECONDS under the normalized filter and
+the catalog cache version (rentals/caching.py), so catalog edits show up at once.
+"""
+import hashlib
+import json
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Value, When
+from .caching import CATALOG, get_version
+from .models import Equipment
+from .search import filter_equipment, search_terms
+
+CACHE_PREFIX = 'catalog-facets'
+
+# (min, max) daily rate bands; max is exclusive, None means unbounded
+PRICE_BANDS = [
+    (None, Decimal('10')),
+    (Decimal('10'), Decimal('25')),
+    (Decimal('25'), Decimal('50')),
+    (Decimal('50'), Decimal('100')),
+    (Decimal('100'), None),
+]
+
+CUBE_FIELDS = (
+    'category_id', 'category__name', 'condition', 'price_band',
+    'is_available_for_pickup', 'is_available_for_delivery',
+)
+
+
+def _band_label(low, high):
+    if low is None:
+        return f'Under ${high:,.0f}'
+    if high is None:
+        return f'${low:,.0f}+'
+    return f'${low:,.0f} - ${high:,.0f}'
+
+
+def price_band_case():
+    """Index into PRICE_BANDS of each listing's daily_rate"""
+    whens = [
+        When(daily_rate__lt=high, then=Value(index))
+        for index, (_, high) in enumerate(PRICE_BANDS) if high is not None
+    ]
+    return Case(*whens, default=Value(len(PRICE_BANDS) - 1), output_field=IntegerField())
+
+
+def normalize_params(params):
+    """The parts of EquipmentFilterForm.cleaned_data that affect counts, as plain values"""
+    category = params.get('category')
+
+    def price(name):
+        value = params.get(name)
+        return None if value is None else str(Decimal(value).normalize())
+
+    return {
+        'search': ' '.join(search_terms(params.get('search'))),
+        'category': getattr(category, 'pk', category) or None,
+        'condition': params.get('condition') or '',
+        'min_price': price('min_price'),
+        'max_price': price('max_price'),
+        'location': (params.get('location') or '').strip().lower(),
+        'pickup': bool(params.get('available_for_pickup')),
+        'delivery': bool(params.get('available_for_delivery')),
+    }
+
+
+def cache_key(name, payload):
+    payload = dict(payload, version=get_version(CATALOG))
+    digest = hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return f'{CACHE_PREFIX}:{name}:{digest}'
+
+
+def _cache_timeout():
+    return getattr(settings, 'CATALOG_FACET_CACHE_SECONDS', 60)
+
+
+def _cube(queryset):
+    return list(
+        queryset.order_by().annotate(price_band=price_band_case())
+        .values(*CUBE_FIELDS).annotate(listings=Count('pk'))
+    )
+
+
+def _matches(row, selected, skip):
+    if selected['category'] and 'category' not in skip and row['category_id'] != selected['category']:
+        return False
+    if selected['condition'] and 'condition' not in skip and row['condition'] != selected['condition']:
+        return False
+    if selected['pickup'] and 'pickup' not in skip and not row['is_available_for_pickup']:
+        return False
+    if selected['delivery'] and 'delivery' not in skip and not row['is_available_for_delivery']:
+        return False
+    return True
+
+
+def compute_facets(params):
+    """Facet counts for the filter set, from one or two grouped queries"""
+    selected = normalize_params(params)
+    price_filtered = selected['min_price'] is not None or selected['max_price'] is not None
+    skip = ('category', 'condition', 'pickup', 'delivery')
+    queryset, _ = filter_equipment(params, skip=skip if price_filtered else skip + ('price',))
+    rows = _cube(queryset)
+
+    categories, conditions = {}, {}
+    pickup = delivery = total = 0
+    for row in rows:
+        listings = row['listings']
+        if _matches(row, selected, ('category',)):
+            entry = categories.setdefault(row['category_id'], {
+                'value': row['category_id'], 'label': row['category__name'], 'count': 0,
+            })
+            entry['count'] += listings
+        if _matches(row, selected, ('condition',)):
+            conditions[row['condition']] = conditions.get(row['condition'], 0) + listings
+        if _matches(row, selected, ('pickup',)) and row['is_available_for_pickup']:
+            pickup += listings
+        if _matches(row, selected, ('delivery',)) and row['is_available_for_delivery']:
+            delivery += listings
+        if _matches(row, selected, ()):
+            total += listings
+
+    if price_filtered:
+        queryset, _ = filter_equipment(params, skip=('price',))
+        band_counts = dict(
+            queryset.order_by().annotate(price_band=price_band_case())
+            .values_list('price_band').annotate(listings=Count('pk'))
+        )
+    else:
+        band_counts = {}
+        for row in rows:
+            if _matches(row, selected, ()):
+                band_counts[row['price_band']] = band_counts.get(row['price_band'], 0) + row['listings']
+
+    condition_labels = dict(Equipment.CONDITION_CHOICES)
+    return {
+        'total': total,
+        'category': sorted(categories.values(), key=lambda entry: (-entry['count'], entry['label'])),
+        'condition': [
+            {'value': value, 'label': condition_labels[value], 'count': conditions[value]}
+            for value, _ in Equipment.CONDITION_CHOICES if conditions.get(value)
+        ],
+        'price': [
+            {
+                'min_price': low, 'max_price': None if high is None else high - Decimal('0.01'),
+                'label': _band_label(low, high), 'count': band_counts[index],
+            }
+            for index, (low, high) in enumerate(PRICE_BANDS) if band_counts.get(index)
+        ],
+        'pickup': pickup,
+        'delivery': delivery,
+    }
+
+
+def catalog_facets(params, use_cache=True):
+    """compute_facets, cached for a short while under the normalized filter"""
+    if not use_cache:
+        return compute_facets(params)
+    key = cache_key('catalog', normalize_params(params))
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(params)
+        cache.set(key, facets, _cache_timeout())
+    return facets
+
+
+def category_counts(status=None, use_cache=True):
+    """{category_id: listing count} over all listings, or those with the given status"""
+    key = cache_key('categories', {'status': status})
+    counts = cache.get(key) if use_cache else None
+    if counts is None:
+        queryset = Equipment.objects.all() if status is None else Equipment.objects.filter(status=status)
+        counts = dict(queryset.order_by().values_list('category').annotate(listings=Count('pk')))
+        if use_cache:
+            cache.set(key, counts, _cache_timeout())
+    return counts
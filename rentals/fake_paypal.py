@@ -0,0 +1,304 @@
+"""
+Local stand-in for the PayPal REST API, for load and integration testing
+Rationale: PayPalService could only reach PayPal's sandbox or production, so
+checkout could not be load-tested offline or without PayPal's rate limits
+
+Serves the endpoints PayPalService uses, with PayPal-shaped responses:
+- POST /v1/oauth2/token (client credentials; tokens expire after token_ttl)
+- POST /v2/checkout/orders, with self/approve/update/capture HATEOAS links
+- GET  /v2/checkout/orders/<id>
+- POST /v2/checkout/orders/<id>/capture
+- GET  /checkoutnow?token=<id>, the approve link, which approves the order
+POSTs honour PayPal-Request-Id by replaying the first response.
+
+latency (+ up to jitter) seconds is added to every response and error_rate of
+requests are answered with a 503 before any work is done, as PayPal's edge does.
+With auto_approve (the default) orders can be captured without visiting the
+approve link.
+
+In-process:
+    with FakePayPalServer(latency=0.05) as fake:
+        with override_settings(PAYPAL_BASE_URL=fake.url): ...
+As a separate process: `manage.py fake_paypal --port 8765`, then run the site
+with PAYPAL_BASE_URL=http://127.0.0.1:8765
+"""
+import json
+import random
+import secrets
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+def _now():
+    return datetime.now(dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _new_id(length=17):
+    return secrets.token_hex(length)[:length].upper()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for thousands of concurrent checkouts
+    request_queue_size = 1024
+
+
+class FakePayPalHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.fake.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        fake = self.server.fake
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        path = urlsplit(self.path).path.rstrip('/')
+        fake.count(f'{method} {fake.route_name(path)}')
+
+        delay = fake.latency + random.uniform(0, fake.jitter)
+        if delay:
+            time.sleep(delay)
+        if fake.error_rate and random.random() < fake.error_rate:
+            fake.count('injected_errors')
+            return self._reply(503, {'name': 'SERVICE_UNAVAILABLE', 'message': 'Injected failure'})
+
+        status, payload = fake.handle(method, self.path, self.headers, body, self._base_url())
+        self._reply(status, payload)
+
+    def _base_url(self):
+        host = self.headers.get('Host') or f'{self.server.server_address[0]}:{self.server.server_address[1]}'
+        return f'http://{host}'
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakePayPalServer:
+    """In-memory PayPal API on a background thread; see the module docstring"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 token_ttl=32400, auto_approve=True, verbose=False):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.token_ttl = token_ttl
+        self.auto_approve = auto_approve
+        self.verbose = verbose
+        self.stats = Counter()
+        self.orders = {}
+        self.tokens = {}
+        self.idempotent_responses = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _bind(self):
+        self._server = _Server((self.host, self.port), FakePayPalHandler)
+        self._server.fake = self
+
+    def start(self):
+        """Serve on a daemon thread; returns self"""
+        self._bind()
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-paypal', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Serve on the calling thread until interrupted"""
+        self._bind()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self._server = None
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    @staticmethod
+    def route_name(path):
+        parts = path.strip('/').split('/')
+        if parts[:3] == ['v2', 'checkout', 'orders'] and len(parts) > 3:
+            return '/v2/checkout/orders/{id}' + ('/' + '/'.join(parts[4:]) if len(parts) > 4 else '')
+        return path or '/'
+
+    # Request handling
+
+    def handle(self, method, raw_path, headers, body, base_url):
+        split = urlsplit(raw_path)
+        parts = split.path.strip('/').split('/')
+
+        if method == 'POST' and split.path.rstrip('/') == '/v1/oauth2/token':
+            return self.issue_token()
+        if method == 'GET' and split.path.rstrip('/') == '/checkoutnow':
+            return self.approve(parse_qs(split.query).get('token', [''])[0])
+
+        if not self.authorized(headers.get('Authorization', '')):
+            return 401, {'error': 'invalid_token', 'error_description': 'Token signature verification failed'}
+
+        request_id = headers.get('PayPal-Request-Id') if method == 'POST' else None
+        if request_id:
+            with self._lock:
+                replay = self.idempotent_responses.get((split.path, request_id))
+            if replay is not None:
+                self.count('replayed')
+                return replay
+
+        if parts[:3] != ['v2', 'checkout', 'orders']:
+            result = 404, {'name': 'RESOURCE_NOT_FOUND', 'message': 'The requested resource was not found'}
+        elif method == 'POST' and len(parts) == 3:
+            result = self.create_order(body, base_url)
+        elif method == 'GET' and len(parts) == 4:
+            result = self.order_details(parts[3])
+        elif method == 'POST' and len(parts) == 5 and parts[4] == 'capture':
+            result = self.capture(parts[3], base_url)
+        else:
+            result = 404, {'name': 'RESOURCE_NOT_FOUND', 'message': 'The requested resource was not found'}
+
+        if request_id and result[0] < 500:
+            with self._lock:
+                self.idempotent_responses[(split.path, request_id)] = result
+        return result
+
+    def issue_token(self):
+        token = f'A21AA{secrets.token_urlsafe(24)}'
+        with self._lock:
+            self.tokens[token] = time.time() + self.token_ttl
+        return 200, {
+            'scope': 'https://uri.paypal.com/services/payments/payment',
+            'access_token': token,
+            'token_type': 'Bearer',
+            'app_id': 'APP-FAKE',
+            'expires_in': self.token_ttl,
+            'nonce': _now() + secrets.token_hex(8),
+        }
+
+    def authorized(self, header):
+        if not header.startswith('Bearer '):
+            return False
+        with self._lock:
+            expires_at = self.tokens.get(header[len('Bearer '):])
+        return expires_at is not None and expires_at > time.time()
+
+    def _links(self, order_id, base_url):
+        order_url = f'{base_url}/v2/checkout/orders/{order_id}'
+        return [
+            {'href': order_url, 'rel': 'self', 'method': 'GET'},
+            {'href': f'{base_url}/checkoutnow?token={order_id}', 'rel': 'approve', 'method': 'GET'},
+            {'href': order_url, 'rel': 'update', 'method': 'PATCH'},
+            {'href': f'{order_url}/capture', 'rel': 'capture', 'method': 'POST'},
+        ]
+
+    def create_order(self, body, base_url):
+        try:
+            data = json.loads(body or b'{}')
+            units = data['purchase_units']
+            units[0]['amount']['value']
+        except (ValueError, KeyError, IndexError, TypeError):
+            return 400, {'name': 'INVALID_REQUEST', 'message': 'Request is not well-formed'}
+        order_id = _new_id()
+        order = {
+            'id': order_id,
+            'intent': data.get('intent', 'CAPTURE'),
+            'status': 'APPROVED' if self.auto_approve else 'CREATED',
+            'purchase_units': units,
+            'create_time': _now(),
+        }
+        with self._lock:
+            self.orders[order_id] = order
+        return 201, {'id': order_id, 'status': 'CREATED', 'links': self._links(order_id, base_url)}
+
+    def _payer(self, order_id):
+        return {
+            'name': {'given_name': 'Fake', 'surname': 'Buyer'},
+            'email_address': f'buyer-{order_id.lower()}@example.com',
+            'payer_id': f'PAYER{order_id[:8]}',
+        }
+
+    def order_details(self, order_id):
+        with self._lock:
+            order = self.orders.get(order_id)
+            order = dict(order) if order else None
+        if order is None:
+            return 404, {'name': 'RESOURCE_NOT_FOUND', 'message': f'Order {order_id} does not exist'}
+        if order['status'] in ('APPROVED', 'COMPLETED'):
+            order['payer'] = self._payer(order_id)
+        return 200, order
+
+    def approve(self, order_id):
+        with self._lock:
+            order = self.orders.get(order_id)
+            if order is not None and order['status'] == 'CREATED':
+                order['status'] = 'APPROVED'
+        if order is None:
+            return 404, {'name': 'RESOURCE_NOT_FOUND', 'message': f'Order {order_id} does not exist'}
+        return 200, {'id': order_id, 'status': order['status']}
+
+    def capture(self, order_id, base_url):
+        with self._lock:
+            order = self.orders.get(order_id)
+            if order is None:
+                return 404, {'name': 'RESOURCE_NOT_FOUND', 'message': f'Order {order_id} does not exist'}
+            if order['status'] == 'COMPLETED':
+                return 422, {'name': 'UNPROCESSABLE_ENTITY', 'details': [{'issue': 'ORDER_ALREADY_CAPTURED'}]}
+            if order['status'] != 'APPROVED':
+                return 422, {'name': 'UNPROCESSABLE_ENTITY', 'details': [{'issue': 'ORDER_NOT_APPROVED'}]}
+            order['status'] = 'COMPLETED'
+            unit = order['purchase_units'][0]
+        capture_id = _new_id()
+        capture = {
+            'id': capture_id,
+            'status': 'COMPLETED',
+            'amount': {'currency_code': unit['amount'].get('currency_code', 'USD'), 'value': unit['amount']['value']},
+            'final_capture': True,
+            'create_time': _now(),
+            'update_time': _now(),
+            'links': [
+                {'href': f'{base_url}/v2/payments/captures/{capture_id}', 'rel': 'self', 'method': 'GET'},
+                {'href': f'{base_url}/v2/checkout/orders/{order_id}', 'rel': 'up', 'method': 'GET'},
+            ],
+        }
+        return 201, {
+            'id': order_id,
+            'status': 'COMPLETED',
+            'purchase_units': [{'reference_id': unit.get('reference_id', 'default'), 'payments': {'captures': [capture]}}],
+            'payer': self._payer(order_id),
+            'links': [{'href': f'{base_url}/v2/checkout/orders/{order_id}', 'rel': 'self', 'method': 'GET'}],
+        }
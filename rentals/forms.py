@@ -494,6 +494,7 @@ class EquipmentFilterForm(forms.Form):
     ]
     
     SORT_CHOICES = [
+        ('relevance', 'Best Match'),
         ('newest', 'Newest First'),
         ('oldest', 'Oldest First'),
         ('price_low', 'Price: Low to High'),
@@ -559,3 +560,8 @@ class EquipmentFilterForm(forms.Form):
         super().__init__(*args, **kwargs)
         from .models import EquipmentCategory
         self.fields['category'].queryset = EquipmentCategory.objects.filter(is_active=True)
+        
+        # Searches are ranked by relevance unless another order is picked
+        if self.is_bound and not self.data.get('sort_by'):
+            self.data = self.data.copy()
+            self.data['sort_by'] = 'relevance' if self.data.get('search', '').strip() else 'newest'
@@ -0,0 +1,114 @@
+"""
+Geohash encoding and cell covers
+Rationale: A geohash is a string whose prefixes name ever smaller lat/long cells, so
+a plain B-tree index on it answers "rows inside these cells" with a few range seeks
+on any database, without a spatial extension
+
+Cells are covered as prefix ranges [prefix, successor(prefix)), which sort the same
+way in every collation since the alphabet is lowercase ASCII letters and digits.
+"""
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+STORED_PRECISION = 9  # ~5m cells
+MAX_PRECISION = 12
+
+_DECODE = {char: index for index, char in enumerate(BASE32)}
+
+
+def encode(latitude, longitude, precision=STORED_PRECISION):
+    """Geohash of a point, or None when either coordinate is missing or out of range"""
+    if latitude is None or longitude is None:
+        return None
+    latitude, longitude = float(latitude), float(longitude)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of a cell at precision"""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def _cell_span(low, high, origin, size):
+    first = math.floor((low - origin) / size)
+    last = math.floor((high - origin) / size)
+    return first, last
+
+
+def covering_cells(south, west, north, east, max_cells=24):
+    """
+    Sorted geohash prefixes whose cells together cover the box, at the finest
+    precision needing no more than max_cells cells. The box must not cross the
+    antimeridian (split it first)
+    """
+    south, north = max(south, -90.0), min(north, 90.0)
+    west, east = max(west, -180.0), min(east, 180.0)
+    chosen = None
+    for precision in range(1, MAX_PRECISION + 1):
+        height, width = cell_size(precision)
+        rows = _cell_span(south, north, -90.0, height)
+        columns = _cell_span(west, east, -180.0, width)
+        if (rows[1] - rows[0] + 1) * (columns[1] - columns[0] + 1) > max_cells:
+            break
+        chosen = (precision, height, width, rows, columns)
+    if chosen is None:
+        return list(BASE32)
+    precision, height, width, rows, columns = chosen
+    cells = set()
+    for row in range(rows[0], rows[1] + 1):
+        latitude = min(-90.0 + (row + 0.5) * height, 90.0)
+        for column in range(columns[0], columns[1] + 1):
+            longitude = min(-180.0 + (column + 0.5) * width, 180.0)
+            cells.add(encode(latitude, longitude, precision))
+    return sorted(cells)
+
+
+def successor(prefix):
+    """Smallest string greater than every geohash starting with prefix, or None"""
+    chars = list(prefix)
+    while chars:
+        index = _DECODE[chars[-1]]
+        if index + 1 < len(BASE32):
+            chars[-1] = BASE32[index + 1]
+            return ''.join(chars)
+        chars.pop()
+    return None
+
+
+def prefix_ranges(prefixes):
+    """[(low, high), ...] half-open ranges covering prefixes, adjacent cells merged"""
+    ranges = []
+    for prefix in sorted(prefixes):
+        upper = successor(prefix)
+        if ranges:
+            last_upper = ranges[-1][1]
+            if last_upper is None:
+                break
+            if prefix <= last_upper:
+                # Adjacent to or inside the previous range
+                if upper is None or upper > last_upper:
+                    ranges[-1][1] = upper
+                continue
+        ranges.append([prefix, upper])
+    return [tuple(bounds) for bounds in ranges]
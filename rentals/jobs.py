@@ -0,0 +1,164 @@
+"""
+Durable database-backed job queue
+Rationale: Work that waits on a third party (PayPal captures) should not hold a
+request open or be lost when a worker restarts, so it is stored as a Job row and
+run by `manage.py run_jobs`
+
+Handlers are listed in JOB_HANDLERS as dotted paths to functions taking the Job.
+A handler that raises is retried with exponential backoff and full jitter until
+max_attempts runs out; PermanentJobError fails the job straight away.
+
+Workers claim due jobs with SELECT ... FOR UPDATE SKIP LOCKED where the database
+supports it, so several workers never block on or double-claim the same rows; the
+claim itself is a conditional UPDATE, which keeps other backends correct too.
+A claim expires after JOB_LOCK_SECONDS, so jobs of a crashed worker are picked
+up again. Jobs are claimed in batches but run one after another, so each claim is
+renewed just before its job starts; a job whose claim was taken over while it
+waited behind slower ones is skipped rather than run twice.
+"""
+import logging
+import os
+import random
+import socket
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {
+    'paypal.capture': 'rentals.paypal_service.capture_payment_job',
+    'paypal.webhook': 'rentals.paypal_webhooks.process_webhook_job',
+}
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = 'queued', 'running', 'succeeded', 'failed'
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying cannot help"""
+
+
+def enqueue(kind, payload=None, key=None, delay=0, max_attempts=None):
+    """
+    Store a job to run after delay seconds; returns the Job
+    With key, a job already stored under that key is returned instead of a new one
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'Unknown job kind {kind!r}')
+    fields = {
+        'kind': kind,
+        'payload': payload or {},
+        'run_after': timezone.now() + timedelta(seconds=delay),
+        'max_attempts': max_attempts or settings.JOB_MAX_ATTEMPTS,
+    }
+    if key is None:
+        return Job.objects.create(**fields)
+    try:
+        with transaction.atomic(using=router.db_for_write(Job)):
+            return Job.objects.create(key=key, **fields)
+    except IntegrityError:
+        return Job.objects.get(key=key)
+
+
+def retry_delay(attempt):
+    """Seconds before the retry following attempt number attempt"""
+    ceiling = min(settings.JOB_RETRY_MAX_SECONDS, settings.JOB_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def claimable(now=None):
+    now = now or timezone.now()
+    return Q(status=QUEUED, run_after__lte=now) | Q(status=RUNNING, locked_until__lt=now)
+
+
+def claim_jobs(worker, limit=10):
+    """Claim up to limit due jobs for worker; each claim counts as an attempt"""
+    now = timezone.now()
+    using = router.db_for_write(Job)
+    with transaction.atomic(using=using):
+        candidates = Job.objects.using(using).filter(claimable(now)).order_by('run_after')
+        if connections[using].features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        ids = list(candidates.values_list('pk', flat=True)[:limit])
+        if not ids:
+            return []
+        Job.objects.using(using).filter(claimable(now), pk__in=ids).update(
+            status=RUNNING,
+            locked_by=worker,
+            locked_until=now + timedelta(seconds=settings.JOB_LOCK_SECONDS),
+            attempts=F('attempts') + 1,
+        )
+    return list(Job.objects.using(using).filter(pk__in=ids, status=RUNNING, locked_by=worker).order_by('run_after'))
+
+
+def renew_claim(job):
+    """Extend worker's claim on job by JOB_LOCK_SECONDS; False if the claim was lost"""
+    locked_until = timezone.now() + timedelta(seconds=settings.JOB_LOCK_SECONDS)
+    renewed = Job.objects.filter(pk=job.pk, status=RUNNING, locked_by=job.locked_by).update(locked_until=locked_until)
+    if renewed:
+        job.locked_until = locked_until
+    return bool(renewed)
+
+
+def _finish(job, **fields):
+    # Conditional on our claim, in case it expired and another worker took the job over
+    return Job.objects.filter(pk=job.pk, status=RUNNING, locked_by=job.locked_by).update(**fields)
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome; returns the job's new status"""
+    now = timezone.now()
+    try:
+        handler = import_string(JOB_HANDLERS[job.kind])
+    except (KeyError, ImportError):
+        _finish(job, status=FAILED, last_error=f'No handler for {job.kind!r}', finished_at=now)
+        return FAILED
+
+    try:
+        handler(job)
+    except Exception as error:
+        message = f'{type(error).__name__}: {error}'
+        if isinstance(error, PermanentJobError) or job.is_last_attempt:
+            logger.error('Job %s (%s) failed after %d attempt(s): %s', job.pk, job.kind, job.attempts, message)
+            _finish(job, status=FAILED, last_error=message, locked_until=None, finished_at=timezone.now())
+            return FAILED
+        logger.warning('Job %s (%s) attempt %d failed: %s', job.pk, job.kind, job.attempts, message)
+        _finish(
+            job, status=QUEUED, last_error=message, locked_by='', locked_until=None,
+            run_after=timezone.now() + timedelta(seconds=retry_delay(job.attempts)),
+        )
+        return QUEUED
+
+    _finish(job, status=SUCCEEDED, locked_until=None, finished_at=timezone.now())
+    return SUCCEEDED
+
+
+def run_due_jobs(worker=None, limit=10):
+    """Claim and run one batch of due jobs; returns how many ran"""
+    worker = worker or worker_name()
+    ran = 0
+    for job in claim_jobs(worker, limit):
+        # The batch shares one claim time, so later jobs may have waited out their lock
+        if not renew_claim(job):
+            logger.warning('Job %s (%s) was taken over by another worker before it started', job.pk, job.kind)
+            continue
+        run_job(job)
+        ran += 1
+    return ran
+
+
+def prune_jobs(days=None):
+    """Delete succeeded jobs finished more than days ago; failed ones are kept for inspection"""
+    days = settings.JOB_RETENTION_DAYS if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = Job.objects.filter(status=SUCCEEDED, finished_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,138 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import RequestFactory, override_settings
+from rentals.fake_paypal import FakePayPalServer
+from rentals.models import CustomUser, Equipment, EquipmentCategory, Rental
+from rentals.paypal_service import capture_payment, get_http_session, initiate_payment
+
+# Rentals booked back to back on each temporary equipment, so none overlap
+RENTALS_PER_EQUIPMENT = 100
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Drive concurrent PayPal checkouts (initiate_payment + capture_payment) against a local PayPal stand-in'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkouts', type=int, default=1000, help='Number of checkouts')
+        parser.add_argument('--concurrency', type=int, default=50, help='Checkouts in flight at once')
+        parser.add_argument('--base-url', help='Use an already running `manage.py fake_paypal` instead of an in-process one')
+        parser.add_argument('--latency', type=float, default=0.05, help='In-process stand-in: seconds added to every response')
+        parser.add_argument('--jitter', type=float, default=0.05, help='In-process stand-in: up to this many more random seconds')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='In-process stand-in: fraction of requests answered with a 503')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark users, equipment, rentals and payments')
+
+    def handle(self, *args, **options):
+        if options['base_url'] and 'paypal.com' in options['base_url']:
+            raise CommandError('Refusing to benchmark against PayPal itself; run `manage.py fake_paypal` instead')
+
+        fake = None
+        base_url = options['base_url']
+        if not base_url:
+            fake = FakePayPalServer(
+                latency=options['latency'], jitter=options['jitter'], error_rate=options['error_rate'],
+            ).start()
+            base_url = fake.url
+
+        try:
+            owner, renter, category, rentals = self.create_rentals(options['checkouts'])
+            try:
+                self.run_checkouts(rentals, base_url, options['concurrency'], fake)
+            finally:
+                if not options['keep']:
+                    # Rentals, payments and equipment go with the users
+                    CustomUser.objects.filter(pk__in=[owner.pk, renter.pk]).delete()
+                    category.delete()
+        finally:
+            if fake is not None:
+                fake.stop()
+
+    def run_checkouts(self, rentals, base_url, concurrency, fake=None):
+        request = RequestFactory(SERVER_NAME='localhost').get('/', secure=True)
+        timings = {'initiate': [], 'capture': [], 'checkout': []}
+        failures = Counter()
+
+        def checkout(rental):
+            try:
+                started = time.perf_counter()
+                result = initiate_payment(rental, request)
+                initiated = time.perf_counter()
+                if not result['success']:
+                    return 'initiate', result['error'], None
+                # The buyer's visit to PayPal, needed when the stand-in runs with --manual-approval
+                get_http_session().get(result['approval_url'], timeout=5)
+                capturing = time.perf_counter()
+                result = capture_payment(result['order_id'], result['payment_id'])
+                finished = time.perf_counter()
+                if not result['success']:
+                    return 'capture', result['error'], None
+                return None, None, (initiated - started, finished - capturing, initiated - started + finished - capturing)
+            finally:
+                # Worker threads each hold their own connection
+                connections.close_all()
+
+        self.stdout.write(f'Running {len(rentals)} checkouts, {concurrency} at a time, against {base_url}...')
+        # A pool as large as the concurrency, so every worker keeps its connection alive
+        with override_settings(PAYPAL_BASE_URL=base_url, PAYPAL_POOL_SIZE=concurrency):
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for stage, error, timing in executor.map(checkout, rentals):
+                    if stage:
+                        failures[f'{stage}: {error[:120]}'] += 1
+                    else:
+                        for name, seconds in zip(('initiate', 'capture', 'checkout'), timing):
+                            timings[name].append(seconds)
+            elapsed = time.perf_counter() - started
+
+        completed = len(timings['checkout'])
+        confirmed = Rental.objects.filter(pk__in=[rental.pk for rental in rentals], status='confirmed').count()
+        self.stdout.write(f'Completed {completed}, failed {sum(failures.values())}, confirmed {confirmed} in {elapsed:.2f}s')
+        for name, values in timings.items():
+            self.stdout.write(
+                f'{name:>9}: p50 {percentile(values, 0.5) * 1000:.0f}ms, '
+                f'p95 {percentile(values, 0.95) * 1000:.0f}ms, p99 {percentile(values, 0.99) * 1000:.0f}ms'
+            )
+        for failure, count in failures.most_common(5):
+            self.stdout.write(self.style.WARNING(f'{count:>6} x {failure}'))
+        if fake is not None:
+            self.stdout.write('PayPal calls: ' + ', '.join(f'{count} {name}' for name, count in sorted(fake.stats.items())))
+        rate = completed / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f'{rate:,.0f} checkouts/sec'))
+
+    def create_rentals(self, count):
+        suffix = f'{time.time_ns():x}'
+        owner = CustomUser.objects.create(username=f'benchmark-owner-{suffix}', email=f'benchmark-owner-{suffix}@example.com')
+        renter = CustomUser.objects.create(username=f'benchmark-renter-{suffix}', email=f'benchmark-renter-{suffix}@example.com')
+        category = EquipmentCategory.objects.create(name=f'benchmark-{suffix}')
+        equipment = Equipment.objects.bulk_create([
+            Equipment(
+                owner=owner, category=category, title=f'Benchmark console {i}', description='Checkout benchmark',
+                brand='Benchmark', model='1', condition='good', daily_rate=Decimal('10.00'),
+                location_city='Benchmark', location_state='BM', status='active',
+            )
+            for i in range((count + RENTALS_PER_EQUIPMENT - 1) // RENTALS_PER_EQUIPMENT)
+        ])
+        first_day = date.today() + timedelta(days=30)
+        rentals = Rental.objects.bulk_create([
+            Rental(
+                equipment=equipment[i // RENTALS_PER_EQUIPMENT], renter=renter, owner=owner,
+                start_date=first_day + timedelta(days=3 * (i % RENTALS_PER_EQUIPMENT)),
+                end_date=first_day + timedelta(days=3 * (i % RENTALS_PER_EQUIPMENT) + 1),
+                daily_rate=Decimal('10.00'), total_days=2, subtotal=Decimal('20.00'),
+                security_deposit=Decimal('0.00'), total_amount=Decimal('20.00'), status='approved',
+            )
+            for i in range(count)
+        ])
+        # Each rental keeps its equipment instance, so create_order's rental.equipment costs no query
+        return owner, renter, category, rentals
@@ -0,0 +1,54 @@
+import random
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rentals.models import Sensor, SensorReading
+from rentals.sensor_service import ingest_readings
+
+
+class Command(BaseCommand):
+    help = 'Measure bulk sensor ingestion throughput against the configured database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readings', type=int, default=100000, help='Number of readings to ingest')
+        parser.add_argument('--sensors', type=int, default=200, help='Number of temporary sensors')
+        parser.add_argument('--batch-size', type=int, default=None, help='Override SENSOR_INGEST_BATCH_SIZE')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark sensors and readings')
+
+    def handle(self, *args, **options):
+        sensor_types = ['temperature', 'humidity', 'battery', 'usage']
+        sensors = Sensor.objects.bulk_create([
+            Sensor(name=f'benchmark-{i}', sensor_type=sensor_types[i % len(sensor_types)])
+            for i in range(options['sensors'])
+        ])
+        sensor_ids = [str(sensor.pk) for sensor in sensors]
+
+        start_time = timezone.now() - timedelta(minutes=options['readings'])
+        records = [
+            {
+                'sensor': sensor_ids[i % len(sensor_ids)],
+                'value': f'{random.uniform(0, 100):.2f}',
+                'timestamp': (start_time + timedelta(seconds=i)).isoformat(),
+                'quality_score': '0.95',
+            }
+            for i in range(options['readings'])
+        ]
+
+        self.stdout.write(f"Ingesting {len(records)} readings for {len(sensor_ids)} sensors...")
+        started = time.perf_counter()
+        summary = ingest_readings(records, batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+
+        rate = summary['accepted'] / elapsed if elapsed else 0
+        self.stdout.write(
+            f"Accepted {summary['accepted']}, rejected {summary['rejected']}, "
+            f"alerts {summary['alerts']} in {elapsed:.2f}s"
+        )
+        self.stdout.write(self.style.SUCCESS(f'{rate:,.0f} readings/sec'))
+
+        if not options['keep']:
+            benchmark_sensors = Sensor.objects.filter(pk__in=sensor_ids)
+            benchmark_sensors.update(latest_reading=None)
+            SensorReading.objects.filter(sensor_id__in=sensor_ids).delete()
+            benchmark_sensors.delete()
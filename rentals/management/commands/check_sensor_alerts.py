@@ -0,0 +1,16 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rentals.sensor_alerts import notify_stale_sensors
+
+
+class Command(BaseCommand):
+    help = 'Notify equipment owners about sensors that stopped reporting (run every SENSOR_STALE_CHECK_MINUTES)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=settings.SENSOR_STALE_CHECK_MINUTES, help='Minutes since the previous run')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Checking for silent sensors...')
+        messages = notify_stale_sensors(window=timedelta(minutes=options['window']))
+        self.stdout.write(self.style.SUCCESS(f'Sent {len(messages)} offline notification(s)'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from rentals.fake_paypal import FakePayPalServer
+
+
+class Command(BaseCommand):
+    help = 'Serve a local PayPal API stand-in; point PAYPAL_BASE_URL at it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+        parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Up to this many more random seconds per response')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with a 503')
+        parser.add_argument('--token-ttl', type=int, default=32400, help='OAuth token lifetime in seconds')
+        parser.add_argument('--manual-approval', action='store_true',
+                            help='Require a visit to the approve link before an order can be captured')
+        parser.add_argument('--verbose', action='store_true', help='Log every request')
+
+    def handle(self, *args, **options):
+        server = FakePayPalServer(
+            host=options['host'], port=options['port'], latency=options['latency'],
+            jitter=options['jitter'], error_rate=options['error_rate'], token_ttl=options['token_ttl'],
+            auto_approve=not options['manual_approval'], verbose=options['verbose'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Fake PayPal API on http://{options['host']}:{options['port']} (Ctrl+C to stop)"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        for name, count in sorted(server.stats.items()):
+            self.stdout.write(f'{count:>8}  {name}')
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rentals.sensor_retention import run_retention
+
+
+class Command(BaseCommand):
+    help = 'Roll up sensor readings into hourly/daily rollups and prune expired raw readings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--raw-days', type=int, default=settings.SENSOR_RAW_RETENTION_DAYS, help='Days of raw readings to keep')
+        parser.add_argument('--hourly-days', type=int, default=settings.SENSOR_HOURLY_ROLLUP_RETENTION_DAYS, help='Days of hourly rollups to keep')
+        parser.add_argument('--batch-size', type=int, default=settings.SENSOR_PRUNE_BATCH_SIZE, help='Rows deleted per batch')
+        parser.add_argument('--max-batches', type=int, help='Stop pruning after this many batches per table')
+        parser.add_argument('--skip-rollup', action='store_true', help='Only prune hours that are already rolled up')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Applying sensor reading retention...')
+        summary = run_retention(
+            raw_days=options['raw_days'],
+            hourly_days=options['hourly_days'],
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+            rollup=not options['skip_rollup'],
+        )
+        self.stdout.write(
+            f"Wrote {summary['hourly_rollups']} hourly and {summary['daily_rollups']} daily rollup(s)"
+        )
+        for name in summary['partitions_dropped']:
+            self.stdout.write(f'Dropped partition {name}')
+        self.stdout.write(self.style.SUCCESS(
+            f"Pruned {summary['readings_pruned']} raw reading(s) and "
+            f"{summary['hourly_rollups_pruned']} hourly rollup(s)"
+        ))
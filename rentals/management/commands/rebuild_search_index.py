@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from rentals.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Reinstall the SQLite full-text index for equipment search and reindex every listing'
+
+    def handle(self, *args, **options):
+        if rebuild_search_index():
+            self.stdout.write(self.style.SUCCESS('Equipment search index rebuilt'))
+        else:
+            self.stdout.write('Nothing to rebuild: the PostgreSQL search column is maintained by the database')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from rentals.sensor_service import rebuild_sensor_counters
+
+
+class Command(BaseCommand):
+    help = 'Rebuild denormalized reading counters and latest-reading pointers on Sensor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sensor', action='append', dest='sensors', help='Only rebuild this sensor id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Sensors updated per statement')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding sensor reading counters...')
+        updated = rebuild_sensor_counters(sensor_ids=options['sensors'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters for {updated} sensor(s)'))
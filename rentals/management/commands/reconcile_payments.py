@@ -0,0 +1,63 @@
+import sys
+from datetime import datetime, time, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rentals.reconciliation import iter_csv_export, iter_transaction_search, reconcile_payments
+
+# PayPal's Transaction Search data lags behind by up to three hours
+SEARCH_LAG = timedelta(hours=3)
+
+
+def _day(value):
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return timezone.make_aware(datetime.combine(parsed, time.min))
+
+
+class Command(BaseCommand):
+    help = 'Match PayPal payments against PayPal transaction reports and write a discrepancy CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to reconcile (YYYY-MM-DD); default 7 days ago')
+        parser.add_argument('--end', help='Day after the last one to reconcile (YYYY-MM-DD); default now')
+        parser.add_argument('--csv', help='Reconcile a CSV activity export instead of calling Transaction Search')
+        parser.add_argument('--output', default='-', help='Discrepancy report path; "-" writes to stdout')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Report records matched per query')
+
+    def handle(self, *args, **options):
+        try:
+            start = _day(options['start']) if options['start'] else None
+            end = _day(options['end']) if options['end'] else None
+        except ValueError as e:
+            raise CommandError(f'Invalid date: {e}')
+
+        if options['csv']:
+            source = open(options['csv'], newline='', encoding='utf-8-sig')
+            records = iter_csv_export(source)
+            if start is None or end is None:
+                self.stderr.write('Without --start and --end, payments missing from the export are not reported')
+        else:
+            source = None
+            end = end or timezone.now() - SEARCH_LAG
+            start = start or end - timedelta(days=7)
+            records = iter_transaction_search(start, end)
+
+        output = sys.stdout if options['output'] == '-' else open(options['output'], 'w', newline='')
+        try:
+            summary = reconcile_payments(records, output, start=start, end=end, batch_size=options['batch_size'])
+        finally:
+            if source is not None:
+                source.close()
+            if output is not sys.stdout:
+                output.close()
+
+        problems = sum(count for kind, count in summary.items() if kind not in ('transactions', 'matched'))
+        details = ', '.join(f'{count} {kind}' for kind, count in sorted(summary.items())
+                            if kind not in ('transactions', 'matched'))
+        message = f"Matched {summary['matched']} of {summary['transactions']} PayPal transaction(s)"
+        if problems:
+            self.stderr.write(self.style.WARNING(f'{message}; {problems} discrepanc(ies): {details}'))
+        else:
+            self.stderr.write(self.style.SUCCESS(f'{message}; no discrepancies'))
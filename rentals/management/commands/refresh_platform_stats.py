@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from rentals.analytics import refresh_daily_stats, snapshot_watermark
+
+
+class Command(BaseCommand):
+    help = 'Refresh the DailyPlatformStats snapshot used by the admin dashboards'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Rebuild every day from scratch instead of only days changed since the last run',
+        )
+
+    def handle(self, *args, **options):
+        watermark = snapshot_watermark()
+        if options['full'] or watermark is None:
+            self.stdout.write('Rebuilding platform stats snapshot...')
+        else:
+            self.stdout.write(f'Refreshing platform stats changed since {watermark:%Y-%m-%d %H:%M:%S}...')
+
+        days = refresh_daily_stats(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Updated {days} day(s) of platform stats'))
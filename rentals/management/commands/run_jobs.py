@@ -0,0 +1,50 @@
+import signal
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from rentals.jobs import prune_jobs, run_due_jobs, worker_name
+
+# Seconds between prunes of old succeeded jobs
+PRUNE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (PayPal captures, ...) until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run the jobs due now and exit')
+        parser.add_argument('--batch-size', type=int, default=10, help='Jobs claimed per batch')
+        parser.add_argument('--sleep', type=float, default=settings.JOB_POLL_SECONDS, help='Seconds to wait when no job is due')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        worker = worker_name()
+
+        if options['once']:
+            total = 0
+            while True:
+                ran = run_due_jobs(worker, options['batch_size'])
+                total += ran
+                if not ran or self.stopping:
+                    break
+            self.stdout.write(self.style.SUCCESS(f'Ran {total} job(s)'))
+            return
+
+        self.stdout.write(f'Worker {worker} waiting for jobs')
+        last_prune = 0
+        while not self.stopping:
+            close_old_connections()
+            ran = run_due_jobs(worker, options['batch_size'])
+            if time.monotonic() - last_prune > PRUNE_INTERVAL:
+                prune_jobs()
+                last_prune = time.monotonic()
+            if not ran:
+                time.sleep(options['sleep'])
+        self.stdout.write('Worker stopped')
+
+    def stop(self, signum, frame):
+        # Finish the current batch, then exit
+        self.stopping = True
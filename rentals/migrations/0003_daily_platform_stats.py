@@ -0,0 +1,52 @@
+# Generated by Django 5.1.7 on 2026-10-17 17:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('rentals', '0002_sensor_payment_payment_method_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyPlatformStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('new_users', models.PositiveIntegerField(default=0)),
+                ('new_equipment', models.PositiveIntegerField(default=0)),
+                ('new_rentals', models.PositiveIntegerField(default=0)),
+                ('equipment_by_status', models.JSONField(blank=True, default=dict)),
+                ('rentals_by_status', models.JSONField(blank=True, default=dict)),
+                ('completed_revenue', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('refreshed_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily Platform Stats',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['date_joined'], name='rentals_cus_date_jo_1fface_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['created_at'], name='rentals_equ_created_e9e85b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['updated_at'], name='rentals_equ_updated_0a7352_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['created_at'], name='rentals_ren_created_e28652_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['updated_at'], name='rentals_ren_updated_d7c9e6_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-17 17:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0003_daily_platform_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sensor',
+            index=models.Index(fields=['last_reading'], name='rentals_sen_last_re_f27720_idx'),
+        ),
+    ]
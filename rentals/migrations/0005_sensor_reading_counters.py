@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-17 17:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0004_sensor_last_reading_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensor',
+            name='latest_reading',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='rentals.sensorreading'),
+        ),
+        migrations.AddField(
+            model_name='sensor',
+            name='reading_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
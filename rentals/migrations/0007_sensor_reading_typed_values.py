@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-17 17:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0006_sensor_reading_device_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensorreading',
+            name='numeric_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sensorreading',
+            name='payload',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
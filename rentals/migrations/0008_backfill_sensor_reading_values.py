@@ -0,0 +1,57 @@
+from django.db import migrations
+
+BATCH_SIZE = 2000
+
+
+def parse_reading_value(value):
+    # Frozen copy of rentals.models.parse_reading_value
+    if value is None:
+        return None, None
+    text = str(value).strip()
+    try:
+        number = float(text)
+    except ValueError:
+        parts = [part.strip() for part in text.split(',')]
+        if len(parts) == 2:
+            try:
+                return None, {'lat': float(parts[0]), 'lng': float(parts[1])}
+            except ValueError:
+                pass
+        return None, None
+    if number != number or number in (float('inf'), float('-inf')):
+        return None, None
+    return number, None
+
+
+def backfill_typed_values(apps, schema_editor):
+    SensorReading = apps.get_model('rentals', 'SensorReading')
+    pending = SensorReading.objects.filter(
+        numeric_value__isnull=True, payload__isnull=True
+    ).order_by('pk')
+
+    last_pk = None
+    while True:
+        chunk = pending if last_pk is None else pending.filter(pk__gt=last_pk)
+        readings = list(chunk.only('pk', 'value')[:BATCH_SIZE])
+        if not readings:
+            break
+        changed = []
+        for reading in readings:
+            reading.numeric_value, reading.payload = parse_reading_value(reading.value)
+            if reading.numeric_value is not None or reading.payload is not None:
+                changed.append(reading)
+        SensorReading.objects.bulk_update(changed, ['numeric_value', 'payload'])
+        last_pk = readings[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('rentals', '0007_sensor_reading_typed_values'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_typed_values, migrations.RunPython.noop),
+    ]
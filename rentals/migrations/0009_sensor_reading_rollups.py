@@ -0,0 +1,41 @@
+# Generated by Django 5.1.7 on 2026-10-17 17:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0008_backfill_sensor_reading_values'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sensor',
+            name='latest_reading',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='rentals.sensorreading'),
+        ),
+        migrations.CreateModel(
+            name='SensorReadingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=10)),
+                ('bucket_start', models.DateTimeField()),
+                ('reading_count', models.PositiveIntegerField(default=0)),
+                ('numeric_count', models.PositiveIntegerField(default=0)),
+                ('min_value', models.FloatField(blank=True, null=True)),
+                ('max_value', models.FloatField(blank=True, null=True)),
+                ('sum_value', models.FloatField(blank=True, null=True)),
+                ('avg_value', models.FloatField(blank=True, null=True)),
+                ('alert_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='rentals.sensor')),
+            ],
+            options={
+                'ordering': ['sensor', 'resolution', 'bucket_start'],
+                'indexes': [models.Index(fields=['resolution', 'bucket_start'], name='rentals_sen_resolut_36eedf_idx')],
+                'constraints': [models.UniqueConstraint(fields=('sensor', 'resolution', 'bucket_start'), name='unique_sensor_rollup_bucket')],
+            },
+        ),
+    ]
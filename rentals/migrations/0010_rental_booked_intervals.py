@@ -0,0 +1,79 @@
+# Generated by Django 5.1.7 on 2026-10-17 17:45
+
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.operations
+import rentals.constraints
+from django.db import migrations, models
+
+BLOCKING_STATUSES = ['approved', 'payment_pending', 'confirmed', 'active']
+# Conflicting rental ids listed in the error; the rest are only counted
+MAX_LISTED_CONFLICTS = 50
+
+NO_DOUBLE_BOOKING = rentals.constraints.PostgresExclusionConstraint(condition=models.Q(('status__in', BLOCKING_STATUSES)), expressions=[('equipment', '='), (models.Func('start_date', 'end_date', django.contrib.postgres.fields.ranges.RangeBoundary(), function='DATERANGE', output_field=django.contrib.postgres.fields.ranges.DateRangeField()), '&&')], name='rental_no_double_booking')
+
+
+def check_no_double_bookings(apps, schema_editor):
+    """
+    Refuse to add rental_no_double_booking over existing overlaps (PostgreSQL only)
+    The constraint cannot be created while any exist, and only people can decide
+    which booking wins, so the conflicting rentals are listed instead
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Rental = apps.get_model('rentals', 'Rental')
+    overlapping = Rental.objects.using(schema_editor.connection.alias).filter(
+        equipment=models.OuterRef('equipment'), status__in=BLOCKING_STATUSES,
+        start_date__lt=models.OuterRef('end_date'), end_date__gt=models.OuterRef('start_date'),
+    ).exclude(pk=models.OuterRef('pk'))
+    conflicts = list(
+        Rental.objects.using(schema_editor.connection.alias)
+        .filter(models.Exists(overlapping), status__in=BLOCKING_STATUSES)
+        .order_by('equipment', 'start_date').values_list('pk', 'equipment', 'start_date', 'end_date')
+    )
+    if not conflicts:
+        return
+    listed = '\n'.join(
+        f'  rental {pk}: equipment {equipment}, {start} to {end}'
+        for pk, equipment, start, end in conflicts[:MAX_LISTED_CONFLICTS]
+    )
+    more = len(conflicts) - MAX_LISTED_CONFLICTS
+    raise RuntimeError(
+        f'{len(conflicts)} approved/payment_pending/confirmed/active rentals overlap another booking of '
+        f'the same equipment, so rental_no_double_booking cannot be added. Cancel or move them, then '
+        f'migrate again:\n{listed}' + (f'\n  ... and {more} more' if more > 0 else '')
+    )
+
+
+def add_exclusion_constraint(apps, schema_editor):
+    # Other backends have no exclusion constraints; skipping here also spares SQLite a table rebuild
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.add_constraint(apps.get_model('rentals', 'Rental'), NO_DOUBLE_BOOKING)
+
+
+def drop_exclusion_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.remove_constraint(apps.get_model('rentals', 'Rental'), NO_DOUBLE_BOOKING)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0009_sensor_reading_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(condition=models.Q(('status__in', ['approved', 'payment_pending', 'confirmed', 'active'])), fields=['equipment', 'start_date', 'end_date'], name='rental_booked_interval_idx'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                django.contrib.postgres.operations.BtreeGistExtension(),
+                migrations.RunPython(check_no_double_bookings, migrations.RunPython.noop),
+                migrations.RunPython(add_exclusion_constraint, drop_exclusion_constraint),
+            ],
+            state_operations=[
+                migrations.AddConstraint(model_name='rental', constraint=NO_DOUBLE_BOOKING),
+            ],
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.1.7 on 2026-10-17 17:48
+
+from django.db import migrations, models
+
+FTS_COLUMNS = 'title, brand, model, description'
+FTS_NEW = 'new.title, new.brand, new.model, new.description'
+FTS_OLD = 'old.title, old.brand, old.model, old.description'
+
+
+def add_full_text_index(apps, schema_editor):
+    """tsvector + GIN on PostgreSQL, an FTS5 table with sync triggers on SQLite"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "ALTER TABLE rentals_equipment ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(brand, '') || ' ' || coalesce(model, '')), 'B') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'C')) STORED"
+        )
+        schema_editor.execute(
+            'CREATE INDEX rentals_equipment_search_idx ON rentals_equipment USING GIN (search_vector)'
+        )
+    elif vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE rentals_equipment_fts USING fts5({FTS_COLUMNS}, "
+                f"content='rentals_equipment', content_rowid='rowid', tokenize='porter unicode61')"
+            )
+        except Exception:
+            # SQLite built without FTS5; search falls back to icontains
+            return
+        schema_editor.execute(
+            f"CREATE TRIGGER rentals_equipment_fts_ai AFTER INSERT ON rentals_equipment BEGIN "
+            f"INSERT INTO rentals_equipment_fts(rowid, {FTS_COLUMNS}) VALUES (new.rowid, {FTS_NEW}); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER rentals_equipment_fts_ad AFTER DELETE ON rentals_equipment BEGIN "
+            f"INSERT INTO rentals_equipment_fts(rentals_equipment_fts, rowid, {FTS_COLUMNS}) "
+            f"VALUES ('delete', old.rowid, {FTS_OLD}); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER rentals_equipment_fts_au AFTER UPDATE OF {FTS_COLUMNS} ON rentals_equipment BEGIN "
+            f"INSERT INTO rentals_equipment_fts(rentals_equipment_fts, rowid, {FTS_COLUMNS}) "
+            f"VALUES ('delete', old.rowid, {FTS_OLD}); "
+            f"INSERT INTO rentals_equipment_fts(rowid, {FTS_COLUMNS}) VALUES (new.rowid, {FTS_NEW}); END"
+        )
+        schema_editor.execute("INSERT INTO rentals_equipment_fts(rentals_equipment_fts) VALUES ('rebuild')")
+
+
+def drop_full_text_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE rentals_equipment DROP COLUMN IF EXISTS search_vector')
+    elif vendor == 'sqlite':
+        for trigger in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS rentals_equipment_fts_{trigger}')
+        schema_editor.execute('DROP TABLE IF EXISTS rentals_equipment_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0010_rental_booked_intervals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='rentals_equ_status_34a44f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['status', 'daily_rate', 'id'], name='rentals_equ_status_6ccf3c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['status', 'average_rating', 'id'], name='rentals_equ_status_093236_idx'),
+        ),
+        migrations.RunPython(add_full_text_index, drop_full_text_index),
+    ]
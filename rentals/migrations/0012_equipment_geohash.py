@@ -0,0 +1,48 @@
+# Generated by Django 5.1.7 on 2026-10-17 18:10
+
+from django.db import migrations, models
+
+# Standard geohash encoding; it has no model dependencies, so it is safe to import
+from rentals.geohash import encode
+
+BATCH_SIZE = 2000
+
+
+def backfill_geohash(apps, schema_editor):
+    Equipment = apps.get_model('rentals', 'Equipment')
+    located = Equipment.objects.filter(
+        location_latitude__isnull=False, location_longitude__isnull=False
+    ).order_by('pk')
+
+    last_pk = None
+    while True:
+        chunk = located if last_pk is None else located.filter(pk__gt=last_pk)
+        rows = list(chunk.only('pk', 'location_latitude', 'location_longitude')[:BATCH_SIZE])
+        if not rows:
+            break
+        for row in rows:
+            row.location_geohash = encode(row.location_latitude, row.location_longitude)
+        Equipment.objects.bulk_update(rows, ['location_geohash'])
+        last_pk = rows[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('rentals', '0011_equipment_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipment',
+            name='location_geohash',
+            field=models.CharField(blank=True, editable=False, max_length=12, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['status', 'location_geohash'], name='rentals_equ_status_84e5b4_idx'),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
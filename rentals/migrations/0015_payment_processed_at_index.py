@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-17 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0014_paypal_webhook_event'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['processed_at'], name='rentals_pay_process_a361e0_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0015_payment_processed_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyplatformstats',
+            name='stale',
+            field=models.BooleanField(default=False),
+        ),
+    ]
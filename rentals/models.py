@@ -1,10 +1,14 @@
 from django.db import models
+from django.contrib.postgres.fields import DateRangeField, RangeBoundary, RangeOperators
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from django.conf import settings
+from datetime import timedelta
 from decimal import Decimal
 import uuid
+from .constraints import PostgresExclusionConstraint
+from .geohash import encode as geohash_encode
 
 class CustomUser(AbstractUser):
     """
@@ -26,6 +30,11 @@ class CustomUser(AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
     
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['date_joined']),
+        ]
+    
     def __str__(self):
         return f"{self.email} ({self.role})"
     
@@ -155,6 +164,8 @@ class Equipment(models.Model):
     location_state = models.CharField(max_length=100)
     location_latitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
     location_longitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    # Derived from the coordinates on save; indexed for proximity search (see rentals/nearby.py)
+    location_geohash = models.CharField(max_length=12, blank=True, null=True, editable=False)
     
     # Status and Metrics
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
@@ -175,9 +186,26 @@ class Equipment(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['updated_at']),
+            # Catalog sort orders (see rentals/search.py)
+            models.Index(fields=['status', 'created_at', 'id']),
+            models.Index(fields=['status', 'daily_rate', 'id']),
+            models.Index(fields=['status', 'average_rating', 'id']),
+            # Proximity search (see rentals/nearby.py)
+            models.Index(fields=['status', 'location_geohash']),
+        ]
     
     def __str__(self):
         return f"{self.title} by {self.owner.username}"
+    
+    def save(self, *args, **kwargs):
+        self.location_geohash = geohash_encode(self.location_latitude, self.location_longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'location_latitude', 'location_longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'location_geohash'}
+        super().save(*args, **kwargs)
 
 class EquipmentImage(models.Model):
     """
@@ -212,6 +240,9 @@ class Rental(models.Model):
         ('cancelled', 'Cancelled'),
         ('disputed', 'Disputed')
     ]
+    # Statuses that hold the equipment for [start_date, end_date); keep in sync
+    # with rental_booked_interval_idx and rental_no_double_booking below
+    BLOCKING_STATUSES = ('approved', 'payment_pending', 'confirmed', 'active')
     
     # Basic Information
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -254,6 +285,30 @@ class Rental(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['updated_at']),
+            # Booked intervals per equipment, for availability overlap queries
+            models.Index(
+                fields=['equipment', 'start_date', 'end_date'],
+                condition=models.Q(status__in=['approved', 'payment_pending', 'confirmed', 'active']),
+                name='rental_booked_interval_idx',
+            ),
+        ]
+        constraints = [
+            # No two blocking rentals of the same equipment overlap (PostgreSQL only)
+            PostgresExclusionConstraint(
+                name='rental_no_double_booking',
+                expressions=[
+                    ('equipment', RangeOperators.EQUAL),
+                    (models.Func(
+                        'start_date', 'end_date', RangeBoundary(),
+                        function='DATERANGE', output_field=DateRangeField(),
+                    ), RangeOperators.OVERLAPS),
+                ],
+                condition=models.Q(status__in=['approved', 'payment_pending', 'confirmed', 'active']),
+            ),
+        ]
     
     def __str__(self):
         return f"Rental of {self.equipment.title} by {self.renter.username}"
@@ -312,9 +367,47 @@ class Payment(models.Model):
     processed_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # PayPal redirects and webhooks identify payments by these ids
+            models.Index(fields=['paypal_order_id']),
+            models.Index(fields=['paypal_capture_id']),
+            # Reconciliation scans payments by when they were processed
+            models.Index(fields=['processed_at']),
+        ]
+    
     def __str__(self):
         return f"{self.payment_type} - ${self.amount} - {self.status}"
 
+class PayPalWebhookEvent(models.Model):
+    """
+    PayPal webhook event, stored once per PayPal event id (see rentals/paypal_webhooks.py)
+    Rationale: PayPal redelivers events until acknowledged; the unique event_id
+    turns each redelivery into a no-op
+    """
+    STATUS_CHOICES = [
+        ('received', 'Received'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    ]
+    
+    event_id = models.CharField(max_length=100, unique=True)
+    event_type = models.CharField(max_length=100)
+    resource_id = models.CharField(max_length=100, blank=True, db_index=True)  # Order, capture or refund id
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='received')
+    error = models.TextField(blank=True)
+    
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['-received_at']
+    
+    def __str__(self):
+        return f"{self.event_type} {self.event_id} ({self.status})"
+
 class Review(models.Model):
     """
     Bidirectional review system
@@ -397,6 +490,44 @@ class Wishlist(models.Model):
     def __str__(self):
         return f"{self.user.username}'s wishlist - {self.equipment.title}"
 
+class SensorQuerySet(models.QuerySet):
+    """
+    Connectivity classification computed in the database from last_reading
+    Rationale: Sensor listings must not load every row into Python to compare timestamps
+    """
+    def _cutoffs(self, now=None):
+        now = now or timezone.now()
+        return now - Sensor.ONLINE_WINDOW, now - Sensor.STALE_WINDOW
+    
+    def with_connectivity(self, now=None):
+        """Annotate each sensor with connectivity: 'online', 'stale' or 'offline'"""
+        online_cutoff, stale_cutoff = self._cutoffs(now)
+        return self.annotate(connectivity=models.Case(
+            models.When(last_reading__gte=online_cutoff, then=models.Value('online')),
+            models.When(last_reading__gte=stale_cutoff, then=models.Value('stale')),
+            default=models.Value('offline'),
+            output_field=models.CharField(),
+        ))
+    
+    def connectivity_q(self, state, now=None):
+        """Q selecting sensors in the given connectivity state"""
+        online_cutoff, stale_cutoff = self._cutoffs(now)
+        if state == 'online':
+            return models.Q(last_reading__gte=online_cutoff)
+        if state == 'stale':
+            return models.Q(last_reading__lt=online_cutoff, last_reading__gte=stale_cutoff)
+        if state == 'offline':
+            return models.Q(last_reading__isnull=True) | models.Q(last_reading__lt=stale_cutoff)
+        if state == 'not_online':
+            return models.Q(last_reading__isnull=True) | models.Q(last_reading__lt=online_cutoff)
+        raise ValueError(f"Unknown connectivity state '{state}'")
+    
+    def online(self, now=None):
+        return self.filter(self.connectivity_q('online', now))
+    
+    def offline(self, now=None):
+        return self.filter(self.connectivity_q('offline', now))
+
 class Sensor(models.Model):
     """
     Database sensor model for equipment tracking
@@ -419,6 +550,16 @@ class Sensor(models.Model):
         ('error', 'Error'),
     ]
     
+    CONNECTIVITY_CHOICES = [
+        ('online', 'Online'),
+        ('stale', 'Stale'),
+        ('offline', 'Offline'),
+    ]
+    
+    # A sensor is online with a reading in the last hour, stale up to a day, then offline
+    ONLINE_WINDOW = timedelta(hours=1)
+    STALE_WINDOW = timedelta(hours=24)
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=100)
     sensor_type = models.CharField(max_length=20, choices=SENSOR_TYPES)
@@ -429,6 +570,15 @@ class Sensor(models.Model):
     last_reading = models.DateTimeField(blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     
+    # Denormalized reading stats, maintained on ingestion (see sensor_service)
+    reading_count = models.PositiveIntegerField(default=0)
+    # No DB constraint so raw readings can be pruned with plain batched DELETEs;
+    # the retention job clears pointers to readings it removes
+    latest_reading = models.ForeignKey(
+        'SensorReading', on_delete=models.DO_NOTHING, db_constraint=False,
+        related_name='+', blank=True, null=True
+    )
+    
     # Location data (if applicable)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
@@ -448,22 +598,64 @@ class Sensor(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = SensorQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['last_reading']),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.get_sensor_type_display()})"
     
     def get_latest_reading(self):
         """Get the most recent sensor reading"""
+        if self.latest_reading_id:
+            try:
+                return self.latest_reading
+            except SensorReading.DoesNotExist:
+                pass
         return SensorReading.objects.filter(sensor=self).order_by('-timestamp').first()
     
+    def get_connectivity(self):
+        """Connectivity state; uses the queryset annotation when present"""
+        if hasattr(self, 'connectivity'):
+            return self.connectivity
+        if not self.last_reading:
+            return 'offline'
+        age = timezone.now() - self.last_reading
+        if age < self.ONLINE_WINDOW:
+            return 'online'
+        if age < self.STALE_WINDOW:
+            return 'stale'
+        return 'offline'
+    
     def is_online(self):
         """Check if sensor is online (has recent readings)"""
-        if not self.last_reading:
-            return False
-        from django.utils import timezone
-        return (timezone.now() - self.last_reading).total_seconds() < 3600  # 1 hour
+        return self.get_connectivity() == 'online'
+
+def parse_reading_value(value):
+    """
+    Split a raw reading string into (numeric_value, payload)
+    Plain numbers become numeric_value; "lat,lng" pairs become a coordinate payload
+    """
+    if value is None:
+        return None, None
+    text = str(value).strip()
+    try:
+        number = float(text)
+    except ValueError:
+        parts = [part.strip() for part in text.split(',')]
+        if len(parts) == 2:
+            try:
+                return None, {'lat': float(parts[0]), 'lng': float(parts[1])}
+            except ValueError:
+                pass
+        return None, None
+    if number != number or number in (float('inf'), float('-inf')):
+        return None, None
+    return number, None
 
 class SensorReading(models.Model):
     """
@@ -477,6 +669,10 @@ class SensorReading(models.Model):
     value = models.CharField(max_length=255)  # Store as string, can be parsed based on sensor type
     unit = models.CharField(max_length=20, blank=True)  # e.g., 'C', 'F', 'm', 'km/h'
     
+    # Typed storage so AVG/MIN/MAX and threshold checks run in SQL
+    numeric_value = models.FloatField(blank=True, null=True)
+    payload = models.JSONField(blank=True, null=True)  # Structured values, e.g. {"lat": .., "lng": ..}
+    
     # Location (if applicable)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
@@ -486,7 +682,7 @@ class SensorReading(models.Model):
     quality_score = models.DecimalField(max_digits=3, decimal_places=2, blank=True, null=True)  # 0-1
     is_alert = models.BooleanField(default=False)  # If reading triggered an alert
     
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # Device time when supplied on ingestion
     
     class Meta:
         ordering = ['-timestamp']
@@ -497,3 +693,141 @@ class SensorReading(models.Model):
     
     def __str__(self):
         return f"{self.sensor.name} - {self.value} {self.unit} at {self.timestamp}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_value = instance.__dict__.get('value')
+        return instance
+    
+    def save(self, *args, **kwargs):
+        """
+        Re-derive numeric_value and payload whenever value is written with a new string
+        New readings keep typed fields the caller precomputed (see sensor_service.build_reading)
+        """
+        update_fields = kwargs.get('update_fields')
+        if self._state.adding:
+            reparse = self.numeric_value is None and self.payload is None
+        else:
+            reparse = (
+                'value' in self.__dict__
+                and (update_fields is None or 'value' in update_fields)
+                and self.value != getattr(self, '_saved_value', None)
+            )
+        if reparse:
+            self.numeric_value, self.payload = parse_reading_value(self.value)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'numeric_value', 'payload'}
+        super().save(*args, **kwargs)
+        self._saved_value = self.__dict__.get('value')
+
+class DailyPlatformStats(models.Model):
+    """
+    Per-day platform KPI snapshot, bucketed by the day each row was created
+    Rationale: Admin dashboards sum a few hundred snapshot rows instead of counting
+    every user, listing and rental on each page view
+    """
+    date = models.DateField(unique=True)
+    
+    new_users = models.PositiveIntegerField(default=0)
+    new_equipment = models.PositiveIntegerField(default=0)
+    new_rentals = models.PositiveIntegerField(default=0)
+    
+    # Current status of the rows created on this day, e.g. {"active": 3, "pending": 1}
+    equipment_by_status = models.JSONField(default=dict, blank=True)
+    rentals_by_status = models.JSONField(default=dict, blank=True)
+    completed_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    
+    refreshed_at = models.DateTimeField(db_index=True)
+    # Set when a row created on this day is deleted; deletions leave no updated_at
+    # behind, so the next refresh recomputes flagged days explicitly
+    stale = models.BooleanField(default=False)
+    
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = "Daily Platform Stats"
+    
+    def __str__(self):
+        return f"Platform stats for {self.date}"
+
+class SensorReadingRollup(models.Model):
+    """
+    Downsampled sensor readings (hourly and daily min/max/avg/count)
+    Rationale: Long-range charts and history survive after raw readings are pruned
+    """
+    RESOLUTION_CHOICES = [
+        ('hour', 'Hourly'),
+        ('day', 'Daily'),
+    ]
+    
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='rollups')
+    resolution = models.CharField(max_length=10, choices=RESOLUTION_CHOICES)
+    bucket_start = models.DateTimeField()
+    
+    reading_count = models.PositiveIntegerField(default=0)
+    numeric_count = models.PositiveIntegerField(default=0)  # Readings with a numeric_value
+    min_value = models.FloatField(blank=True, null=True)
+    max_value = models.FloatField(blank=True, null=True)
+    sum_value = models.FloatField(blank=True, null=True)
+    avg_value = models.FloatField(blank=True, null=True)
+    alert_count = models.PositiveIntegerField(default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['sensor', 'resolution', 'bucket_start']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['sensor', 'resolution', 'bucket_start'], name='unique_sensor_rollup_bucket'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['resolution', 'bucket_start']),
+        ]
+    
+    def __str__(self):
+        return f"{self.sensor_id} {self.resolution} rollup at {self.bucket_start}"
+
+class Job(models.Model):
+    """
+    Durable background job, run by `manage.py run_jobs` (see rentals/jobs.py)
+    Rationale: Slow third-party calls such as PayPal captures leave the request
+    cycle, survive restarts and are retried with backoff
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    # Optional deduplication key, e.g. "paypal-capture:<payment id>"; enqueued at most once
+    key = models.CharField(max_length=255, blank=True, null=True, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField()
+    # Claimed by locked_by until locked_until; a job still running after that is reclaimed
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['run_after']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+            models.Index(fields=['status', 'locked_until']),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} job {self.pk} ({self.status})"
+    
+    @property
+    def is_last_attempt(self):
+        return self.attempts >= self.max_attempts
@@ -0,0 +1,118 @@
+"""
+"Near me" equipment search
+Rationale: Equipment.location_geohash turns a radius query into a handful of index
+range seeks; a latitude/longitude bounding box trims the cell corners and only the
+survivors pay for the exact haversine distance, so it needs no PostGIS and stays
+cheap as listings grow
+
+A listing matches when it lies within the requested radius, or when it offers
+delivery and its delivery_radius_km reaches the renter. Delivery radii are capped
+at NEARBY_MAX_DELIVERY_RADIUS_KM, which bounds the area the delivery prefilter scans.
+"""
+import math
+from django.conf import settings
+from django.db.models import BooleanField, ExpressionWrapper, F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cast, Cos, Least, Power, Radians, Sin, Sqrt
+from .geohash import covering_cells, prefix_ranges
+from .models import Equipment
+from .pagination import keyset_page
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+NEARBY_ORDERING = ['distance_km', 'id']
+
+
+def validate_point(latitude, longitude):
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('latitude must be within [-90, 90] and longitude within [-180, 180]')
+
+
+def bounding_boxes(latitude, longitude, radius_km):
+    """(south, west, north, east) boxes covering the circle, split at the antimeridian"""
+    lat_delta = radius_km / KM_PER_DEGREE
+    south, north = latitude - lat_delta, latitude + lat_delta
+    if south <= -90 or north >= 90:
+        # The circle reaches a pole, so every longitude is in range
+        return [(max(south, -90.0), -180.0, min(north, 90.0), 180.0)]
+    lng_delta = lat_delta / math.cos(math.radians(max(abs(south), abs(north))))
+    if lng_delta >= 180:
+        return [(south, -180.0, north, 180.0)]
+    west, east = longitude - lng_delta, longitude + lng_delta
+    if west < -180:
+        return [(south, west + 360, north, 180.0), (south, -180.0, north, east)]
+    if east > 180:
+        return [(south, west, north, 180.0), (south, -180.0, north, east - 360)]
+    return [(south, west, north, east)]
+
+
+def area_q(latitude, longitude, radius_km, status=None):
+    """
+    Index-friendly prefilter: geohash cell ranges, then the coordinate bounding box
+    A status is repeated inside every range so each one is a single seek on the
+    (status, location_geohash) index
+    """
+    equal = {'status': status} if status is not None else {}
+    condition = Q()
+    for south, west, north, east in bounding_boxes(latitude, longitude, radius_km):
+        cells = Q()
+        for low, high in prefix_ranges(covering_cells(south, west, north, east)):
+            cell = Q(location_geohash__gte=low, **equal)
+            if high is not None:
+                cell &= Q(location_geohash__lt=high)
+            cells |= cell
+        condition |= cells & Q(
+            location_latitude__gte=south, location_latitude__lte=north,
+            location_longitude__gte=west, location_longitude__lte=east,
+        )
+    return condition
+
+
+def haversine_km(latitude, longitude):
+    """Great-circle distance in km from (latitude, longitude) to each listing"""
+    lat1 = math.radians(latitude)
+    lat2 = Radians(Cast('location_latitude', FloatField()))
+    lng2 = Radians(Cast('location_longitude', FloatField()))
+    a = (
+        Power(Sin((lat2 - Value(lat1)) / 2), 2) +
+        Value(math.cos(lat1)) * Cos(lat2) * Power(Sin((lng2 - Value(math.radians(longitude))) / 2), 2)
+    )
+    return ExpressionWrapper(
+        Value(2 * EARTH_RADIUS_KM) * ASin(Sqrt(Least(a, Value(1.0)))), output_field=FloatField()
+    )
+
+
+def nearby_equipment(latitude, longitude, radius_km, queryset=None, status='active',
+                     include_delivery=True):
+    """
+    Listings from queryset (default: all) with the given status (None for any)
+    within radius_km of the point, or delivering to it
+    Annotates distance_km and delivers (whether the listing's delivery covers the point)
+    """
+    latitude, longitude = float(latitude), float(longitude)
+    validate_point(latitude, longitude)
+    if queryset is None:
+        queryset = Equipment.objects.all()
+
+    candidates = area_q(latitude, longitude, radius_km, status)
+    delivers = Q(is_available_for_delivery=True, delivery_radius_km__gte=F('distance_km'))
+    reach = getattr(settings, 'NEARBY_MAX_DELIVERY_RADIUS_KM', 100)
+    if include_delivery and reach > radius_km:
+        candidates |= Q(is_available_for_delivery=True, delivery_radius_km__gt=radius_km) & area_q(
+            latitude, longitude, reach, status
+        )
+        matches = Q(distance_km__lte=radius_km) | (delivers & Q(distance_km__lte=reach))
+    else:
+        matches = Q(distance_km__lte=radius_km)
+
+    return queryset.filter(candidates).annotate(
+        distance_km=haversine_km(latitude, longitude),
+    ).filter(matches).annotate(
+        delivers=ExpressionWrapper(delivers, output_field=BooleanField()),
+    )
+
+
+def nearby_page(latitude, longitude, radius_km, cursor=None, per_page=24, queryset=None):
+    """One keyset page of nearby listings, closest first"""
+    queryset = nearby_equipment(latitude, longitude, radius_km, queryset).select_related('category')
+    return keyset_page(queryset, NEARBY_ORDERING, cursor=cursor, per_page=per_page)
@@ -1,17 +1,182 @@
 import os
 import json
+import hashlib
+import random
+import threading
+import time
+import uuid
 import requests
+from requests.adapters import HTTPAdapter
 from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db import transaction
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from decimal import Decimal
+from .jobs import PermanentJobError, enqueue
 from .models import Payment, Rental
 
+# Never send a token this close to its expiry
+TOKEN_EXPIRY_LEEWAY_SECONDS = 30
+# How long one worker may hold the refresh lock, and how long others wait on it
+TOKEN_LOCK_SECONDS = 30
+TOKEN_LOCK_WAIT_SECONDS = 5
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+RETRY_BACKOFF_SECONDS = 0.25
+RETRY_BACKOFF_MAX_SECONDS = 4
+
+
+
+class PayPalError(Exception):
+    """A PayPal API call was answered with an error; status_code is the HTTP status"""
+    
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+    
+    @property
+    def retryable(self):
+        """False for errors repeating the call cannot fix (validation errors, declined instruments, ...)"""
+        return self.status_code is None or self.status_code in RETRY_STATUSES or self.status_code in (401, 408)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Per-process requests.Session shared by every PayPalService
+    Rationale: A bare requests.post opens a new TCP+TLS connection per call; the
+    pooled session keeps up to PAYPAL_POOL_SIZE connections to PayPal alive.
+    Created on first use, so each gunicorn worker gets its own after forking
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=settings.PAYPAL_POOL_SIZE, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def retry_delay(attempt, response=None):
+    """Seconds before retry number attempt: Retry-After if given, else exponential backoff with full jitter"""
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), RETRY_BACKOFF_MAX_SECONDS)
+        except ValueError:
+            pass
+    return random.uniform(0, min(RETRY_BACKOFF_MAX_SECONDS, RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)))
+
+
+class PayPalTokenStore:
+    """
+    Process-wide and cross-worker store of PayPal OAuth access tokens
+    Rationale: Fetching a token before every API call doubles the PayPal round
+    trips of a checkout; a token is valid for hours (expires_in), so it is kept in
+    memory and in the shared cache until shortly before it expires
+
+    Once fewer than PAYPAL_TOKEN_REFRESH_SECONDS remain, the one worker that wins a
+    cache lock fetches a replacement while everyone else keeps using the current
+    token, so an expiring token does not send every worker to PayPal at once
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = {}
+
+    def _current(self, key):
+        local = self._tokens.get(key)
+        shared = cache.get(key)
+        if local and shared:
+            return max(local, shared, key=lambda entry: entry[1])
+        return local or shared
+
+    def get(self, service, stale_token=None):
+        """A valid access token for service; stale_token (e.g. rejected with a 401) is never returned"""
+        key = service.token_cache_key
+        entry = self._current(key)
+        if self._fresh(entry, stale_token):
+            return entry[0]
+
+        # Threads holding a usable token do not queue behind a refresh in this process
+        usable = self._usable(entry, stale_token)
+        if not self._lock.acquire(blocking=not usable):
+            return entry[0]
+        try:
+            entry = self._current(key)
+            if self._fresh(entry, stale_token):
+                return entry[0]
+            lock_key = f'{key}:lock'
+            if cache.add(lock_key, 1, TOKEN_LOCK_SECONDS):
+                try:
+                    return self._refresh(service, key)
+                finally:
+                    cache.delete(lock_key)
+            if self._usable(entry, stale_token):
+                return entry[0]
+            # Another worker is fetching the first or a replacement token
+            deadline = time.monotonic() + TOKEN_LOCK_WAIT_SECONDS
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                entry = cache.get(key)
+                if self._usable(entry, stale_token):
+                    self._tokens[key] = entry
+                    return entry[0]
+            return self._refresh(service, key)
+        finally:
+            self._lock.release()
+
+    def invalidate(self, service, token):
+        """Forget token if it is still the stored one"""
+        key = service.token_cache_key
+        with self._lock:
+            if self._tokens.get(key, (None,))[0] == token:
+                del self._tokens[key]
+            shared = cache.get(key)
+            if shared and shared[0] == token:
+                cache.delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+    def _refresh(self, service, key):
+        token, expires_in = service.fetch_access_token()
+        entry = (token, time.time() + expires_in)
+        self._tokens[key] = entry
+        cache.set(key, entry, max(expires_in - TOKEN_EXPIRY_LEEWAY_SECONDS, 1))
+        return token
+
+    @staticmethod
+    def _usable(entry, stale_token=None):
+        return bool(entry) and entry[0] != stale_token and \
+            entry[1] - TOKEN_EXPIRY_LEEWAY_SECONDS > time.time()
+
+    @staticmethod
+    def _fresh(entry, stale_token=None):
+        return bool(entry) and entry[0] != stale_token and \
+            entry[1] - settings.PAYPAL_TOKEN_REFRESH_SECONDS > time.time()
+
+
+token_store = PayPalTokenStore()
+
+
 class PayPalService:
     """
     PayPal integration service for payment processing
     """
     
-    def __init__(self):
+    def __init__(self, base_url=None, session=None):
         self.client_id = getattr(settings, 'PAYPAL_CLIENT_ID', '')
         self.client_secret = getattr(settings, 'PAYPAL_CLIENT_SECRET', '')
         self.mode = getattr(settings, 'PAYPAL_MODE', 'sandbox')  # sandbox or live
@@ -20,9 +185,25 @@ class PayPalService:
             self.base_url = 'https://api-m.sandbox.paypal.com'
         else:
             self.base_url = 'https://api-m.paypal.com'
+        base_url = base_url or getattr(settings, 'PAYPAL_BASE_URL', '')
+        if base_url:
+            self.base_url = base_url.rstrip('/')
+        
+        # Shared connection pool; connect/read timeouts so a slow PayPal cannot hold a worker indefinitely
+        self.session = session or get_http_session()
+        self.timeout = (settings.PAYPAL_CONNECT_TIMEOUT, settings.PAYPAL_READ_TIMEOUT)
+        self.max_retries = settings.PAYPAL_MAX_RETRIES
+        
+        # Tokens are per app credentials and API host
+        credentials = f"{self.base_url}:{self.client_id}:{self.client_secret}"
+        self.token_cache_key = f"paypal:access-token:{hashlib.sha256(credentials.encode()).hexdigest()[:32]}"
     
     def get_access_token(self):
-        """Get PayPal access token"""
+        """Get a PayPal access token, reusing the stored one while it is valid"""
+        return token_store.get(self)
+    
+    def fetch_access_token(self):
+        """Request a new access token from PayPal; returns (token, expires_in seconds)"""
         url = f"{self.base_url}/v1/oauth2/token"
         headers = {
             'Content-Type': 'application/x-www-form-urlencoded',
@@ -30,11 +211,12 @@ class PayPalService:
         }
         data = {'grant_type': 'client_credentials'}
         
-        response = requests.post(url, headers=headers, data=data)
+        response = self._send('POST', url, headers=headers, data=data)
         if response.status_code == 200:
-            return response.json()['access_token']
+            token_data = response.json()
+            return token_data['access_token'], int(token_data.get('expires_in', 0))
         else:
-            raise Exception(f"Failed to get access token: {response.text}")
+            raise PayPalError(f"Failed to get access token: {response.text}", response.status_code)
     
     def _get_basic_auth(self):
         """Get basic auth header for PayPal"""
@@ -42,14 +224,51 @@ class PayPalService:
         auth_string = f"{self.client_id}:{self.client_secret}"
         return base64.b64encode(auth_string.encode()).decode()
     
+    def _send(self, method, url, **kwargs):
+        """
+        Send a request through the pooled session
+        Only used for idempotent calls (reads, token requests, POSTs carrying a
+        PayPal-Request-Id), so connection errors, timeouts and RETRY_STATUSES
+        responses are retried up to max_retries times
+        """
+        response = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(retry_delay(attempt, response))
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                response = None
+                continue
+            if response.status_code not in RETRY_STATUSES:
+                break
+        return response
+    
+    def _api_request(self, method, url, headers=None, request_id=None, **kwargs):
+        """
+        Bearer-authorized API call; a 401 (expired or revoked token) is retried once with a new token
+        POSTs carry PayPal-Request-Id (request_id, or a new UUID reused by every
+        retry of this call) so PayPal carries out a retried POST only once
+        """
+        headers = dict(headers or {})
+        if method == 'POST':
+            headers['PayPal-Request-Id'] = request_id or str(uuid.uuid4())
+        access_token = self.get_access_token()
+        headers['Authorization'] = f'Bearer {access_token}'
+        response = self._send(method, url, headers=headers, **kwargs)
+        if response.status_code == 401:
+            token_store.invalidate(self, access_token)
+            headers['Authorization'] = f'Bearer {token_store.get(self, stale_token=access_token)}'
+            response = self._send(method, url, headers=headers, **kwargs)
+        return response
+    
     def create_order(self, rental, return_url, cancel_url):
         """Create a PayPal order"""
-        access_token = self.get_access_token()
-        
         url = f"{self.base_url}/v2/checkout/orders"
         headers = {
             'Content-Type': 'application/json',
-            'Authorization': f'Bearer {access_token}'
         }
         
         # Calculate amounts
@@ -100,42 +319,35 @@ class PayPalService:
             }
         }
         
-        response = requests.post(url, headers=headers, json=payload)
+        response = self._api_request('POST', url, headers=headers, json=payload)
         if response.status_code == 201:
             return response.json()
         else:
-            raise Exception(f"Failed to create order: {response.text}")
+            raise PayPalError(f"Failed to create order: {response.text}", response.status_code)
     
     def capture_order(self, order_id):
         """Capture a PayPal order"""
-        access_token = self.get_access_token()
-        
         url = f"{self.base_url}/v2/checkout/orders/{order_id}/capture"
         headers = {
             'Content-Type': 'application/json',
-            'Authorization': f'Bearer {access_token}'
         }
         
-        response = requests.post(url, headers=headers)
+        # Deterministic id: a repeated capture of the same order is answered from PayPal's record of the first
+        response = self._api_request('POST', url, headers=headers, request_id=f'capture-{order_id}')
         if response.status_code == 201:
             return response.json()
         else:
-            raise Exception(f"Failed to capture order: {response.text}")
+            raise PayPalError(f"Failed to capture order: {response.text}", response.status_code)
     
     def get_order_details(self, order_id):
         """Get PayPal order details"""
-        access_token = self.get_access_token()
-        
         url = f"{self.base_url}/v2/checkout/orders/{order_id}"
-        headers = {
-            'Authorization': f'Bearer {access_token}'
-        }
         
-        response = requests.get(url, headers=headers)
+        response = self._api_request('GET', url)
         if response.status_code == 200:
             return response.json()
         else:
-            raise Exception(f"Failed to get order details: {response.text}")
+            raise PayPalError(f"Failed to get order details: {response.text}", response.status_code)
     
     def create_payment_record(self, rental, paypal_order_id, payment_type='rental_payment'):
         """Create a payment record in the database"""
@@ -162,25 +374,78 @@ class PayPalService:
     def process_payment_capture(self, payment, capture_data):
         """Process payment capture and update payment record"""
         capture = capture_data['purchase_units'][0]['payments']['captures'][0]
+        return apply_capture(payment, capture)
+
+def apply_capture(payment, capture):
+    """
+    Record a PayPal capture (from the capture call or a PAYMENT.CAPTURE.* webhook) on payment
+    A COMPLETED capture completes the payment and confirms its rental, PENDING leaves
+    the payment processing until PayPal reports the outcome by webhook, DECLINED
+    and FAILED fail it. Completed and refunded payments are left as they are
+    """
+    with transaction.atomic():
+        # Locked so capture jobs and webhooks for the same payment apply one at a time
+        payment = Payment.objects.select_for_update().get(pk=payment.pk)
+        if payment.status in ('completed', 'refunded'):
+            return payment
         
-        payment.status = 'completed'
+        capture_status = capture.get('status', 'COMPLETED')
         payment.paypal_capture_id = capture['id']
         payment.paypal_payment_id = capture['id']
-        payment.processed_at = capture.get('create_time')
+        if capture_status == 'PENDING':
+            payment.status = 'processing'
+            payment.save()
+            return payment
+        if capture_status in ('DECLINED', 'FAILED'):
+            payment.status = 'failed'
+            payment.save()
+            return payment
+        
+        payment.status = 'completed'
+        payment.processed_at = parse_datetime(capture.get('create_time') or '') or timezone.now()
         payment.save()
         
         # Update rental status
-        rental = payment.rental
         if payment.payment_type == 'rental_payment':
-            rental.status = 'confirmed'
-            rental.confirmed_at = payment.processed_at
-            rental.save()
-        
-        return payment
+            rental = Rental.objects.select_for_update().get(pk=payment.rental_id)
+            if rental.status in ('pending', 'approved', 'payment_pending'):
+                rental.status = 'confirmed'
+                rental.confirmed_at = payment.processed_at
+                rental.save()
+    
+    return payment
+
+_service = None
+
+
+def get_paypal_service():
+    """Shared PayPalService, built from settings once per process"""
+    global _service
+    if _service is None:
+        _service = PayPalService()
+    return _service
+
+
+def _reset_paypal_service(setting, **kwargs):
+    global _service, _session
+    if setting.startswith('PAYPAL_'):
+        _service = _session = None
+        token_store.clear()
+
+
+setting_changed.connect(_reset_paypal_service)
+
+def approval_url(order_data):
+    """URL the buyer approves an order at, from its HATEOAS links"""
+    # Orders created with a payment_source call the link payer-action instead of approve
+    for link in order_data.get('links', []):
+        if link.get('rel') in ('approve', 'payer-action'):
+            return link['href']
+    raise PayPalError(f"No approval link for order {order_data.get('id')}")
 
 def initiate_payment(rental, request):
     """Initiate a PayPal payment for a rental"""
-    paypal_service = PayPalService()
+    paypal_service = get_paypal_service()
     
     # Create return and cancel URLs
     return_url = request.build_absolute_uri(
@@ -200,7 +465,7 @@ def initiate_payment(rental, request):
         return {
             'success': True,
             'order_id': order_data['id'],
-            'approval_url': order_data['links'][1]['href'],  # PayPal approval URL
+            'approval_url': approval_url(order_data),
             'payment_id': payment.id
         }
     
@@ -212,7 +477,7 @@ def initiate_payment(rental, request):
 
 def capture_payment(order_id, payment_id):
     """Capture a PayPal payment"""
-    paypal_service = PayPalService()
+    paypal_service = get_paypal_service()
     
     try:
         # Capture the order
@@ -233,4 +498,45 @@ def capture_payment(order_id, payment_id):
         return {
             'success': False,
             'error': str(e)
-        } 
\ No newline at end of file
+        }
+
+def enqueue_capture(payment):
+    """
+    Queue the capture of an approved PayPal order (see rentals/jobs.py)
+    Rationale: The capture call can take seconds and has to be retried when PayPal
+    is unavailable, so the return from PayPal answers at once with the payment in
+    'processing' and a run_jobs worker captures it
+    Repeated calls return the job queued by the first one
+    """
+    with transaction.atomic():
+        Payment.objects.filter(pk=payment.pk, status='pending').update(status='processing')
+        return enqueue(
+            'paypal.capture',
+            {'payment_id': str(payment.pk)},
+            key=f'paypal-capture:{payment.pk}',
+            max_attempts=settings.PAYPAL_CAPTURE_MAX_ATTEMPTS,
+        )
+
+def capture_payment_job(job):
+    """Job handler for 'paypal.capture': capture the order, complete the payment and confirm the rental"""
+    payment = Payment.objects.filter(pk=job.payload['payment_id']).first()
+    if payment is None:
+        raise PermanentJobError('Payment no longer exists')
+    if payment.status == 'completed':
+        # Captured already, e.g. by an earlier attempt or the PAYMENT.CAPTURE.COMPLETED webhook
+        return
+    if payment.status not in ('pending', 'processing'):
+        raise PermanentJobError(f'Payment is {payment.status}, not awaiting capture')
+
+    paypal_service = get_paypal_service()
+    try:
+        capture_data = paypal_service.capture_order(payment.paypal_order_id)
+    except Exception as e:
+        permanent = isinstance(e, PayPalError) and not e.retryable
+        if permanent or job.is_last_attempt:
+            Payment.objects.filter(pk=payment.pk, status__in=['pending', 'processing']).update(status='failed')
+        if permanent:
+            raise PermanentJobError(str(e)) from e
+        raise
+    
+    paypal_service.process_payment_capture(payment, capture_data)
@@ -0,0 +1,225 @@
+"""
+PayPal webhook ingestion
+Rationale: Payments only moved when the buyer came back to the success URL, so an
+abandoned tab left them pending forever; PayPal's webhooks report approvals,
+captures, refunds and denials on their own
+
+The endpoint (api_views.paypal_webhook) only verifies the signature, stores the
+event under its unique PayPal id and queues a 'paypal.webhook' job, so it answers
+in milliseconds and redeliveries are no-ops. The job applies the event to Payment
+and Rental under row locks (paypal_service.apply_capture and friends).
+
+Signatures are verified offline, as PayPal documents: an RSA-SHA256 signature over
+"<transmission id>|<transmission time>|<webhook id>|<CRC32 of the body>", checked
+against the certificate at PAYPAL-CERT-URL. Certificates are only fetched from
+paypal.com hosts and are cached in memory and in the shared cache until
+PAYPAL_CERT_CACHE_SECONDS pass or they expire.
+"""
+import base64
+import binascii
+import hashlib
+import threading
+import zlib
+from datetime import timedelta
+from decimal import Decimal
+from urllib.parse import urlsplit
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .jobs import enqueue
+from .models import Payment, PayPalWebhookEvent, Rental
+from .paypal_service import apply_capture, enqueue_capture, get_http_session
+
+CERT_HOST_SUFFIX = '.paypal.com'
+SUPPORTED_ALGORITHM = 'SHA256withRSA'
+
+_certificates = {}  # url -> (certificate, expires_at)
+_certificates_lock = threading.Lock()
+
+
+class WebhookVerificationError(Exception):
+    """A webhook delivery did not carry a valid PayPal signature"""
+
+
+def _certificate_url_allowed(url):
+    parts = urlsplit(url)
+    return parts.scheme == 'https' and (parts.hostname or '').endswith(CERT_HOST_SUFFIX)
+
+
+def get_certificate(url):
+    """PayPal signing certificate at url, from memory, the shared cache or PayPal"""
+    if not _certificate_url_allowed(url):
+        raise WebhookVerificationError(f'Certificate URL not on a PayPal host: {url}')
+
+    now = timezone.now()
+    cached = _certificates.get(url)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+
+    # Stored with its expiry, so a worker reading it from the cache does not restart the clock
+    key = f'paypal:certificate:{hashlib.sha256(url.encode()).hexdigest()}'
+    cached = cache.get(key)
+    if cached is None:
+        response = get_http_session().get(
+            url, timeout=(settings.PAYPAL_CONNECT_TIMEOUT, settings.PAYPAL_READ_TIMEOUT)
+        )
+        if response.status_code != 200:
+            raise WebhookVerificationError(f'Could not fetch certificate ({response.status_code})')
+        pem, expires_at = response.content, None
+    else:
+        pem, expires_at = cached
+    try:
+        certificate = x509.load_pem_x509_certificate(pem)
+    except ValueError:
+        raise WebhookVerificationError('Malformed certificate')
+    if not certificate.not_valid_before_utc <= now < certificate.not_valid_after_utc:
+        raise WebhookVerificationError('Certificate is not currently valid')
+
+    if expires_at is None:
+        expires_at = min(now + timedelta(seconds=settings.PAYPAL_CERT_CACHE_SECONDS), certificate.not_valid_after_utc)
+        cache.set(key, (pem, expires_at), max(int((expires_at - now).total_seconds()), 1))
+    with _certificates_lock:
+        _certificates[url] = (certificate, expires_at)
+    return certificate
+
+
+def verify_signature(headers, body):
+    """Raise WebhookVerificationError unless body carries a valid signature for PAYPAL_WEBHOOK_ID"""
+    webhook_id = settings.PAYPAL_WEBHOOK_ID
+    if not webhook_id:
+        raise WebhookVerificationError('PAYPAL_WEBHOOK_ID is not configured')
+    transmission_id = headers.get('Paypal-Transmission-Id', '')
+    transmission_time = headers.get('Paypal-Transmission-Time', '')
+    signature = headers.get('Paypal-Transmission-Sig', '')
+    cert_url = headers.get('Paypal-Cert-Url', '')
+    if not (transmission_id and transmission_time and signature and cert_url):
+        raise WebhookVerificationError('Missing signature headers')
+    if headers.get('Paypal-Auth-Algo', SUPPORTED_ALGORITHM) != SUPPORTED_ALGORITHM:
+        raise WebhookVerificationError('Unsupported signature algorithm')
+
+    message = f'{transmission_id}|{transmission_time}|{webhook_id}|{zlib.crc32(body) & 0xffffffff}'
+    try:
+        signature = base64.b64decode(signature, validate=True)
+    except (binascii.Error, ValueError):
+        raise WebhookVerificationError('Malformed signature')
+    try:
+        get_certificate(cert_url).public_key().verify(
+            signature, message.encode(), padding.PKCS1v15(), hashes.SHA256()
+        )
+    except InvalidSignature:
+        raise WebhookVerificationError('Signature mismatch')
+
+
+def record_event(event):
+    """
+    Store a verified event and queue its processing
+    Returns (PayPalWebhookEvent, created); created is False for a redelivery
+    """
+    event_type = event.get('event_type', '')
+    fields = {
+        'event_type': event_type,
+        'resource_id': str((event.get('resource') or {}).get('id', ''))[:100],
+        'payload': event,
+    }
+    if event_type not in EVENT_HANDLERS:
+        fields['status'] = 'ignored'
+    try:
+        with transaction.atomic():
+            webhook_event = PayPalWebhookEvent.objects.create(event_id=event['id'], **fields)
+            if event_type in EVENT_HANDLERS:
+                enqueue('paypal.webhook', {'event_id': webhook_event.pk}, key=f'paypal-webhook:{webhook_event.event_id}')
+    except IntegrityError:
+        return PayPalWebhookEvent.objects.get(event_id=event['id']), False
+    return webhook_event, True
+
+
+def _payment_for(order_id=None, capture_id=None):
+    if capture_id:
+        payment = Payment.objects.filter(paypal_capture_id=capture_id).first()
+        if payment is not None:
+            return payment
+    if order_id:
+        return Payment.objects.filter(paypal_order_id=order_id).first()
+    return None
+
+
+def _related_order_id(resource):
+    return (resource.get('supplementary_data') or {}).get('related_ids', {}).get('order_id')
+
+
+def _linked_capture_id(resource):
+    """Capture id from a refund's rel="up" link"""
+    for link in resource.get('links', []):
+        if link.get('rel') == 'up' and '/captures/' in link.get('href', ''):
+            return link['href'].rstrip('/').rsplit('/', 1)[-1]
+    return None
+
+
+def handle_order_approved(resource):
+    """CHECKOUT.ORDER.APPROVED: capture orders whose buyer never came back to the success URL"""
+    payment = _payment_for(order_id=resource.get('id'))
+    if payment is None:
+        return False
+    if payment.status == 'pending':
+        enqueue_capture(payment)
+    return True
+
+
+def handle_capture(resource):
+    """PAYMENT.CAPTURE.COMPLETED / DENIED"""
+    payment = _payment_for(order_id=_related_order_id(resource), capture_id=resource.get('id'))
+    if payment is None:
+        return False
+    apply_capture(payment, resource)
+    return True
+
+
+def handle_capture_refunded(resource):
+    """PAYMENT.CAPTURE.REFUNDED: a full refund refunds the payment and cancels a rental that has not started"""
+    payment = _payment_for(order_id=_related_order_id(resource), capture_id=_linked_capture_id(resource))
+    if payment is None:
+        return False
+    with transaction.atomic():
+        payment = Payment.objects.select_for_update().get(pk=payment.pk)
+        refunded = (resource.get('amount') or {}).get('value')
+        if payment.status != 'completed' or refunded is None or Decimal(refunded) < payment.amount:
+            return True
+        payment.status = 'refunded'
+        payment.save()
+        if payment.payment_type == 'rental_payment':
+            rental = Rental.objects.select_for_update().get(pk=payment.rental_id)
+            if rental.status in ('approved', 'payment_pending', 'confirmed'):
+                rental.status = 'cancelled'
+                rental.save()
+    return True
+
+
+EVENT_HANDLERS = {
+    'CHECKOUT.ORDER.APPROVED': handle_order_approved,
+    'PAYMENT.CAPTURE.COMPLETED': handle_capture,
+    'PAYMENT.CAPTURE.DENIED': handle_capture,
+    'PAYMENT.CAPTURE.REFUNDED': handle_capture_refunded,
+}
+
+
+def process_webhook_job(job):
+    """Job handler for 'paypal.webhook': apply a stored event"""
+    webhook_event = PayPalWebhookEvent.objects.get(pk=job.payload['event_id'])
+    if webhook_event.status != 'received':
+        return
+    try:
+        matched = EVENT_HANDLERS[webhook_event.event_type](webhook_event.payload.get('resource') or {})
+    except Exception as e:
+        if job.is_last_attempt:
+            PayPalWebhookEvent.objects.filter(pk=webhook_event.pk).update(status='failed', error=str(e))
+        raise
+    PayPalWebhookEvent.objects.filter(pk=webhook_event.pk).update(
+        status='processed' if matched else 'ignored',
+        error='' if matched else 'No matching payment',
+        processed_at=timezone.now(),
+    )
@@ -0,0 +1,256 @@
+"""
+Payment reconciliation against PayPal transaction reports
+Rationale: Checking payments one get_order_details call at a time takes days at
+volume; a report of every capture in a period is matched to Payment in bulk instead
+
+Report records (from the Transaction Search API or a CSV activity export) are
+streamed in batches of BATCH_SIZE: each batch loads its payments with one query
+on the indexed paypal_capture_id/paypal_order_id columns into an in-memory hash
+index and is matched against it. Matched payment ids go to a temporary table, so
+payments PayPal does not know about are found by one indexed anti-join over
+processed_at at the end. Memory stays bounded by the batch size however many
+payments a run covers.
+
+Discrepancy kinds:
+- missing_locally: PayPal captured money that no payment records
+- missing_in_paypal: a completed or refunded payment without a PayPal capture
+- amount_mismatch: captured and recorded amounts differ
+- status_mismatch: e.g. PayPal captured a payment still pending here
+- capture_id_mismatch: matched by order id, but a different capture id is recorded
+"""
+import csv
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from django.db import connections, router
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from .models import Payment
+
+BATCH_SIZE = 2000
+# Transaction Search limits
+SEARCH_MAX_DAYS = 31
+SEARCH_PAGE_SIZE = 500
+
+REPORT_COLUMNS = [
+    'kind', 'payment_id', 'paypal_order_id', 'paypal_capture_id',
+    'local_status', 'paypal_status', 'local_amount', 'paypal_amount', 'paypal_time',
+]
+
+# Transaction Search transaction_status codes
+SEARCH_STATUSES = {'S': 'completed', 'P': 'pending', 'V': 'reversed', 'D': 'denied', 'F': 'partially_refunded'}
+# CSV export Status column
+CSV_STATUSES = {
+    'completed': 'completed', 'pending': 'pending', 'refunded': 'reversed', 'reversed': 'reversed',
+    'denied': 'denied', 'partially refunded': 'partially_refunded',
+}
+# PayPal capture statuses consistent with each local payment status
+EXPECTED_STATUSES = {
+    'completed': {'completed', 'partially_refunded'},
+    # The refund is a separate transaction; the capture may still read completed
+    'refunded': {'reversed', 'completed', 'partially_refunded'},
+}
+# PayPal statuses meaning the money was captured
+CAPTURED_STATUSES = {'completed', 'partially_refunded', 'reversed'}
+
+SEEN_TABLE = 'reconcile_seen_payments'
+
+
+def _decimal(value):
+    try:
+        return Decimal(str(value).replace(',', '').strip())
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def search_windows(start, end):
+    """Split [start, end) into windows Transaction Search accepts"""
+    while start < end:
+        window_end = min(start + timedelta(days=SEARCH_MAX_DAYS), end)
+        yield start, window_end
+        start = window_end
+
+
+def iter_transaction_search(start, end, service=None):
+    """
+    Stream captures between start and end from PayPal's Transaction Search API
+    Only payment transactions (event codes T00xx) are yielded; refunds show on
+    their capture's status
+    """
+    from .paypal_service import PayPalError, get_paypal_service
+    service = service or get_paypal_service()
+    url = f'{service.base_url}/v1/reporting/transactions'
+    for window_start, window_end in search_windows(start, end):
+        page, total_pages = 1, 1
+        while page <= total_pages:
+            response = service._api_request('GET', url, params={
+                'start_date': window_start.isoformat(timespec='seconds'),
+                'end_date': window_end.isoformat(timespec='seconds'),
+                'fields': 'transaction_info',
+                'page_size': SEARCH_PAGE_SIZE,
+                'page': page,
+            })
+            if response.status_code != 200:
+                raise PayPalError(f'Failed to search transactions: {response.text}', response.status_code)
+            data = response.json()
+            total_pages = data.get('total_pages') or 1
+            for detail in data.get('transaction_details', []):
+                info = detail.get('transaction_info', {})
+                if not info.get('transaction_event_code', '').startswith('T00'):
+                    continue
+                yield {
+                    'transaction_id': info.get('transaction_id', ''),
+                    'order_id': info.get('paypal_reference_id') if info.get('paypal_reference_id_type') == 'ODR' else None,
+                    'status': SEARCH_STATUSES.get(info.get('transaction_status'), info.get('transaction_status')),
+                    'amount': _decimal((info.get('transaction_amount') or {}).get('value')),
+                    'time': parse_datetime(info.get('transaction_initiation_date') or ''),
+                }
+            page += 1
+
+
+def iter_csv_export(lines):
+    """
+    Stream captures from a CSV export: PayPal's activity download ("Transaction ID",
+    "Gross", "Status", optional "Order ID") or the same fields in snake_case
+    Rows with a negative gross (refunds, fees) are skipped
+    """
+    for row in csv.DictReader(lines):
+        row = {(key or '').strip().lower().replace(' ', '_'): (value or '').strip() for key, value in row.items()}
+        transaction_id = row.get('transaction_id')
+        amount = _decimal(row.get('amount') or row.get('gross'))
+        if not transaction_id or amount is None or amount < 0:
+            continue
+        status = row.get('status', '').lower()
+        yield {
+            'transaction_id': transaction_id,
+            'order_id': row.get('order_id') or None,
+            'status': CSV_STATUSES.get(status, status),
+            'amount': amount,
+            'time': parse_datetime(row.get('time', '')),
+        }
+
+
+class Reconciler:
+    """
+    Matches a stream of report records to payments, writing discrepancies to a csv.writer
+    Call reconcile(records), then find_missing(start, end) and close()
+    """
+
+    def __init__(self, writer, batch_size=BATCH_SIZE, using=None):
+        self.writer = writer
+        self.batch_size = batch_size
+        self.using = using or router.db_for_read(Payment)
+        self.connection = connections[self.using]
+        self.summary = Counter()
+        self._create_seen_table()
+
+    def _create_seen_table(self):
+        column = self.connection.data_types['UUIDField']
+        table = self.connection.ops.quote_name(SEEN_TABLE)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+            cursor.execute(f'CREATE TEMPORARY TABLE {table} (payment_id {column} PRIMARY KEY)')
+
+    def close(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.connection.ops.quote_name(SEEN_TABLE)}')
+
+    def report(self, kind, payment=None, record=None):
+        self.summary[kind] += 1
+        payment = payment or {}
+        record = record or {}
+        self.writer.writerow([
+            kind, payment.get('pk', ''), payment.get('paypal_order_id') or record.get('order_id') or '',
+            payment.get('paypal_capture_id') or record.get('transaction_id') or '',
+            payment.get('status', ''), record.get('status', ''), payment.get('amount', ''),
+            record.get('amount', ''), record['time'].isoformat() if record.get('time') else '',
+        ])
+
+    def reconcile(self, records):
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                self._match_batch(batch)
+                batch = []
+        if batch:
+            self._match_batch(batch)
+        return self.summary
+
+    def _match_batch(self, batch):
+        capture_ids = [record['transaction_id'] for record in batch]
+        order_ids = [record['order_id'] for record in batch if record['order_id']]
+        by_capture, by_order = {}, {}
+        payments = Payment.objects.using(self.using).filter(
+            Q(paypal_capture_id__in=capture_ids) | Q(paypal_order_id__in=order_ids)
+        ).values('pk', 'paypal_order_id', 'paypal_capture_id', 'status', 'amount')
+        for payment in payments:
+            if payment['paypal_capture_id']:
+                by_capture[payment['paypal_capture_id']] = payment
+            if payment['paypal_order_id']:
+                by_order[payment['paypal_order_id']] = payment
+
+        matched = []
+        for record in batch:
+            self.summary['transactions'] += 1
+            payment = by_capture.get(record['transaction_id']) or by_order.get(record['order_id'])
+            if payment is None:
+                self.report('missing_locally', record=record)
+                continue
+            matched.append(payment['pk'])
+            self.summary['matched'] += 1
+            if payment['paypal_capture_id'] != record['transaction_id']:
+                self.report('capture_id_mismatch', payment, record)
+            if record['amount'] is not None and record['amount'] != payment['amount']:
+                self.report('amount_mismatch', payment, record)
+            expected = EXPECTED_STATUSES.get(payment['status'])
+            if expected is None:
+                # Not completed here, which is only wrong if PayPal holds the money
+                mismatch = record['status'] in CAPTURED_STATUSES
+            else:
+                mismatch = record['status'] not in expected
+            if mismatch:
+                self.report('status_mismatch', payment, record)
+        self._mark_seen(matched)
+
+    def _mark_seen(self, pks):
+        if not pks:
+            return
+        field = Payment._meta.pk
+        table = self.connection.ops.quote_name(SEEN_TABLE)
+        values = [(field.get_db_prep_value(pk, self.connection),) for pk in set(pks)]
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {table} (payment_id) VALUES (%s) ON CONFLICT DO NOTHING', values)
+
+    def find_missing(self, start, end):
+        """Report completed/refunded PayPal payments processed in [start, end) that no record matched"""
+        quote = self.connection.ops.quote_name
+        payment_id = f'{quote(Payment._meta.db_table)}.{quote(Payment._meta.pk.column)}'
+        seen = quote(SEEN_TABLE)
+        missing = Payment.objects.using(self.using).filter(
+            payment_method='paypal', status__in=list(EXPECTED_STATUSES),
+            processed_at__gte=start, processed_at__lt=end,
+        ).extra(
+            where=[f'NOT EXISTS (SELECT 1 FROM {seen} WHERE {seen}.payment_id = {payment_id})'],
+        ).values('pk', 'paypal_order_id', 'paypal_capture_id', 'status', 'amount')
+        for payment in missing.iterator(chunk_size=self.batch_size):
+            self.report('missing_in_paypal', payment)
+        return self.summary['missing_in_paypal']
+
+
+def reconcile_payments(records, output, start=None, end=None, batch_size=BATCH_SIZE):
+    """
+    Match records against payments and write a discrepancy CSV to output (a text file)
+    With start and end, also report payments processed in [start, end) that the
+    records miss. Returns the summary Counter
+    """
+    writer = csv.writer(output)
+    writer.writerow(REPORT_COLUMNS)
+    reconciler = Reconciler(writer, batch_size=batch_size)
+    try:
+        reconciler.reconcile(records)
+        if start is not None and end is not None:
+            reconciler.find_missing(start, end)
+    finally:
+        reconciler.close()
+    return reconciler.summary
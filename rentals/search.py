@@ -0,0 +1,213 @@
+"""
+Equipment catalog search
+Rationale: icontains over title/description/brand/model scans the whole table on
+every keystroke, so EquipmentFilterForm is compiled into an indexed queryset:
+full-text matching and ranking through the database's own index, filters and sort
+orders backed by composite indexes, and keyset pagination instead of OFFSET
+
+Full-text index per backend (created by migration 0011):
+- PostgreSQL: generated tsvector column rentals_equipment.search_vector with a GIN
+  index, queried with to_tsquery and ranked with ts_rank_cd
+- SQLite: FTS5 external-content table rentals_equipment_fts kept in sync by
+  triggers, ranked with bm25. The index is keyed on the equipment table's implicit
+  rowid, which is not stable: SQLite table rebuilds (Django's AlterField and friends)
+  renumber it and drop the triggers, so the index is rebuilt after every migrate
+  that ran rentals migrations (signals.reindex_equipment_search). VACUUM can renumber rowids
+  too; run `manage.py rebuild_search_index` after one
+- Anything else falls back to icontains matching without ranking
+"""
+import re
+from django.db import connections, router
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from .models import Equipment
+from .pagination import keyset_page
+
+# Sort orders of EquipmentFilterForm plus relevance; each ends in a unique key
+SORT_ORDERINGS = {
+    'newest': ['-created_at', '-id'],
+    'oldest': ['created_at', 'id'],
+    'price_low': ['daily_rate', 'id'],
+    'price_high': ['-daily_rate', '-id'],
+    'rating': ['-average_rating', '-id'],
+    'relevance': ['-search_rank', '-id'],
+}
+DEFAULT_SORT = 'newest'
+MAX_SEARCH_TERMS = 8
+
+FTS_TABLE = 'rentals_equipment_fts'
+FTS_COLUMNS = ('title', 'brand', 'model', 'description')
+# bm25 column weights, in FTS_COLUMNS order
+FTS_WEIGHTS = (10.0, 5.0, 5.0, 1.0)
+
+_fts_available = {}
+
+
+def sqlite_fts_sql(table=None):
+    """Statements creating the FTS5 index and its sync triggers for the equipment table"""
+    table = table or Equipment._meta.db_table
+    columns = ', '.join(FTS_COLUMNS)
+    new_values = ', '.join(f'new.{column}' for column in FTS_COLUMNS)
+    old_values = ', '.join(f'old.{column}' for column in FTS_COLUMNS)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"{columns}, content='{table}', content_rowid='rowid', tokenize='porter unicode61')",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.rowid, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.rowid, {old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {columns} ON {table} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.rowid, {old_values}); "
+        f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.rowid, {new_values}); END",
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+    ]
+
+
+def rebuild_search_index(using=None):
+    """Reinstall the SQLite FTS5 index and triggers and reindex every listing"""
+    connection = connections[using or router.db_for_write(Equipment)]
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        for trigger in ('ai', 'ad', 'au'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{trigger}')
+        for statement in sqlite_fts_sql():
+            cursor.execute(statement)
+    _fts_available.pop(connection.alias, None)
+    return True
+
+
+def reindex_after_migrate(using, plan):
+    """
+    Rebuild the SQLite index if the migration plan ran rentals migrations, since a
+    rebuilt equipment table leaves it pointing at the wrong rows
+    """
+    if not any(migration.app_label == Equipment._meta.app_label for migration, _ in plan or ()):
+        return False
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        # Missing when SQLite lacks FTS5; search then falls back to icontains
+        if FTS_TABLE not in connection.introspection.table_names(cursor):
+            return False
+    return rebuild_search_index(using)
+
+
+def full_text_backend(using=None):
+    """'postgresql', 'fts5' or None for the database serving Equipment reads"""
+    connection = connections[using or router.db_for_read(Equipment)]
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor == 'sqlite':
+        if connection.alias not in _fts_available:
+            with connection.cursor() as cursor:
+                _fts_available[connection.alias] = FTS_TABLE in connection.introspection.table_names(cursor)
+        if _fts_available[connection.alias]:
+            return 'fts5'
+    return None
+
+
+def search_terms(text):
+    """Word tokens of a user query, safe to splice into tsquery/FTS5 syntax"""
+    return re.findall(r'\w+', (text or '').lower())[:MAX_SEARCH_TERMS]
+
+
+def apply_full_text(queryset, text, rank=True):
+    """
+    Restrict queryset to listings matching every term of text (as prefixes)
+    With rank, annotates search_rank (higher is better) when the backend can rank
+    Returns (queryset, ranked)
+    """
+    terms = search_terms(text)
+    if not terms:
+        return queryset, False
+    table = connections[router.db_for_read(Equipment)].ops.quote_name(Equipment._meta.db_table)
+    backend = full_text_backend()
+
+    if backend == 'postgresql':
+        query = ' & '.join(f'{term}:*' for term in terms)
+        tsquery = "to_tsquery('english', %s)"
+        queryset = queryset.filter(
+            RawSQL(f'{table}.search_vector @@ {tsquery}', [query], output_field=BooleanField())
+        )
+        if rank:
+            queryset = queryset.annotate(search_rank=RawSQL(
+                f'ts_rank_cd({table}.search_vector, {tsquery})', [query], output_field=FloatField()
+            ))
+        return queryset, rank
+
+    if backend == 'fts5':
+        query = ' '.join(f'"{term}"*' for term in terms)
+        if not rank:
+            # Evaluated once, so the planner is free to walk a sort-order index
+            return queryset.filter(RawSQL(
+                f'{table}.rowid IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)',
+                [query], output_field=BooleanField(),
+            )), False
+        # bm25() only works inside the MATCH scan, so the index is joined
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        queryset = queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {table}.rowid', f'{FTS_TABLE} MATCH %s'],
+            params=[query],
+        ).annotate(
+            search_rank=RawSQL(f'-bm25({FTS_TABLE}, {weights})', [], output_field=FloatField())
+        )
+        return queryset, True
+
+    condition = Q()
+    for term in terms:
+        condition &= (
+            Q(title__icontains=term) | Q(description__icontains=term) |
+            Q(brand__icontains=term) | Q(model__icontains=term)
+        )
+    return queryset.filter(condition), False
+
+
+def filter_equipment(params, queryset=None, rank=False, skip=()):
+    """
+    Apply EquipmentFilterForm.cleaned_data to queryset (default: active listings)
+    Filters named in skip ('category', 'condition', 'price', 'pickup', 'delivery')
+    are left out, for facet counts. Returns (queryset, ranked)
+    """
+    if queryset is None:
+        queryset = Equipment.objects.filter(status='active')
+
+    queryset, ranked = apply_full_text(queryset, params.get('search'), rank=rank)
+    if params.get('category') and 'category' not in skip:
+        queryset = queryset.filter(category=params['category'])
+    if params.get('condition') and 'condition' not in skip:
+        queryset = queryset.filter(condition=params['condition'])
+    if 'price' not in skip:
+        if params.get('min_price') is not None:
+            queryset = queryset.filter(daily_rate__gte=params['min_price'])
+        if params.get('max_price') is not None:
+            queryset = queryset.filter(daily_rate__lte=params['max_price'])
+    if params.get('location'):
+        location = params['location'].strip()
+        queryset = queryset.filter(Q(location_city__iexact=location) | Q(location_state__iexact=location))
+    if params.get('available_for_pickup') and 'pickup' not in skip:
+        queryset = queryset.filter(is_available_for_pickup=True)
+    if params.get('available_for_delivery') and 'delivery' not in skip:
+        queryset = queryset.filter(is_available_for_delivery=True)
+    return queryset, ranked
+
+
+def search_equipment(params, queryset=None):
+    """
+    Compile EquipmentFilterForm.cleaned_data into a filtered queryset
+    Returns (queryset, ordering); searches default to relevance order when ranked
+    """
+    sort = params.get('sort_by') or 'relevance'
+    queryset, ranked = filter_equipment(params, queryset, rank=sort == 'relevance')
+    if sort == 'relevance' and not ranked:
+        sort = DEFAULT_SORT
+    return queryset, SORT_ORDERINGS.get(sort, SORT_ORDERINGS[DEFAULT_SORT])
+
+
+def search_page(params, cursor=None, per_page=24, queryset=None):
+    """One keyset page of catalog search results"""
+    queryset, ordering = search_equipment(params, queryset)
+    queryset = queryset.select_related('category')
+    return keyset_page(queryset, ordering, cursor=cursor, per_page=per_page)
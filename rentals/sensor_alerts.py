@@ -0,0 +1,247 @@
+"""
+Sensor alert rules
+Rationale: Alerts have to keep up with bulk ingestion, so each sensor's rules are
+parsed once and cached, and a whole batch of readings is evaluated in memory
+against per-sensor state instead of querying for every reading
+
+Sensor.alert_threshold accepts a JSON object, overriding the per-type defaults in
+SENSOR_ALERT_THRESHOLDS:
+
+    {"min": 10, "max": 50, "max_rate": 2.5, "stale_intervals": 3}
+
+max_rate is the largest allowed change per minute between consecutive readings and
+stale_intervals the number of missed reading intervals before a sensor is reported
+silent. A bare number ("50") is read as a maximum and "10,50" as a min/max pair.
+"""
+import json
+from datetime import timedelta, timezone as dt_timezone
+from functools import lru_cache
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import Message, Sensor, parse_reading_value
+
+
+class AlertRules:
+    """Compiled alert rules for one sensor; any limit may be None"""
+    __slots__ = ('min_value', 'max_value', 'max_rate', 'stale_intervals')
+
+    def __init__(self, min_value=None, max_value=None, max_rate=None, stale_intervals=None):
+        self.min_value = min_value
+        self.max_value = max_value
+        self.max_rate = max_rate
+        self.stale_intervals = stale_intervals
+
+    def __bool__(self):
+        return any(getattr(self, name) is not None for name in self.__slots__)
+
+    def __repr__(self):
+        limits = ', '.join(f'{name}={getattr(self, name)}' for name in self.__slots__)
+        return f'AlertRules({limits})'
+
+    @property
+    def needs_numeric(self):
+        """Readings checked against value limits must carry a numeric value"""
+        return self.min_value is not None or self.max_value is not None or self.max_rate is not None
+
+    def violations(self, value, previous=None, minutes=None):
+        """Return the names of the rules a numeric value breaks"""
+        broken = []
+        if self.min_value is not None and value < self.min_value:
+            broken.append('below minimum')
+        if self.max_value is not None and value > self.max_value:
+            broken.append('above maximum')
+        if self.max_rate is not None and previous is not None and minutes:
+            if abs(value - previous) / minutes > self.max_rate:
+                broken.append('rate of change')
+        return broken
+
+
+def _number(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_alert_threshold(text):
+    """Parse an alert_threshold string into a dict of limits; unreadable text yields {}"""
+    text = (text or '').strip()
+    if not text:
+        return {}
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        parsed = text.split(',')
+    if isinstance(parsed, (int, float)):
+        return {'max': float(parsed)}
+    if isinstance(parsed, list):
+        if len(parsed) == 2:
+            return {'min': _number(parsed[0]), 'max': _number(parsed[1])}
+        return {}
+    if not isinstance(parsed, dict):
+        return {}
+    limits = {
+        'min': _number(parsed.get('min')),
+        'max': _number(parsed.get('max')),
+        'max_rate': _number(parsed.get('max_rate')),
+        'stale_intervals': _number(parsed.get('stale_intervals', parsed.get('stale'))),
+    }
+    return {name: value for name, value in limits.items() if value is not None}
+
+
+@lru_cache(maxsize=4096)
+def compile_rules(sensor_type, alert_threshold):
+    """Merged AlertRules for a sensor type and its alert_threshold text (cached)"""
+    limits = dict(getattr(settings, 'SENSOR_ALERT_THRESHOLDS', {}).get(sensor_type, {}))
+    limits.update(parse_alert_threshold(alert_threshold))
+    return AlertRules(
+        min_value=_number(limits.get('min')),
+        max_value=_number(limits.get('max')),
+        max_rate=_number(limits.get('max_rate')),
+        stale_intervals=_number(limits.get('stale_intervals')),
+    )
+
+
+def rules_for(sensor):
+    return compile_rules(sensor.sensor_type, sensor.alert_threshold)
+
+
+@receiver(setting_changed)
+def _clear_rule_cache(setting, **kwargs):
+    if setting == 'SENSOR_ALERT_THRESHOLDS':
+        compile_rules.cache_clear()
+
+
+class SensorAlertState:
+    """What the evaluator remembers about a sensor between batches"""
+    __slots__ = ('sensor_id', 'name', 'owner_id', 'rules', 'last_timestamp', 'last_value', 'in_alert')
+
+    def __init__(self, sensor):
+        self.sensor_id = sensor.pk
+        self.name = sensor.name
+        self.owner_id = getattr(sensor, 'owner_id', None)
+        self.rules = rules_for(sensor)
+        self.last_timestamp = sensor.last_reading
+        self.last_value = parse_reading_value(sensor.current_value)[0] if sensor.current_value else None
+        self.in_alert = bool(getattr(sensor, 'last_alert', False))
+
+
+def alert_state_queryset():
+    """Sensors with everything the evaluator needs, loaded in the same query"""
+    return Sensor.objects.only(
+        'pk', 'name', 'sensor_type', 'alert_threshold', 'current_value', 'last_reading',
+    ).annotate(owner_id=F('equipment__owner'), last_alert=F('latest_reading__is_alert'))
+
+
+def _alert_message(state, reading, broken):
+    # Device timestamps keep the offset they were sent with
+    timestamp = timezone.localtime(reading.timestamp, dt_timezone.utc)
+    return Message(
+        sender_id=state.owner_id,
+        recipient_id=state.owner_id,
+        subject=f'Sensor alert: {state.name}',
+        message=(
+            f"{state.name} reported {reading.value} at {timestamp:%Y-%m-%d %H:%M} UTC "
+            f"({', '.join(broken)})."
+        ),
+        is_system_message=True,
+    )
+
+
+def evaluate_batch(readings, states):
+    """
+    Set is_alert on every reading of a batch and return the owner notifications to create
+    states maps sensor id to SensorAlertState and is advanced to the newest reading.
+    Owners are notified when a sensor enters the alert state, not for every alerting
+    reading. Runs entirely in memory.
+    """
+    by_sensor = {}
+    for reading in readings:
+        by_sensor.setdefault(reading.sensor_id, []).append(reading)
+
+    messages = []
+    for sensor_id, sensor_readings in by_sensor.items():
+        state = states[sensor_id]
+        rules = state.rules
+        sensor_readings.sort(key=lambda reading: reading.timestamp)
+        for reading in sensor_readings:
+            value = reading.numeric_value
+            is_late = state.last_timestamp is not None and reading.timestamp < state.last_timestamp
+            if not rules or value is None:
+                reading.is_alert = False
+            else:
+                minutes = None
+                if not is_late and state.last_timestamp is not None:
+                    minutes = (reading.timestamp - state.last_timestamp).total_seconds() / 60
+                broken = rules.violations(value, None if is_late else state.last_value, minutes)
+                reading.is_alert = bool(broken)
+                if broken and not state.in_alert and not is_late and state.owner_id:
+                    messages.append(_alert_message(state, reading, broken))
+            if not is_late:
+                state.last_timestamp = reading.timestamp
+                state.last_value = value if value is not None else state.last_value
+                state.in_alert = reading.is_alert
+    return messages
+
+
+def stale_sensors(now=None, window=None):
+    """
+    Yield (sensor, silent_for) for sensors that went silent within the last `window`
+    A sensor is silent once it has missed stale_intervals reading intervals; only
+    sensors that crossed that line during the window are returned, so running the
+    check every `window` reports each outage once
+    Rules depend only on sensor type, alert_threshold and reading interval, so they
+    are compiled once per distinct combination and turned into a last_reading range
+    per silence length, which the database answers from the last_reading index
+    """
+    now = now or timezone.now()
+    window = window or timedelta(minutes=settings.SENSOR_STALE_CHECK_MINUTES)
+    active = Sensor.objects.filter(is_active=True, last_reading__isnull=False)
+
+    by_silence = {}
+    combinations = active.order_by().values_list('sensor_type', 'alert_threshold', 'reading_interval_minutes').distinct()
+    for sensor_type, alert_threshold, interval in combinations:
+        stale_intervals = compile_rules(sensor_type, alert_threshold).stale_intervals
+        if stale_intervals is None:
+            continue
+        silence = timedelta(minutes=interval * stale_intervals)
+        by_silence.setdefault(silence, Q())
+        by_silence[silence] |= Q(
+            sensor_type=sensor_type, alert_threshold=alert_threshold, reading_interval_minutes=interval,
+        )
+    if not by_silence:
+        return
+
+    # The deadline last_reading + silence has to fall in (now - window, now]
+    condition = Q()
+    for silence, sensors in by_silence.items():
+        condition |= sensors & Q(last_reading__gt=now - window - silence, last_reading__lte=now - silence)
+    sensors = alert_state_queryset().filter(is_active=True).filter(condition).only(
+        'pk', 'name', 'sensor_type', 'alert_threshold', 'current_value', 'last_reading',
+        'reading_interval_minutes',
+    )
+    for sensor in sensors.iterator(chunk_size=2000):
+        yield sensor, now - sensor.last_reading
+
+
+def notify_stale_sensors(now=None, window=None):
+    """Message the owners of sensors that just went silent; returns the messages created"""
+    messages = []
+    for sensor, silent_for in stale_sensors(now, window):
+        if not sensor.owner_id:
+            continue
+        hours = silent_for.total_seconds() / 3600
+        messages.append(Message(
+            sender_id=sensor.owner_id,
+            recipient_id=sensor.owner_id,
+            subject=f'Sensor offline: {sensor.name}',
+            message=f"{sensor.name} has not reported for {hours:.1f} hours.",
+            is_system_message=True,
+        ))
+    Message.objects.bulk_create(messages, batch_size=500)
+    return messages
@@ -0,0 +1,347 @@
+"""
+Sensor reading retention and downsampling
+Rationale: Raw readings grow by one row per tracker per minute, so only the last
+SENSOR_RAW_RETENTION_DAYS are kept; older history lives on as hourly and daily
+SensorReadingRollup rows (min/max/avg/count per sensor)
+
+The job is incremental: each run re-rolls the hours since the last rollup (plus a
+short lookback for late device uploads), rebuilds the daily rows for the days it
+touched, then deletes expired raw readings and hourly rollups in bounded batches.
+All buckets are UTC hours and days.
+
+Postgres partitioning (optional)
+With SENSOR_READING_PARTITIONED enabled on PostgreSQL the job also keeps monthly
+partitions of rentals_sensorreading ahead of time and drops whole partitions once
+they are past retention instead of deleting their rows. The table has to be
+converted by hand first, since Postgres requires the partition key in the primary
+key and Django cannot express a composite one here:
+
+    ALTER TABLE rentals_sensorreading RENAME TO rentals_sensorreading_legacy;
+    CREATE TABLE rentals_sensorreading (LIKE rentals_sensorreading_legacy INCLUDING DEFAULTS)
+        PARTITION BY RANGE ("timestamp");
+    ALTER TABLE rentals_sensorreading ADD PRIMARY KEY (id, "timestamp");
+    -- run ensure_partitions(), copy the legacy rows across, recreate the indexes
+
+Rows are still addressed by id alone through the ORM, which is unique in practice
+because ids are UUIDs.
+"""
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+from .models import Sensor, SensorReading, SensorReadingRollup
+from .sensor_service import adjust_reading_counts
+
+# Hours re-rolled behind the last rollup so late uploads are picked up
+ROLLUP_LOOKBACK = timedelta(hours=2)
+# Hours of raw readings aggregated per grouped query
+ROLLUP_WINDOW = timedelta(hours=24)
+
+ROLLUP_FIELDS = [
+    'reading_count', 'numeric_count', 'min_value', 'max_value',
+    'sum_value', 'avg_value', 'alert_count', 'updated_at',
+]
+
+
+def _hour_floor(value):
+    return value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _day_floor(value):
+    return _hour_floor(value).replace(hour=0)
+
+
+def raw_cutoff(now=None, days=None):
+    """Start of the UTC hour before which raw readings are past retention"""
+    days = settings.SENSOR_RAW_RETENTION_DAYS if days is None else days
+    return _hour_floor((now or timezone.now()) - timedelta(days=days))
+
+
+def rolled_through():
+    """End of the latest hourly rollup bucket, or None if nothing has been rolled up"""
+    latest = SensorReadingRollup.objects.filter(resolution='hour').aggregate(
+        latest=Max('bucket_start')
+    )['latest']
+    return latest + timedelta(hours=1) if latest else None
+
+
+def _upsert_rollups(resolution, rows):
+    rollups = []
+    for row in rows:
+        numeric_count = row['numeric_count'] or 0
+        rollups.append(SensorReadingRollup(
+            sensor_id=row['sensor'],
+            resolution=resolution,
+            bucket_start=row['bucket'],
+            reading_count=row['reading_count'],
+            numeric_count=numeric_count,
+            min_value=row['min_value'],
+            max_value=row['max_value'],
+            sum_value=row['sum_value'],
+            avg_value=row['sum_value'] / numeric_count if numeric_count else None,
+            alert_count=row['alert_count'] or 0,
+        ))
+    SensorReadingRollup.objects.bulk_create(
+        rollups, batch_size=1000, update_conflicts=True,
+        unique_fields=['sensor', 'resolution', 'bucket_start'], update_fields=ROLLUP_FIELDS,
+    )
+    return len(rollups)
+
+
+def rollup_hours(start, end):
+    """
+    Recompute hourly rollups for readings in [start, end) from the raw table
+    Hours whose raw readings were already pruned must not be passed in
+    Returns the number of rollup rows written
+    """
+    written = 0
+    window_start = _hour_floor(start)
+    while window_start < end:
+        window_end = min(window_start + ROLLUP_WINDOW, end)
+        rows = (
+            SensorReading.objects
+            .filter(timestamp__gte=window_start, timestamp__lt=window_end)
+            .order_by()
+            .annotate(bucket=TruncHour('timestamp', tzinfo=dt_timezone.utc))
+            .values('sensor', 'bucket')
+            .annotate(
+                reading_count=Count('pk'),
+                numeric_count=Count('numeric_value'),
+                min_value=Min('numeric_value'),
+                max_value=Max('numeric_value'),
+                sum_value=Sum('numeric_value'),
+                alert_count=Count('pk', filter=Q(is_alert=True)),
+            )
+        )
+        with transaction.atomic():
+            written += _upsert_rollups('hour', rows)
+        window_start = window_end
+    return written
+
+
+def rollup_days(start, end):
+    """Rebuild daily rollups for the UTC days overlapping [start, end) from the hourly rollups"""
+    rows = (
+        SensorReadingRollup.objects
+        .filter(resolution='hour', bucket_start__gte=_day_floor(start), bucket_start__lt=end)
+        .order_by()
+        .annotate(bucket=TruncDay('bucket_start', tzinfo=dt_timezone.utc))
+        .values('sensor', 'bucket')
+        .annotate(
+            reading_count=Sum('reading_count'),
+            numeric_count=Sum('numeric_count'),
+            min_value=Min('min_value'),
+            max_value=Max('max_value'),
+            sum_value=Sum('sum_value'),
+            alert_count=Sum('alert_count'),
+        )
+    )
+    with transaction.atomic():
+        return _upsert_rollups('day', rows)
+
+
+def refresh_rollups(now=None, cutoff=None):
+    """
+    Roll up every complete hour not yet covered, plus ROLLUP_LOOKBACK for late uploads
+    The in-progress hour is left for the next run. Returns (hourly, daily) rows written.
+    """
+    end = _hour_floor(now or timezone.now())
+    cutoff = cutoff or raw_cutoff(now)
+    watermark = rolled_through()
+    if watermark is None:
+        first = SensorReading.objects.filter(timestamp__lt=end).aggregate(first=Min('timestamp'))['first']
+        if first is None:
+            return 0, 0
+        start = _hour_floor(first)
+    else:
+        # Never re-roll hours whose raw rows may already be pruned
+        start = max(watermark - ROLLUP_LOOKBACK, cutoff)
+    if start >= end:
+        return 0, 0
+    return rollup_hours(start, end), rollup_days(start, end)
+
+
+def _delete_in_batches(queryset, batch_size, max_batches=None, before_delete=None):
+    """
+    Delete rows of queryset by primary key, batch_size at a time
+    before_delete(pks, sensor_ids) runs inside each batch's transaction
+    """
+    deleted = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        rows = list(queryset.order_by().values_list('pk', 'sensor_id')[:batch_size])
+        if not rows:
+            break
+        pks = [pk for pk, _ in rows]
+        with transaction.atomic():
+            if before_delete:
+                before_delete(pks, [sensor_id for _, sensor_id in rows])
+            queryset.model.objects.filter(pk__in=pks).delete()
+        deleted += len(pks)
+        batches += 1
+    return deleted
+
+
+def _release_readings(pks, sensor_ids):
+    Sensor.objects.filter(latest_reading__in=pks).update(latest_reading=None)
+    adjust_reading_counts(Counter(sensor_ids))
+
+
+def prune_raw_readings(before, batch_size=None, max_batches=None):
+    """
+    Delete raw readings older than `before` in batches, keeping Sensor counters in step
+    Each batch is a plain DELETE by primary key plus one counter UPDATE per sensor
+    """
+    batch_size = batch_size or settings.SENSOR_PRUNE_BATCH_SIZE
+    return _delete_in_batches(
+        SensorReading.objects.filter(timestamp__lt=before),
+        batch_size, max_batches, before_delete=_release_readings,
+    )
+
+
+def prune_hourly_rollups(before, batch_size=None, max_batches=None):
+    """Delete hourly rollups older than `before`; daily rollups are kept indefinitely"""
+    batch_size = batch_size or settings.SENSOR_PRUNE_BATCH_SIZE
+    return _delete_in_batches(
+        SensorReadingRollup.objects.filter(resolution='hour', bucket_start__lt=before),
+        batch_size, max_batches,
+    )
+
+
+def _connection():
+    return connections[router.db_for_write(SensorReading)]
+
+
+def partitioning_enabled():
+    """True when SensorReading is stored as monthly Postgres partitions"""
+    return (
+        getattr(settings, 'SENSOR_READING_PARTITIONED', False)
+        and _connection().vendor == 'postgresql'
+    )
+
+
+def _month_start(value):
+    return _day_floor(value).replace(day=1)
+
+
+def _next_month(value):
+    if value.month == 12:
+        return value.replace(year=value.year + 1, month=1)
+    return value.replace(month=value.month + 1)
+
+
+def partition_name(month):
+    return f"{SensorReading._meta.db_table}_p{month:%Y%m}"
+
+
+def ensure_partitions(now=None, months_ahead=2):
+    """Create the monthly partitions for the current month and months_ahead after it"""
+    connection = _connection()
+    qn = connection.ops.quote_name
+    month = _month_start(now or timezone.now())
+    created = []
+    with connection.cursor() as cursor:
+        for _ in range(months_ahead + 1):
+            upper = _next_month(month)
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {qn(partition_name(month))} "
+                f"PARTITION OF {qn(SensorReading._meta.db_table)} "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                [month, upper],
+            )
+            created.append(partition_name(month))
+            month = upper
+    return created
+
+
+def list_partitions():
+    """Map partition table name to the start of its month, oldest first"""
+    prefix = f"{SensorReading._meta.db_table}_p"
+    with _connection().cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = %s",
+            [SensorReading._meta.db_table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        if not name.startswith(prefix):
+            continue
+        try:
+            month = datetime.strptime(name[len(prefix):], '%Y%m')
+        except ValueError:
+            continue
+        partitions[name] = month.replace(tzinfo=dt_timezone.utc)
+    return dict(sorted(partitions.items(), key=lambda item: item[1]))
+
+
+def drop_expired_partitions(before):
+    """
+    Drop monthly partitions that end on or before `before`
+    Sensor counters are adjusted from one GROUP BY over each partition first
+    """
+    connection = _connection()
+    qn = connection.ops.quote_name
+    opts = SensorReading._meta
+    sensor_column = qn(opts.get_field('sensor').column)
+    sensor_table = qn(Sensor._meta.db_table)
+    pointer_column = qn(Sensor._meta.get_field('latest_reading').column)
+    dropped = []
+    for name, month in list_partitions().items():
+        if _next_month(month) > before:
+            break
+        table = qn(name)
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f"SELECT {sensor_column}, COUNT(*) FROM {table} GROUP BY {sensor_column}")
+            deltas = dict(cursor.fetchall())
+            cursor.execute(
+                f"UPDATE {sensor_table} SET {pointer_column} = NULL "
+                f"WHERE {pointer_column} IN (SELECT {qn(opts.pk.column)} FROM {table})"
+            )
+            adjust_reading_counts(deltas)
+            cursor.execute(f"ALTER TABLE {qn(opts.db_table)} DETACH PARTITION {table}")
+            cursor.execute(f"DROP TABLE {table}")
+        dropped.append(name)
+    return dropped
+
+
+def run_retention(now=None, raw_days=None, hourly_days=None, batch_size=None,
+                  max_batches=None, rollup=True):
+    """
+    One incremental pass: roll up new hours, then prune expired raw readings and hourly rollups
+    Raw readings are only pruned up to the hours already rolled up
+    Returns a summary dict for the management command
+    """
+    now = now or timezone.now()
+    cutoff = raw_cutoff(now, raw_days)
+    hourly_days = settings.SENSOR_HOURLY_ROLLUP_RETENTION_DAYS if hourly_days is None else hourly_days
+    summary = {
+        'hourly_rollups': 0,
+        'daily_rollups': 0,
+        'partitions_dropped': [],
+        'readings_pruned': 0,
+        'hourly_rollups_pruned': 0,
+    }
+
+    if rollup:
+        summary['hourly_rollups'], summary['daily_rollups'] = refresh_rollups(now, cutoff)
+    watermark = rolled_through()
+    if watermark is None:
+        # Nothing rolled up yet, so nothing can be pruned safely
+        return summary
+    prune_before = min(cutoff, watermark)
+
+    if partitioning_enabled():
+        ensure_partitions(now)
+        summary['partitions_dropped'] = drop_expired_partitions(prune_before)
+    summary['readings_pruned'] = prune_raw_readings(prune_before, batch_size, max_batches)
+    summary['hourly_rollups_pruned'] = prune_hourly_rollups(
+        raw_cutoff(now, hourly_days), batch_size, max_batches
+    )
+    return summary
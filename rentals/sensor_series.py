@@ -0,0 +1,168 @@
+"""
+Downsampled sensor time series for charts
+Rationale: A year of minute readings is ~500k rows, so long ranges are read from
+SensorReadingRollup and every series is reduced to at most max_points with LTTB
+(largest-triangle-three-buckets), fetched as plain tuples rather than model objects
+
+Raw reads are capped at RAW_ROWS_PER_POINT rows per requested point; past that
+(no rollups yet, or a sensor reporting every second) the database averages the
+readings per minute, hour or day instead.
+"""
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from .models import SensorReading, SensorReadingRollup
+from .sensor_retention import raw_cutoff, rolled_through
+
+DEFAULT_MAX_POINTS = 1000
+# Raw readings are only read when the chart needs finer buckets than this
+RAW_MAX_BUCKET = timedelta(minutes=10)
+HOURLY_MAX_BUCKET = timedelta(hours=12)
+# Raw rows loaded per requested point before the database buckets them instead
+RAW_ROWS_PER_POINT = 20
+BUCKET_KINDS = [('minute', timedelta(minutes=1)), ('hour', timedelta(hours=1)), ('day', timedelta(days=1))]
+
+SERIES_FIELDS = ['t', 'value', 'min', 'max', 'count']
+
+
+def lttb(points, threshold, key=lambda point: point[1]):
+    """
+    Downsample points [(datetime, value, ...), ...] to `threshold` points with LTTB
+    Keeps the first and last points and, per bucket, the point forming the largest
+    triangle with its neighbours, so peaks and dips survive the reduction
+    """
+    count = len(points)
+    if threshold >= count or threshold < 3:
+        return list(points)
+
+    xs = [point[0].timestamp() for point in points]
+    ys = [key(point) for point in points]
+    sampled = [points[0]]
+    every = (count - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, count)
+        span = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / span
+        avg_y = sum(ys[next_start:next_end]) / span
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+
+def choose_resolution(start, end, max_points, now=None):
+    """
+    Pick 'raw', 'hour' or 'day' for a chart of [start, end]
+    The coarsest source that still gives max_points is preferred, falling back to
+    coarser tables when the finer data has already been pruned
+    """
+    bucket = (end - start) / max(max_points, 1)
+    raw_available = start >= raw_cutoff(now)
+    hourly_available = start >= raw_cutoff(now, settings.SENSOR_HOURLY_ROLLUP_RETENTION_DAYS)
+    if bucket <= RAW_MAX_BUCKET and raw_available:
+        return 'raw'
+    if bucket <= HOURLY_MAX_BUCKET and hourly_available:
+        return 'hour'
+    return 'day'
+
+
+def _bucket_kind(span, limit):
+    """Finest of minute/hour/day buckets that splits span into at most limit buckets"""
+    for kind, size in BUCKET_KINDS:
+        if span / size <= limit:
+            return kind
+    return BUCKET_KINDS[-1][0]
+
+
+def _bucketed_points(sensor_id, start, end, kind):
+    """Raw readings of [start, end) averaged per UTC minute, hour or day in the database"""
+    rows = (
+        SensorReading.objects
+        .filter(sensor_id=sensor_id, timestamp__gte=start, timestamp__lt=end, numeric_value__isnull=False)
+        .order_by()
+        .annotate(bucket=Trunc('timestamp', kind, tzinfo=dt_timezone.utc))
+        .values('bucket')
+        .annotate(
+            avg_value=Avg('numeric_value'), min_value=Min('numeric_value'),
+            max_value=Max('numeric_value'), numeric_count=Count('numeric_value'),
+        )
+        .order_by('bucket')
+        .values_list('bucket', 'avg_value', 'min_value', 'max_value', 'numeric_count')
+    )
+    return list(rows)
+
+
+def _raw_points(sensor_id, start, end, max_points):
+    """
+    Raw readings of [start, end), at most max_points * RAW_ROWS_PER_POINT of them
+    Spans holding more (a busy sensor, or a long range with no rollups yet) are
+    aggregated into time buckets by the database instead of loaded row by row
+    """
+    limit = max(max_points, 1) * RAW_ROWS_PER_POINT
+    rows = list(
+        SensorReading.objects
+        .filter(sensor_id=sensor_id, timestamp__gte=start, timestamp__lt=end, numeric_value__isnull=False)
+        .order_by('timestamp')
+        .values_list('timestamp', 'numeric_value')[:limit + 1]
+    )
+    if len(rows) > limit:
+        return _bucketed_points(sensor_id, start, end, _bucket_kind(end - start, limit))
+    return [(timestamp, value, value, value, 1) for timestamp, value in rows]
+
+
+def _rollup_points(sensor_id, resolution, start, end):
+    rows = (
+        SensorReadingRollup.objects
+        .filter(
+            sensor_id=sensor_id, resolution=resolution,
+            bucket_start__gte=start, bucket_start__lt=end, numeric_count__gt=0,
+        )
+        .order_by('bucket_start')
+        .values_list('bucket_start', 'avg_value', 'min_value', 'max_value', 'numeric_count')
+    )
+    return list(rows)
+
+
+def sensor_series(sensor, start, end, max_points=DEFAULT_MAX_POINTS, now=None):
+    """
+    Numeric readings of sensor between start and end, reduced to at most max_points
+    Long ranges come from the rollup tables; readings newer than the last hourly
+    rollup are appended from the raw table so the chart reaches `end`.
+    Returns a dict with the resolution used and points as [t, value, min, max, count].
+    """
+    resolution = choose_resolution(start, end, max_points, now)
+    if resolution == 'raw':
+        points = _raw_points(sensor.pk, start, end, max_points)
+    else:
+        watermark = rolled_through() or start
+        rollup_end = max(min(end, watermark), start)
+        points = _rollup_points(sensor.pk, resolution, start, rollup_end)
+        if rollup_end < end:
+            points += _raw_points(sensor.pk, rollup_end, end, max_points)
+
+    points = lttb(points, max_points)
+    return {
+        'sensor': str(sensor.pk),
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'resolution': resolution,
+        'fields': SERIES_FIELDS,
+        'points': [
+            [timestamp.isoformat(), value, low, high, count]
+            for timestamp, value, low, high, count in points
+        ],
+    }
@@ -0,0 +1,330 @@
+"""
+Sensor reading ingestion and bookkeeping
+Rationale: Trackers report every minute, so readings are written in batches and
+the denormalized counters on Sensor are updated once per batch
+"""
+import json
+import uuid
+from datetime import timezone as dt_timezone
+from decimal import Context, Decimal, InvalidOperation
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Message, Sensor, SensorReading, parse_reading_value
+from .sensor_alerts import SensorAlertState, alert_state_queryset, evaluate_batch
+
+# Errors echoed back to the client per request; the rest are only counted
+MAX_REPORTED_ERRORS = 50
+
+
+class ReadingError(ValueError):
+    """A single reading in an ingestion payload was rejected"""
+
+
+def record_reading(reading):
+    """
+    Fold a newly saved reading into its sensor's counters with one UPDATE
+    The latest-reading fields only move forward, so late readings just bump the count
+    """
+    is_newer = Q(last_reading__isnull=True) | Q(last_reading__lte=reading.timestamp)
+    Sensor.objects.filter(pk=reading.sensor_id).update(
+        reading_count=F('reading_count') + 1,
+        latest_reading=Case(When(is_newer, then=Value(reading.pk)), default=F('latest_reading')),
+        current_value=Case(When(is_newer, then=Value(reading.value)), default=F('current_value')),
+        last_reading=Case(When(is_newer, then=Value(reading.timestamp)), default=F('last_reading')),
+    )
+
+
+def rebuild_sensor_counters(sensor_ids=None, batch_size=1000):
+    """
+    Recompute reading_count and the latest-reading fields from SensorReading
+    Use after readings are deleted outside the retention job. Each batch of sensors is rebuilt with one correlated UPDATE; returns sensors updated
+    """
+    readings = SensorReading.objects.filter(sensor=OuterRef('pk'))
+    latest = readings.order_by('-timestamp')
+    reading_count = readings.order_by().values('sensor').annotate(total=Count('pk')).values('total')
+
+    sensors = Sensor.objects.order_by('pk')
+    if sensor_ids is not None:
+        sensors = sensors.filter(pk__in=sensor_ids)
+
+    updated = 0
+    last_pk = None
+    while True:
+        batch = sensors if last_pk is None else sensors.filter(pk__gt=last_pk)
+        batch_ids = list(batch.values_list('pk', flat=True)[:batch_size])
+        if not batch_ids:
+            break
+        updated += Sensor.objects.filter(pk__in=batch_ids).update(
+            reading_count=Coalesce(Subquery(reading_count), 0),
+            latest_reading=Subquery(latest.values('pk')[:1]),
+            current_value=Subquery(latest.values('value')[:1]),
+            last_reading=Subquery(latest.values('timestamp')[:1]),
+        )
+        last_pk = batch_ids[-1]
+    return updated
+
+
+def _reject_constant(name):
+    raise ValueError(f'{name} is not valid JSON')
+
+
+def _loads(text):
+    # Python's json accepts NaN and Infinity, which JSON columns cannot store
+    return json.loads(text, parse_constant=_reject_constant)
+
+
+def parse_readings_payload(body, content_type=''):
+    """
+    Decode an ingestion payload: a JSON array, {"readings": [...]}, or NDJSON
+    Raises ValueError if the body cannot be decoded
+    """
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    if 'ndjson' in content_type or 'jsonlines' in content_type:
+        return [_loads(line) for line in body.splitlines() if line.strip()]
+    try:
+        payload = _loads(body)
+    except json.JSONDecodeError:
+        # Fall back to NDJSON when the client did not label it
+        return [_loads(line) for line in body.splitlines() if line.strip()]
+    if isinstance(payload, dict):
+        payload = payload.get('readings', [payload])
+    if not isinstance(payload, list):
+        raise ValueError('Expected a list of readings')
+    return payload
+
+
+def _decimal(record, field, minimum=None, maximum=None):
+    """
+    Optional decimal field of a record, rounded to its SensorReading column
+    Values the column cannot store (NaN, infinity, too many digits) are rejected
+    here rather than failing the whole batch in bulk_create
+    """
+    value = record.get(field)
+    if value in (None, ''):
+        return None
+    model_field = SensorReading._meta.get_field(field)
+    try:
+        number = Decimal(str(value))
+        if not number.is_finite():
+            raise InvalidOperation
+        number = number.quantize(
+            Decimal(1).scaleb(-model_field.decimal_places), context=Context(prec=model_field.max_digits)
+        )
+    except InvalidOperation:
+        raise ReadingError(f"Invalid {field} '{value}'")
+    if minimum is not None and not minimum <= number <= maximum:
+        raise ReadingError(f"{field} must be between {minimum} and {maximum}, got {value}")
+    return number
+
+
+def _timestamp(record, default):
+    value = record.get('timestamp')
+    if not value:
+        return default
+    try:
+        parsed = parse_datetime(value) if isinstance(value, str) else None
+    except ValueError:
+        # Well formed but impossible, e.g. February 30th
+        parsed = None
+    if parsed is None:
+        raise ReadingError(f"Invalid timestamp '{value}'")
+    if settings.USE_TZ and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def build_reading(record, sensor, rules, received_at):
+    """
+    Validate one raw record and return an unsaved SensorReading
+    Readings of sensors with value-based alert rules must be numeric; is_alert is
+    set afterwards by sensor_alerts.evaluate_batch
+    """
+    if 'value' not in record or record['value'] in (None, ''):
+        raise ReadingError('Missing value')
+    value = record['value']
+    numeric_value, payload = parse_reading_value(value)
+    if isinstance(record.get('payload'), dict):
+        payload = record['payload']
+
+    if rules.needs_numeric and numeric_value is None:
+        raise ReadingError(f"Non-numeric value '{value}' for {sensor.sensor_type} sensor")
+
+    quality_score = _decimal(record, 'quality_score', 0, 1)
+
+    return SensorReading(
+        id=uuid.uuid4(),
+        sensor_id=sensor.pk,
+        value=str(value)[:255],
+        unit=str(record.get('unit') or '')[:20],
+        numeric_value=numeric_value,
+        payload=payload,
+        latitude=_decimal(record, 'latitude', -90, 90),
+        longitude=_decimal(record, 'longitude', -180, 180),
+        altitude=_decimal(record, 'altitude'),
+        quality_score=quality_score,
+        timestamp=_timestamp(record, received_at),
+    )
+
+
+def apply_batch_to_sensors(readings):
+    """
+    Update counters and latest-reading fields for every sensor in a batch
+    Uses one parameterized UPDATE executed for all affected sensors (executemany),
+    which stays fast where a per-sensor CASE expression would not
+    """
+    counts = {}
+    newest = {}
+    for reading in readings:
+        counts[reading.sensor_id] = counts.get(reading.sensor_id, 0) + 1
+        current = newest.get(reading.sensor_id)
+        if current is None or reading.timestamp >= current.timestamp:
+            newest[reading.sensor_id] = reading
+    if not counts:
+        return 0
+
+    connection = connections[router.db_for_write(Sensor)]
+    qn = connection.ops.quote_name
+    opts = Sensor._meta
+    column = {name: qn(opts.get_field(name).column) for name in (
+        'id', 'reading_count', 'latest_reading', 'current_value', 'last_reading'
+    )}
+    is_newer = f"({column['last_reading']} IS NULL OR {column['last_reading']} <= %s)"
+    sql = (
+        f"UPDATE {qn(opts.db_table)} SET "
+        f"{column['reading_count']} = {column['reading_count']} + %s, "
+        f"{column['latest_reading']} = CASE WHEN {is_newer} THEN %s ELSE {column['latest_reading']} END, "
+        f"{column['current_value']} = CASE WHEN {is_newer} THEN %s ELSE {column['current_value']} END, "
+        f"{column['last_reading']} = CASE WHEN {is_newer} THEN %s ELSE {column['last_reading']} END "
+        f"WHERE {column['id']} = %s"
+    )
+
+    pk_field = opts.pk
+    reading_pk_field = SensorReading._meta.pk
+    timestamp_field = opts.get_field('last_reading')
+    params = []
+    for sensor_id, count in counts.items():
+        latest = newest[sensor_id]
+        timestamp = timestamp_field.get_db_prep_value(latest.timestamp, connection)
+        params.append((
+            count,
+            timestamp, reading_pk_field.get_db_prep_value(latest.pk, connection),
+            timestamp, latest.value,
+            timestamp, timestamp,
+            pk_field.get_db_prep_value(sensor_id, connection),
+        ))
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+    return len(params)
+
+
+def adjust_reading_counts(deltas):
+    """
+    Subtract per-sensor amounts from reading_count after readings are removed
+    deltas maps sensor id to the number of readings deleted; counts never go below zero
+    """
+    if not deltas:
+        return 0
+    connection = connections[router.db_for_write(Sensor)]
+    qn = connection.ops.quote_name
+    opts = Sensor._meta
+    count_column = qn(opts.get_field('reading_count').column)
+    sql = (
+        f"UPDATE {qn(opts.db_table)} SET {count_column} = "
+        f"CASE WHEN {count_column} > %s THEN {count_column} - %s ELSE 0 END "
+        f"WHERE {qn(opts.pk.column)} = %s"
+    )
+    params = [
+        (count, count, opts.pk.get_db_prep_value(sensor_id, connection))
+        for sensor_id, count in deltas.items()
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+    return len(params)
+
+
+def _sensor_key(record):
+    """Normalized sensor id of a raw record, or None if it is missing or malformed"""
+    if not isinstance(record, dict) or not record.get('sensor'):
+        return None
+    try:
+        return str(uuid.UUID(str(record['sensor'])))
+    except ValueError:
+        return None
+
+
+def _write_batch(readings, messages=()):
+    SensorReading.objects.bulk_create(readings)
+    apply_batch_to_sensors(readings)
+    if messages:
+        Message.objects.bulk_create(messages)
+
+
+def ingest_readings(records, batch_size=None):
+    """
+    Validate and store raw reading records for any number of sensors
+    Each record needs 'sensor' (id) and 'value'; timestamp, unit, location and
+    quality_score are optional. Rows are written with bulk_create in batches of
+    SENSOR_INGEST_BATCH_SIZE, each followed by one UPDATE of the affected sensors.
+    Alert rules are evaluated per batch and owners get a system Message when a
+    sensor enters the alert state.
+    Invalid records are rejected one by one; everything else is written in a single
+    transaction, so a call that raises stores nothing and can simply be retried.
+    Returns a summary dict with accepted/rejected counts and the first errors.
+    """
+    batch_size = batch_size or getattr(settings, 'SENSOR_INGEST_BATCH_SIZE', 1000)
+    received_at = timezone.now()
+
+    summary = {'accepted': 0, 'rejected': 0, 'alerts': 0, 'notifications': 0, 'errors': []}
+
+    def reject(index, message):
+        summary['rejected'] += 1
+        if len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append({'index': index, 'error': message})
+
+    sensors = {}
+    states = {}
+    records = list(records)
+    with transaction.atomic():
+        for start in range(0, len(records), batch_size):
+            chunk = records[start:start + batch_size]
+
+            wanted = {
+                key for key in (_sensor_key(record) for record in chunk)
+                if key and key not in sensors
+            }
+            if wanted:
+                found = alert_state_queryset().filter(pk__in=wanted, is_active=True)
+                found = {str(sensor.pk): sensor for sensor in found}
+                for key in wanted:
+                    sensors[key] = found.get(key)
+                for sensor in found.values():
+                    states[sensor.pk] = SensorAlertState(sensor)
+
+            batch = []
+            for offset, record in enumerate(chunk):
+                index = start + offset
+                if not isinstance(record, dict):
+                    reject(index, 'Reading must be an object')
+                    continue
+                sensor = sensors.get(_sensor_key(record))
+                if sensor is None:
+                    reject(index, f"Unknown or inactive sensor '{record.get('sensor')}'")
+                    continue
+                try:
+                    batch.append(build_reading(record, sensor, states[sensor.pk].rules, received_at))
+                except ReadingError as e:
+                    reject(index, str(e))
+
+            if batch:
+                messages = evaluate_batch(batch, states)
+                _write_batch(batch, messages)
+                summary['accepted'] += len(batch)
+                summary['alerts'] += sum(1 for reading in batch if reading.is_alert)
+                summary['notifications'] += len(messages)
+
+    return summary
@@ -1,7 +1,13 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_migrate, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile
+from .analytics import mark_stale
+from .caching import CATALOG, bump_version
+from .models import (
+    CustomUser, Equipment, EquipmentCategory, EquipmentImage, Rental, Review, UserProfile, SensorReading
+)
+from .search import reindex_after_migrate
+from .sensor_service import record_reading
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -19,3 +25,48 @@ def save_user_profile(sender, instance, **kwargs):
     """
     if hasattr(instance, 'userprofile'):
         instance.userprofile.save()
+
+@receiver(post_save, sender=SensorReading)
+def update_sensor_on_reading(sender, instance, created, **kwargs):
+    """
+    Keep Sensor.reading_count and the latest-reading pointer current
+    Rationale: Sensor listings read these instead of scanning SensorReading
+    """
+    if created:
+        record_reading(instance)
+
+@receiver(post_save, sender=Equipment)
+@receiver(post_delete, sender=Equipment)
+@receiver(post_save, sender=EquipmentImage)
+@receiver(post_delete, sender=EquipmentImage)
+@receiver(post_save, sender=EquipmentCategory)
+@receiver(post_delete, sender=EquipmentCategory)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_catalog_cache(sender, **kwargs):
+    """
+    Drop cached catalog pages, fragments and facet counts when listing content changes
+    Rationale: One version bump instead of tracking every cached URL
+    """
+    bump_version(CATALOG)
+
+@receiver(post_delete, sender=CustomUser)
+@receiver(post_delete, sender=Equipment)
+@receiver(post_delete, sender=Rental)
+def mark_platform_stats_stale(sender, instance, **kwargs):
+    """
+    Flag the DailyPlatformStats day a deleted user, listing or rental was created on
+    Rationale: Incremental refreshes find changes through date_joined/updated_at,
+    which a deleted row no longer has
+    """
+    created = instance.date_joined if sender is CustomUser else instance.created_at
+    mark_stale(created)
+
+@receiver(post_migrate)
+def reindex_equipment_search(sender, app_config, using, plan=None, **kwargs):
+    """
+    Rebuild the SQLite equipment search index after rentals migrations
+    Rationale: Table rebuilds renumber the rowids the index is keyed on
+    """
+    if app_config.label == 'rentals':
+        reindex_after_migrate(using, plan)
@@ -1,3 +1,1691 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import time
+import uuid
+from importlib import import_module
+import zlib
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from collections import Counter
+from decimal import Decimal
+from functools import partial
+from unittest import mock
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import NameOID
+from django.apps import apps
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db import DatabaseError, connection, migrations
+from django.db.models import Q, Sum
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from .models import (
+    CustomUser, DailyPlatformStats, Equipment, EquipmentCategory, EquipmentImage, Job, Message, Payment,
+    PayPalWebhookEvent, Rental, Review, Sensor, SensorReading, SensorReadingRollup, UserProfile, Wishlist,
+    parse_reading_value,
+)
+from .analytics import (
+    count_buckets, daily_series, monthly_revenue, platform_totals, refresh_daily_stats, status_histogram, time_series,
+)
+from .availability import BookingConflict, available_equipment, booked_intervals, hold_rental, is_available
+from .caching import CATALOG, bump_version, cache_for_anonymous, page_key
+from .facets import catalog_facets, compute_facets
+from .fake_paypal import FakePayPalServer
+from .geohash import encode as geohash_encode
+from .jobs import PermanentJobError, claim_jobs, enqueue, run_due_jobs, run_job
+from .nearby import nearby_equipment, nearby_page
+from .pagination import InvalidCursor, keyset_page
+from .paypal_service import (
+    PayPalService, capture_payment, capture_payment_job, enqueue_capture, initiate_payment, retry_delay, token_store,
+)
+from .paypal_webhooks import WebhookVerificationError, _certificates, get_certificate
+from .reconciliation import iter_csv_export, reconcile_payments
+from .search import full_text_backend, reindex_after_migrate, search_page
+from .sensor_alerts import stale_sensors
+from .sensor_retention import refresh_rollups, rolled_through, run_retention
+from .sensor_series import lttb, sensor_series
+from .sensor_service import ingest_readings
+from . import view_counts
 
-# Create your tests here.
+
+# Keep buffered view counts (rentals/view_counts.py) from flushing mid-assertion
+@override_settings(VIEW_COUNT_FLUSH_SECONDS=3600)
+class EquipmentDetailQueryCountTests(TestCase):
+    """
+    The detail page is built from a fixed query plan (rentals/equipment_detail.py):
+    its query count must not depend on the number of images or reviews
+    """
+    # listing + owner/profile/category, images, recent reviews, booked intervals
+    DETAIL_QUERIES = 4
+    # session and user lookups for a signed-in viewer, plus the session write
+    # (savepoint, update, release) from SESSION_SAVE_EVERY_REQUEST
+    AUTH_QUERIES = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        UserProfile.objects.create(user=cls.owner, city='Austin', state='TX', is_verified=True)
+        cls.viewer = CustomUser.objects.create_user(username='viewer', email='viewer@example.com', password='pw')
+        category = EquipmentCategory.objects.create(name='Consoles')
+        cls.equipment = Equipment.objects.create(
+            owner=cls.owner, category=category, title='PlayStation 5', description='Disc edition',
+            brand='Sony', model='CFI-1215A', condition='excellent', daily_rate=Decimal('15.00'),
+            location_city='Austin', location_state='TX', status='active',
+        )
+        Wishlist.objects.create(user=cls.viewer, equipment=cls.equipment)
+        cls.add_images(2)
+        cls.add_reviews(2)
+
+    @classmethod
+    def add_images(cls, count):
+        for index in range(count):
+            EquipmentImage.objects.create(equipment=cls.equipment, image=f'equipment/ps5-{index}.jpg')
+
+    @classmethod
+    def add_reviews(cls, count):
+        start = date.today() - timedelta(days=30)
+        for index in range(count):
+            username = f'renter{Review.objects.count()}'
+            renter = CustomUser.objects.create_user(username=username, email=f'{username}@example.com', password='pw')
+            rental = Rental.objects.create(
+                equipment=cls.equipment, renter=renter, owner=cls.owner,
+                start_date=start, end_date=start + timedelta(days=2), daily_rate=Decimal('15.00'),
+                total_days=2, subtotal=Decimal('30.00'), security_deposit=Decimal('0.00'),
+                total_amount=Decimal('30.00'), status='completed',
+            )
+            Review.objects.create(
+                rental=rental, reviewer=renter, reviewee=cls.owner, equipment=cls.equipment,
+                reviewer_type='equipment_review', rating=5, comment='Worked great',
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('equipment_detail', args=[self.equipment.pk])
+
+    def test_anonymous_query_count(self):
+        with self.assertNumQueries(self.DETAIL_QUERIES):
+            response = self.client.get(self.url, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'PlayStation 5')
+        self.assertNotContains(response, 'On your wishlist')
+
+    def test_signed_in_query_count(self):
+        self.client.force_login(self.viewer)
+        with self.assertNumQueries(self.AUTH_QUERIES + self.DETAIL_QUERIES):
+            response = self.client.get(self.url, secure=True)
+        self.assertContains(response, 'On your wishlist')
+        self.assertContains(response, 'Reviews (2)')
+
+    def test_query_count_independent_of_related_rows(self):
+        self.add_images(5)
+        self.add_reviews(5)
+        self.client.force_login(self.viewer)
+        with self.assertNumQueries(self.AUTH_QUERIES + self.DETAIL_QUERIES):
+            response = self.client.get(self.url, secure=True)
+        self.assertContains(response, 'Reviews (7)')
+        self.assertEqual(len(response.context['detail'].images), 7)
+
+    def test_unpublished_listing_hidden_from_others(self):
+        Equipment.objects.filter(pk=self.equipment.pk).update(status='draft')
+        self.client.force_login(self.viewer)
+        self.assertEqual(self.client.get(self.url, secure=True).status_code, 404)
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(self.url, secure=True).status_code, 200)
+
+
+@override_settings(SENSOR_INGEST_TOKEN='device-token')
+class SensorIngestionTests(TestCase):
+    """Bulk ingestion (rentals/sensor_service.py) rejects bad records one by one"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sensor = Sensor.objects.create(name='Tracker', sensor_type='battery')
+
+    def post(self, readings):
+        return self.client.post(
+            reverse('sensor_readings_ingest'), json.dumps(readings), content_type='application/json',
+            secure=True, HTTP_X_SENSOR_TOKEN='device-token',
+        )
+
+    def reading(self, **fields):
+        return {'sensor': str(self.sensor.pk), 'value': '42', **fields}
+
+    def assert_only_first_rejected(self, bad, error):
+        stored = SensorReading.objects.count()
+        response = self.post([bad, self.reading()])
+        self.assertEqual(response.status_code, 200)
+        summary = response.json()
+        self.assertEqual((summary['accepted'], summary['rejected']), (1, 1))
+        self.assertEqual(summary['errors'][0]['index'], 0)
+        self.assertIn(error, summary['errors'][0]['error'])
+        self.assertEqual(SensorReading.objects.count(), stored + 1)
+
+    def test_accepts_readings_and_updates_counters(self):
+        response = self.post([
+            self.reading(timestamp='2024-02-01T00:00:00Z', latitude='30.2672', quality_score='0.95'),
+            self.reading(value='43', timestamp='2024-02-01T00:01:00Z'),
+        ])
+        self.assertEqual(response.json()['accepted'], 2)
+        self.sensor.refresh_from_db()
+        self.assertEqual(self.sensor.reading_count, 2)
+        self.assertEqual(self.sensor.current_value, '43')
+
+    def test_staff_sessions_need_a_csrf_token(self):
+        staff = CustomUser.objects.create_user(username='staff', email='staff@example.com', password='pw', is_staff=True)
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(staff)
+        url = reverse('sensor_readings_ingest')
+        # What a cross-site form can send: the session cookie and a text/plain body
+        body = json.dumps(self.reading())
+        response = client.post(url, body, content_type='text/plain', secure=True)
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(SensorReading.objects.exists())
+
+        client.cookies['csrftoken'] = token = 'a' * 32
+        response = client.post(url, body, content_type='application/json', secure=True,
+                               HTTP_X_CSRFTOKEN=token, HTTP_REFERER='https://testserver/')
+        self.assertEqual(response.status_code, 200)
+        # Devices need no CSRF token, whoever else is signed in
+        response = client.post(url, body, content_type='application/json', secure=True,
+                               HTTP_X_SENSOR_TOKEN='device-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Client().post(url, body, content_type='application/json', secure=True).status_code, 401)
+
+    def test_rejects_unknown_sensor_and_missing_value(self):
+        response = self.post([{'sensor': 'not-a-sensor', 'value': '1'}, self.reading(value='')])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['rejected'], 2)
+
+    def test_rejects_impossible_timestamp(self):
+        self.assert_only_first_rejected(self.reading(timestamp='2024-02-30T00:00:00Z'), 'Invalid timestamp')
+
+    def test_rejects_non_finite_decimals(self):
+        self.assert_only_first_rejected(self.reading(quality_score='nan'), 'Invalid quality_score')
+        self.assert_only_first_rejected(self.reading(altitude='Infinity'), 'Invalid altitude')
+
+    def test_rejects_out_of_range_quality_score(self):
+        self.assert_only_first_rejected(self.reading(quality_score='1.5'), 'quality_score must be between')
+
+    def test_rejects_out_of_range_coordinates(self):
+        self.assert_only_first_rejected(self.reading(latitude='91'), 'latitude must be between')
+        self.assert_only_first_rejected(self.reading(longitude='-180.5'), 'longitude must be between')
+
+    def test_rejects_values_too_large_for_column(self):
+        self.assert_only_first_rejected(self.reading(altitude='123456789'), 'Invalid altitude')
+
+    def test_rejects_json_nan_constants(self):
+        response = self.client.post(
+            reverse('sensor_readings_ingest'), f'[{{"sensor": "{self.sensor.pk}", "value": NaN}}]',
+            content_type='application/json', secure=True, HTTP_X_SENSOR_TOKEN='device-token',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(SensorReading.objects.exists())
+
+    def test_failed_request_stores_nothing(self):
+        readings = [self.reading(value=str(value)) for value in range(5)]
+        with mock.patch('rentals.sensor_service.apply_batch_to_sensors', side_effect=[1, 1, DatabaseError]):
+            with self.assertRaises(DatabaseError):
+                ingest_readings(readings, batch_size=2)
+        self.assertFalse(SensorReading.objects.exists())
+        self.sensor.refresh_from_db()
+        self.assertEqual(self.sensor.reading_count, 0)
+
+
+class SensorReadingValueTests(TestCase):
+    """Typed numeric_value/payload derived from the raw reading string"""
+
+    def setUp(self):
+        self.sensor = Sensor.objects.create(name='Tracker', sensor_type='gps')
+
+    def test_parse_reading_value(self):
+        self.assertEqual(parse_reading_value(' 21.5 '), (21.5, None))
+        self.assertEqual(parse_reading_value(7), (7.0, None))
+        self.assertEqual(parse_reading_value('30.2672, -97.7431'), (None, {'lat': 30.2672, 'lng': -97.7431}))
+        for value in (None, '', 'on', 'nan', 'inf', '1,2,3', 'a,b'):
+            self.assertEqual(parse_reading_value(value), (None, None), value)
+
+    def test_edited_value_is_parsed_again(self):
+        reading = SensorReading.objects.create(sensor=self.sensor, value='21.5')
+        self.assertEqual((reading.numeric_value, reading.payload), (21.5, None))
+
+        reading = SensorReading.objects.get(pk=reading.pk)
+        reading.value = '30.2672,-97.7431'
+        reading.save()
+        reading.refresh_from_db()
+        self.assertEqual((reading.numeric_value, reading.payload), (None, {'lat': 30.2672, 'lng': -97.7431}))
+
+        reading.value = '19'
+        reading.save(update_fields=['value'])
+        reading.refresh_from_db()
+        self.assertEqual((reading.numeric_value, reading.payload), (19.0, None))
+
+    def test_precomputed_fields_kept(self):
+        payload = {'lat': 1.0, 'lng': 2.0, 'speed': 30}
+        reading = SensorReading.objects.create(sensor=self.sensor, value='1,2', payload=payload)
+        reading.unit = 'deg'
+        reading.save()
+        reading.refresh_from_db()
+        self.assertEqual(reading.payload, payload)
+
+    def test_backfill_migration(self):
+        migration = import_module('rentals.migrations.0008_backfill_sensor_reading_values')
+        SensorReading.objects.bulk_create([
+            SensorReading(sensor=self.sensor, value=value)
+            for value in ('1.5', 'open', '30.2672,-97.7431', '-4', 'nan')
+        ])
+        SensorReading.objects.bulk_create([SensorReading(sensor=self.sensor, value='8', numeric_value=9)])
+        with mock.patch.object(migration, 'BATCH_SIZE', 2):
+            migration.backfill_typed_values(apps, None)
+        self.assertEqual(
+            {value: (number, payload) for value, number, payload in
+             SensorReading.objects.values_list('value', 'numeric_value', 'payload')},
+            {
+                '1.5': (1.5, None), 'open': (None, None), '30.2672,-97.7431': (None, {'lat': 30.2672, 'lng': -97.7431}),
+                '-4': (-4.0, None), 'nan': (None, None), '8': (9.0, None),
+            },
+        )
+
+
+class SensorRetentionTests(TestCase):
+    """Hourly/daily rollups and pruning of raw readings (rentals/sensor_retention.py)"""
+
+    def setUp(self):
+        self.sensor = Sensor.objects.create(name='Tracker', sensor_type='battery')
+        self.now = datetime(2024, 6, 10, 12, 30, tzinfo=dt_timezone.utc)
+
+    def add_readings(self, start, values, step=timedelta(minutes=10)):
+        SensorReading.objects.bulk_create([
+            SensorReading(sensor=self.sensor, value=str(value), numeric_value=value, timestamp=start + step * index)
+            for index, value in enumerate(values)
+        ])
+        Sensor.objects.filter(pk=self.sensor.pk).update(reading_count=SensorReading.objects.count())
+
+    def test_refresh_rollups_aggregates_complete_hours(self):
+        self.add_readings(datetime(2024, 6, 10, 9, tzinfo=dt_timezone.utc), [1, 2, 3, 4, 5, 6, 10, 20])
+        hourly, daily = refresh_rollups(now=self.now)
+        self.assertEqual((hourly, daily), (2, 1))
+        nine = SensorReadingRollup.objects.get(resolution='hour', bucket_start__hour=9)
+        self.assertEqual((nine.reading_count, nine.min_value, nine.max_value, nine.avg_value), (6, 1, 6, 3.5))
+        day = SensorReadingRollup.objects.get(resolution='day')
+        self.assertEqual((day.reading_count, day.sum_value), (8, 51))
+        self.assertEqual(rolled_through(), datetime(2024, 6, 10, 11, tzinfo=dt_timezone.utc))
+
+    def test_refresh_is_incremental(self):
+        self.add_readings(datetime(2024, 6, 10, 9, tzinfo=dt_timezone.utc), [1, 2])
+        refresh_rollups(now=self.now)
+        self.add_readings(datetime(2024, 6, 10, 11, tzinfo=dt_timezone.utc), [7])
+        refresh_rollups(now=self.now)
+        self.assertEqual(SensorReadingRollup.objects.filter(resolution='hour').count(), 2)
+        self.assertEqual(SensorReadingRollup.objects.get(resolution='day').reading_count, 3)
+
+    def test_retention_prunes_only_rolled_up_expired_readings(self):
+        self.add_readings(self.now - timedelta(days=40), [1, 2, 3])
+        self.add_readings(self.now - timedelta(hours=5), [4, 5])
+        summary = run_retention(now=self.now, raw_days=30)
+        self.assertEqual(summary['readings_pruned'], 3)
+        self.assertEqual(SensorReading.objects.count(), 2)
+        self.sensor.refresh_from_db()
+        self.assertEqual(self.sensor.reading_count, 2)
+        # The expired hour survives as rollups
+        self.assertEqual(SensorReadingRollup.objects.filter(resolution='day').count(), 2)
+
+    def test_retention_without_rollups_prunes_nothing(self):
+        self.add_readings(self.now - timedelta(days=40), [1, 2, 3])
+        summary = run_retention(now=self.now, raw_days=30, rollup=False)
+        self.assertEqual(summary['readings_pruned'], 0)
+        self.assertEqual(SensorReading.objects.count(), 3)
+
+
+class SensorSeriesTests(TestCase):
+    """Downsampled chart series (rentals/sensor_series.py)"""
+
+    def setUp(self):
+        self.sensor = Sensor.objects.create(name='Tracker', sensor_type='battery')
+        self.now = timezone.now().replace(microsecond=0)
+
+    def add_readings(self, start, count, step=timedelta(minutes=1)):
+        SensorReading.objects.bulk_create([
+            SensorReading(sensor=self.sensor, value=str(index), numeric_value=index, timestamp=start + step * index)
+            for index in range(count)
+        ])
+
+    def test_lttb_keeps_endpoints_and_peaks(self):
+        start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        points = [(start + timedelta(minutes=i), 100.0 if i == 50 else 0.0) for i in range(100)]
+        sampled = lttb(points, 10)
+        self.assertEqual(len(sampled), 10)
+        self.assertEqual((sampled[0], sampled[-1]), (points[0], points[-1]))
+        self.assertIn(points[50], sampled)
+
+    def test_short_range_returns_raw_readings(self):
+        start = self.now - timedelta(hours=1)
+        self.add_readings(start, 30)
+        series = sensor_series(self.sensor, start, self.now, max_points=100, now=self.now)
+        self.assertEqual(series['resolution'], 'raw')
+        self.assertEqual(len(series['points']), 30)
+        self.assertEqual(series['points'][1][1:], [1.0, 1.0, 1.0, 1])
+
+    @mock.patch('rentals.sensor_series.RAW_ROWS_PER_POINT', 1)
+    def test_dense_raw_range_is_bucketed_in_the_database(self):
+        start = (self.now - timedelta(hours=3)).replace(minute=0, second=0)
+        self.add_readings(start, 120)
+        series = sensor_series(self.sensor, start, start + timedelta(hours=2), max_points=20, now=self.now)
+        self.assertEqual(series['resolution'], 'raw')
+        # 120 readings over 2 hours, more than 20 rows: averaged per hour
+        self.assertEqual([point[4] for point in series['points']], [60, 60])
+        self.assertEqual(series['points'][0][1:4], [29.5, 0.0, 59.0])
+
+    @mock.patch('rentals.sensor_series.RAW_ROWS_PER_POINT', 1)
+    def test_long_range_without_rollups_is_bounded(self):
+        start = self.now - timedelta(days=5)
+        self.add_readings(start, 500, step=timedelta(minutes=10))
+        series = sensor_series(self.sensor, start, self.now, max_points=10, now=self.now)
+        self.assertEqual(series['resolution'], 'hour')
+        self.assertLessEqual(len(series['points']), 10)
+        self.assertEqual(sum(point[4] for point in series['points']), 500)
+
+
+class SensorAlertTests(TestCase):
+    """Alert rule evaluation and stale sensor detection (rentals/sensor_alerts.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        category = EquipmentCategory.objects.create(name='Consoles')
+        cls.equipment = Equipment.objects.create(
+            owner=cls.owner, category=category, title='PlayStation 5', description='Disc edition',
+            brand='Sony', model='CFI-1215A', condition='excellent', daily_rate=Decimal('15.00'),
+            location_city='Austin', location_state='TX', status='active',
+        )
+
+    def sensor(self, name, minutes_ago=None, interval=10, threshold='{"stale_intervals": 3}', **fields):
+        last_reading = self.now - timedelta(minutes=minutes_ago) if minutes_ago is not None else None
+        return Sensor.objects.create(
+            name=name, sensor_type='usage', equipment=self.equipment, reading_interval_minutes=interval,
+            alert_threshold=threshold, last_reading=last_reading, **fields,
+        )
+
+    def setUp(self):
+        self.now = timezone.now()
+
+    def test_owner_notified_once_per_alert_episode(self):
+        sensor = Sensor.objects.create(name='Battery', sensor_type='battery', equipment=self.equipment)
+        start = self.now - timedelta(hours=1)
+        readings = [
+            {'sensor': str(sensor.pk), 'value': str(value), 'timestamp': (start + timedelta(minutes=i)).isoformat()}
+            for i, value in enumerate([50, 5, 4, 50, 3])
+        ]
+        summary = ingest_readings(readings)
+        self.assertEqual((summary['alerts'], summary['notifications']), (3, 2))
+        self.assertEqual(Message.objects.filter(recipient=self.owner, is_system_message=True).count(), 2)
+        self.assertTrue(SensorReading.objects.get(value='3').is_alert)
+
+    def test_alert_message_time_in_utc(self):
+        sensor = Sensor.objects.create(name='Battery', sensor_type='battery', equipment=self.equipment)
+        ingest_readings([{'sensor': str(sensor.pk), 'value': '3', 'timestamp': '2026-10-01T08:15:00+05:30'}])
+        message = Message.objects.get(recipient=self.owner, is_system_message=True)
+        self.assertIn('reported 3 at 2026-10-01 02:45 UTC', message.message)
+
+    def test_stale_sensors_filtered_in_the_database(self):
+        just_silent = self.sensor('just silent', minutes_ago=35)
+        hourly = self.sensor('hourly', minutes_ago=185, interval=60)
+        self.sensor('long silent', minutes_ago=60)
+        self.sensor('reporting', minutes_ago=5)
+        self.sensor('never reported')
+        self.sensor('no rule', minutes_ago=35, threshold='')
+        self.sensor('inactive', minutes_ago=35, is_active=False)
+        # the distinct rule combinations, then the matching sensors
+        with self.assertNumQueries(2):
+            stale = {sensor.pk: silent_for for sensor, silent_for in stale_sensors(self.now, timedelta(minutes=15))}
+        self.assertEqual(set(stale), {just_silent.pk, hourly.pk})
+        self.assertEqual(stale[hourly.pk], timedelta(minutes=185))
+
+
+class CatalogSearchTests(TestCase):
+    """The catalog page compiles EquipmentFilterForm into a search (rentals/search.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        cls.category = EquipmentCategory.objects.create(name='Consoles')
+        cls.series_x = cls.listing('Xbox Series X', '20.00', 'Microsoft console')
+        cls.pad = cls.listing('Wireless controller', '5.00', 'Works with the Xbox Series X and PC')
+        cls.ps5 = cls.listing('PlayStation 5', '15.00', 'Sony console')
+
+    @classmethod
+    def listing(cls, title, daily_rate, description):
+        return Equipment.objects.create(
+            owner=cls.owner, category=cls.category, title=title, description=description,
+            brand='Brand', model='Model', condition='excellent', daily_rate=Decimal(daily_rate),
+            location_city='Austin', location_state='TX', status='active',
+        )
+
+    def setUp(self):
+        # Signed in, so responses are rendered rather than served from the anonymous page cache
+        self.client.force_login(self.owner)
+
+    def titles(self, **params):
+        response = self.client.get(reverse('equipment_list'), params, secure=True)
+        self.assertEqual(response.status_code, 200)
+        return [equipment.title for equipment in response.context['page']]
+
+    def test_search_and_filters(self):
+        self.assertEqual(set(self.titles(search='xbox')), {'Xbox Series X', 'Wireless controller'})
+        self.assertEqual(self.titles(search='xbox', max_price='10'), ['Wireless controller'])
+
+    def test_invalid_filter_is_dropped_on_its_own(self):
+        self.assertEqual(set(self.titles(search='xbox', min_price='cheap')), {'Xbox Series X', 'Wireless controller'})
+        self.assertEqual(self.titles(search='sony', condition='mint', max_price='16'), ['PlayStation 5'])
+
+    def test_searches_default_to_best_match(self):
+        self.assertEqual(self.titles(search='xbox'), ['Xbox Series X', 'Wireless controller'])
+        self.assertEqual(self.titles(search='xbox', sort_by='relevance'), ['Xbox Series X', 'Wireless controller'])
+        self.assertEqual(self.titles(search='xbox', sort_by='price_low'), ['Wireless controller', 'Xbox Series X'])
+        form = self.client.get(reverse('equipment_list'), {'search': 'xbox'}, secure=True).context['form']
+        self.assertEqual(form['sort_by'].value(), 'relevance')
+
+    def test_browsing_defaults_to_newest(self):
+        form = self.client.get(reverse('equipment_list'), {'condition': 'excellent'}, secure=True).context['form']
+        self.assertEqual(form['sort_by'].value(), 'newest')
+        self.assertEqual(self.titles(condition='excellent'), ['PlayStation 5', 'Wireless controller', 'Xbox Series X'])
+
+    def test_index_rebuilt_after_rentals_migrations(self):
+        if full_text_backend() != 'fts5':
+            self.skipTest('needs SQLite with FTS5')
+        # What a SQLite table rebuild does: rowids renumbered, sync triggers gone
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE rentals_equipment SET rowid = rowid + 1000')
+            cursor.execute('DROP TRIGGER rentals_equipment_fts_ai')
+        self.assertEqual(self.titles(search='xbox'), [])
+
+        plan = [(migrations.Migration('0099_example', 'rentals'), False)]
+        self.assertFalse(reindex_after_migrate('default', [(migrations.Migration('0099_example', 'auth'), False)]))
+        self.assertTrue(reindex_after_migrate('default', plan))
+        self.assertEqual(set(self.titles(search='xbox')), {'Xbox Series X', 'Wireless controller'})
+        self.listing('Xbox One', '8.00', 'Older console')
+        self.assertIn('Xbox One', self.titles(search='xbox'))
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages (rentals/pagination.py) walk the catalog without gaps or repeats"""
+    ORDERING = ['-created_at', '-id']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        category = EquipmentCategory.objects.create(name='Consoles')
+        cls.listings = [
+            Equipment.objects.create(
+                owner=cls.owner, category=category, title=f'Console {i}', description='Console',
+                brand='Brand', model='Model', condition='good', daily_rate=Decimal('10.00'),
+                location_city='Austin', location_state='TX', status='active',
+            )
+            for i in range(7)
+        ]
+        # Ties on created_at are broken by id
+        Equipment.objects.filter(pk__in=[e.pk for e in cls.listings[:4]]).update(created_at=timezone.now())
+        cls.expected = list(Equipment.objects.order_by(*cls.ORDERING).values_list('pk', flat=True))
+
+    def ids(self, page):
+        return [equipment.pk for equipment in page]
+
+    def test_forward_and_back(self):
+        queryset = Equipment.objects.all()
+        first = keyset_page(queryset, self.ORDERING, per_page=3, count='exact')
+        self.assertEqual(self.ids(first), self.expected[:3])
+        self.assertEqual(first.count, 7)
+        self.assertFalse(first.has_previous())
+
+        second = keyset_page(queryset, self.ORDERING, cursor=first.next_cursor, per_page=3)
+        self.assertEqual(self.ids(second), self.expected[3:6])
+        third = keyset_page(queryset, self.ORDERING, cursor=second.next_cursor, per_page=3)
+        self.assertEqual(self.ids(third), self.expected[6:])
+        self.assertFalse(third.has_next())
+
+        back = keyset_page(queryset, self.ORDERING, cursor=third.previous_cursor, per_page=3)
+        self.assertEqual(self.ids(back), self.expected[3:6])
+        back = keyset_page(queryset, self.ORDERING, cursor=back.previous_cursor, per_page=3)
+        self.assertEqual(self.ids(back), self.expected[:3])
+        self.assertFalse(back.has_previous())
+        self.assertEqual(back.next_cursor, first.next_cursor)
+
+    def test_invalid_cursor(self):
+        for cursor in ('not a cursor', 'e30'):
+            with self.assertRaises(InvalidCursor):
+                keyset_page(Equipment.objects.all(), self.ORDERING, cursor=cursor)
+
+    def test_load_more_endpoint(self):
+        # Signed in, so responses are rendered rather than served from the anonymous page cache
+        self.client.force_login(self.owner)
+        url = reverse('load_more_equipment')
+        with mock.patch('rentals.views.search_page', partial(search_page, per_page=4)):
+            first = self.client.get(url, {'sort_by': 'newest'}, secure=True).json()
+            self.assertEqual(first['count'], 4)
+            rest = self.client.get(url, {'sort_by': 'newest', 'cursor': first['next_cursor']}, secure=True).json()
+        self.assertEqual(rest['count'], 3)
+        self.assertIsNone(rest['next_cursor'])
+        self.assertEqual(first['html'].count('Console ') + rest['html'].count('Console '), 7)
+
+        response = self.client.get(url, {'cursor': 'not a cursor'}, secure=True)
+        self.assertEqual(response.status_code, 400)
+
+
+class NearbySearchTests(TestCase):
+    """Radius search (rentals/nearby.py) finds listings by geohash prefilter and exact distance"""
+    AUSTIN = (30.2672, -97.7431)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        cls.category = EquipmentCategory.objects.create(name='Consoles')
+        cls.downtown = cls.listing('Downtown', 30.2680, -97.7420)
+        cls.round_rock = cls.listing('Round Rock', 30.5083, -97.6789)
+        cls.georgetown_delivery = cls.listing('Georgetown delivery', 30.6333, -97.6770, delivery_radius_km=50)
+        cls.georgetown = cls.listing('Georgetown', 30.6340, -97.6780)
+        cls.listing('Downtown draft', 30.2675, -97.7425, status='draft')
+        cls.listing('No location', None, None)
+
+    @classmethod
+    def listing(cls, title, latitude, longitude, delivery_radius_km=0, status='active'):
+        return Equipment.objects.create(
+            owner=cls.owner, category=cls.category, title=title, description='Console',
+            brand='Brand', model='Model', condition='good', daily_rate=Decimal('10.00'),
+            location_city='Austin', location_state='TX', status=status,
+            location_latitude=None if latitude is None else Decimal(str(latitude)),
+            location_longitude=None if longitude is None else Decimal(str(longitude)),
+            is_available_for_delivery=bool(delivery_radius_km), delivery_radius_km=delivery_radius_km,
+        )
+
+    def test_geohash(self):
+        self.assertEqual(geohash_encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(self.downtown.location_geohash, geohash_encode(30.2680, -97.7420))
+        self.assertIsNone(geohash_encode(None, 10))
+        self.assertIsNone(geohash_encode(91, 10))
+
+    def test_radius_and_delivery(self):
+        found = list(nearby_equipment(*self.AUSTIN, 30))
+        self.assertEqual([e.title for e in sorted(found, key=lambda e: e.distance_km)],
+                         ['Downtown', 'Round Rock', 'Georgetown delivery'])
+        self.assertEqual({e.title: e.delivers for e in found},
+                         {'Downtown': False, 'Round Rock': False, 'Georgetown delivery': True})
+        distances = {e.title: e.distance_km for e in found}
+        self.assertAlmostEqual(distances['Downtown'], 0.14, places=1)
+        self.assertAlmostEqual(distances['Georgetown delivery'], 41.2, places=0)
+
+        without_delivery = nearby_equipment(*self.AUSTIN, 30, include_delivery=False)
+        self.assertEqual({e.title for e in without_delivery}, {'Downtown', 'Round Rock'})
+        self.assertEqual({e.title for e in nearby_equipment(*self.AUSTIN, 1, include_delivery=False)}, {'Downtown'})
+
+    def test_across_the_antimeridian(self):
+        fiji = self.listing('Fiji', -17.0, -179.95)
+        self.assertEqual(list(nearby_equipment(-17.0, 179.95, 20)), [fiji])
+
+    def test_pages_closest_first(self):
+        first = nearby_page(*self.AUSTIN, 45, per_page=2)
+        self.assertEqual([e.title for e in first], ['Downtown', 'Round Rock'])
+        rest = nearby_page(*self.AUSTIN, 45, cursor=first.next_cursor, per_page=2)
+        self.assertEqual([e.title for e in rest], ['Georgetown delivery', 'Georgetown'])
+        self.assertFalse(rest.has_next())
+
+    def test_api(self):
+        url = reverse('equipment_nearby')
+        lat, lng = self.AUSTIN
+        data = self.client.get(url, {'lat': lat, 'lng': lng, 'radius_km': 30}, secure=True).json()
+        self.assertEqual([r['title'] for r in data['results']], ['Downtown', 'Round Rock', 'Georgetown delivery'])
+        self.assertEqual([r['delivers'] for r in data['results']], [False, False, True])
+        distances = [r['distance_km'] for r in data['results']]
+        self.assertEqual(distances, sorted(distances))
+
+        for params in ({'lat': lat}, {'lat': 'x', 'lng': lng}, {'lat': lat, 'lng': lng, 'radius_km': 0},
+                       {'lat': 95, 'lng': lng}, {'lat': lat, 'lng': lng, 'cursor': 'bad'}):
+            self.assertEqual(self.client.get(url, params, secure=True).status_code, 400, params)
+
+
+class CatalogFacetTests(TestCase):
+    """Facet counts (rentals/facets.py) are disjunctive and follow catalog edits"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        cls.consoles = EquipmentCategory.objects.create(name='Consoles')
+        cls.accessories = EquipmentCategory.objects.create(name='Accessories')
+        cls.listing(cls.consoles, 'excellent', '20.00')
+        cls.listing(cls.consoles, 'good', '60.00', delivery=True)
+        cls.listing(cls.accessories, 'good', '5.00')
+        cls.listing(cls.consoles, 'excellent', '20.00', status='draft')
+
+    @classmethod
+    def listing(cls, category, condition, daily_rate, delivery=False, status='active'):
+        return Equipment.objects.create(
+            owner=cls.owner, category=category, title=f'{category.name} {condition}', description='Console',
+            brand='Brand', model='Model', condition=condition, daily_rate=Decimal(daily_rate),
+            location_city='Austin', location_state='TX', status=status, is_available_for_delivery=delivery,
+        )
+
+    def counts(self, facets, name, key='label'):
+        return {entry[key]: entry['count'] for entry in facets[name]}
+
+    def test_unfiltered(self):
+        facets = compute_facets({})
+        self.assertEqual(facets['total'], 3)
+        self.assertEqual(self.counts(facets, 'category'), {'Consoles': 2, 'Accessories': 1})
+        self.assertEqual(self.counts(facets, 'condition', 'value'), {'excellent': 1, 'good': 2})
+        self.assertEqual(self.counts(facets, 'price'), {'Under $10': 1, '$10 - $25': 1, '$50 - $100': 1})
+        self.assertEqual((facets['pickup'], facets['delivery']), (3, 1))
+
+    def test_selected_facet_keeps_its_other_values(self):
+        facets = compute_facets({'condition': 'good'})
+        self.assertEqual(facets['total'], 2)
+        self.assertEqual(self.counts(facets, 'condition', 'value'), {'excellent': 1, 'good': 2})
+        self.assertEqual(self.counts(facets, 'category'), {'Consoles': 1, 'Accessories': 1})
+        self.assertEqual(self.counts(facets, 'price'), {'Under $10': 1, '$50 - $100': 1})
+
+        facets = compute_facets({'category': self.consoles, 'available_for_delivery': True})
+        self.assertEqual(facets['total'], 1)
+        self.assertEqual(self.counts(facets, 'category'), {'Consoles': 1})
+        self.assertEqual(facets['delivery'], 1)
+        self.assertEqual(facets['pickup'], 1)
+
+    def test_price_filter(self):
+        facets = compute_facets({'max_price': Decimal('25')})
+        self.assertEqual(facets['total'], 2)
+        self.assertEqual(self.counts(facets, 'category'), {'Consoles': 1, 'Accessories': 1})
+        self.assertEqual(self.counts(facets, 'price'), {'Under $10': 1, '$10 - $25': 1, '$50 - $100': 1})
+
+    def test_cached_counts_follow_catalog_edits(self):
+        cache.clear()
+        self.assertEqual(catalog_facets({})['total'], 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(catalog_facets({})['total'], 3)
+        self.listing(self.accessories, 'fair', '7.00')
+        self.assertEqual(catalog_facets({})['total'], 4)
+
+
+class AnonymousPageCacheTests(TestCase):
+    """Stale pages (rentals/caching.py) are re-rendered by one request at a time"""
+
+    def setUp(self):
+        cache.clear()
+        self.renders = []
+        self.fail_render = False
+
+        @cache_for_anonymous(CATALOG)
+        def view(request):
+            if self.fail_render:
+                raise RuntimeError('render failed')
+            self.renders.append(request)
+            return HttpResponse(f'render {len(self.renders)}')
+        self.view = view
+
+    def get(self):
+        request = RequestFactory().get('/catalog/')
+        request.user = AnonymousUser()
+        request._messages = []
+        return request
+
+    def test_stale_entry_served_while_one_request_rerenders(self):
+        self.assertEqual(self.view(self.get()).content, b'render 1')
+        self.assertEqual(self.view(self.get()).content, b'render 1')
+        bump_version(CATALOG)
+        lock = f'{page_key(CATALOG, self.get())}:lock'
+        cache.add(lock, 1)
+        self.assertEqual(self.view(self.get()).content, b'render 1')
+        cache.delete(lock)
+        self.assertEqual(self.view(self.get()).content, b'render 2')
+        self.assertEqual(len(self.renders), 2)
+
+    def test_lock_released_when_rendering_fails(self):
+        self.view(self.get())
+        bump_version(CATALOG)
+        self.fail_render = True
+        with self.assertRaises(RuntimeError):
+            self.view(self.get())
+        self.assertIsNone(cache.get(f'{page_key(CATALOG, self.get())}:lock'))
+        self.fail_render = False
+        self.assertEqual(self.view(self.get()).content, b'render 2')
+
+
+class PayPalTokenTests(TestCase):
+    """OAuth tokens (rentals/paypal_service.py) are fetched once and replaced when rejected"""
+
+    def setUp(self):
+        cache.clear()
+        self.fake = FakePayPalServer().start()
+        self.addCleanup(self.fake.stop)
+        configured = override_settings(PAYPAL_BASE_URL=self.fake.url)
+        configured.enable()
+        self.addCleanup(configured.disable)
+
+    def token_requests(self):
+        return self.fake.stats['POST /v1/oauth2/token']
+
+    def test_token_reused_across_calls_and_workers(self):
+        token = PayPalService().get_access_token()
+        self.assertEqual(PayPalService().get_access_token(), token)
+        # Another worker: nothing in its memory, the token comes from the shared cache
+        token_store.clear()
+        self.assertEqual(PayPalService().get_access_token(), token)
+        self.assertEqual(self.token_requests(), 1)
+
+    def test_token_replaced_before_it_expires(self):
+        self.fake.token_ttl = 200
+        with override_settings(PAYPAL_TOKEN_REFRESH_SECONDS=300):
+            service = PayPalService()
+            first = service.get_access_token()
+            self.assertNotEqual(service.get_access_token(), first)
+        self.assertEqual(self.token_requests(), 2)
+
+    def test_rejected_token_refetched_once(self):
+        service = PayPalService()
+        token = service.get_access_token()
+        self.fake.tokens.clear()
+        response = service._api_request('GET', f'{service.base_url}/v2/checkout/orders/UNKNOWN')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.token_requests(), 2)
+        self.assertNotEqual(service.get_access_token(), token)
+        self.assertEqual(self.fake.stats['GET /v2/checkout/orders/{id}'], 2)
+
+
+@override_settings(PAYPAL_MAX_RETRIES=2, PAYPAL_CONNECT_TIMEOUT=3.0, PAYPAL_READ_TIMEOUT=10.0)
+class PayPalTransportTests(TestCase):
+    """Idempotent PayPal calls are retried on transient failures (PayPalService._send)"""
+
+    def response(self, status, **headers):
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        return response
+
+    def send(self, *outcomes):
+        """_send against a session answering with outcomes in turn; records attempts and sleeps"""
+        self.session = mock.Mock()
+        self.session.request.side_effect = outcomes
+        service = PayPalService(base_url='https://paypal.test', session=self.session)
+        with mock.patch('rentals.paypal_service.time.sleep') as sleep:
+            try:
+                return service._send('GET', 'https://paypal.test/v2/checkout/orders/1')
+            finally:
+                self.sleeps = [call.args[0] for call in sleep.call_args_list]
+                self.attempts = self.session.request.call_count
+
+    def test_transient_failures_retried(self):
+        response = self.send(
+            self.response(503, **{'Retry-After': '1'}), requests.ConnectionError(), self.response(200),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.attempts, 3)
+        self.assertEqual(self.sleeps[0], 1.0)
+        self.assertEqual(self.session.request.call_args.kwargs['timeout'], (3.0, 10.0))
+
+    def test_gives_up_after_max_retries(self):
+        response = self.send(self.response(503), self.response(502), self.response(429))
+        self.assertEqual((response.status_code, self.attempts), (429, 3))
+        with self.assertRaises(requests.Timeout):
+            self.send(requests.Timeout(), requests.Timeout(), requests.Timeout())
+        self.assertEqual(self.attempts, 3)
+
+    def test_client_errors_not_retried(self):
+        response = self.send(self.response(422), self.response(200))
+        self.assertEqual((response.status_code, self.attempts), (422, 1))
+
+    def test_retry_delay(self):
+        self.assertEqual(retry_delay(1, self.response(429, **{'Retry-After': '2'})), 2.0)
+        self.assertEqual(retry_delay(1, self.response(429, **{'Retry-After': '600'})), 4)
+        for attempt in range(1, 6):
+            self.assertLessEqual(retry_delay(attempt, self.response(503, **{'Retry-After': 'soon'})),
+                                 min(4, 0.25 * 2 ** (attempt - 1)))
+
+
+@override_settings(JOB_RETRY_BACKOFF_SECONDS=30, JOB_LOCK_SECONDS=300)
+class JobQueueTests(TestCase):
+    """Jobs (rentals/jobs.py) run once per claim and are retried with backoff"""
+
+    def setUp(self):
+        self.handler = mock.Mock(return_value=None)
+        patcher = mock.patch('rentals.jobs.import_string', return_value=self.handler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def expire(self, job, field='locked_until'):
+        Job.objects.filter(pk=job.pk).update(**{field: timezone.now() - timedelta(seconds=1)})
+
+    def test_enqueue_dedupes_on_key(self):
+        first = enqueue('paypal.capture', {'payment_id': '1'}, key='capture:1')
+        self.assertEqual(enqueue('paypal.capture', {'payment_id': '2'}, key='capture:1'), first)
+        self.assertEqual(Job.objects.count(), 1)
+        with self.assertRaises(ValueError):
+            enqueue('unknown.kind')
+
+    def test_retried_with_backoff_until_success(self):
+        job = enqueue('paypal.capture')
+        self.handler.side_effect = [RuntimeError('PayPal down'), None]
+        started = timezone.now()
+        self.assertEqual(run_due_jobs('w1'), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), ('queued', 1, ''))
+        self.assertEqual(job.last_error, 'RuntimeError: PayPal down')
+        self.assertGreaterEqual(job.run_after, started + timedelta(seconds=15))
+        self.assertLessEqual(job.run_after, timezone.now() + timedelta(seconds=30))
+
+        self.assertEqual(run_due_jobs('w1'), 0)
+        self.expire(job, 'run_after')
+        self.assertEqual(run_due_jobs('w1'), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('succeeded', 2))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_permanent_error_and_last_attempt_fail_the_job(self):
+        permanent = enqueue('paypal.capture', max_attempts=5)
+        self.handler.side_effect = PermanentJobError('declined')
+        run_due_jobs('w1')
+        permanent.refresh_from_db()
+        self.assertEqual((permanent.status, permanent.attempts), ('failed', 1))
+
+        flaky = enqueue('paypal.capture', max_attempts=2)
+        self.handler.side_effect = RuntimeError('PayPal down')
+        run_due_jobs('w1')
+        self.expire(flaky, 'run_after')
+        run_due_jobs('w1')
+        flaky.refresh_from_db()
+        self.assertEqual((flaky.status, flaky.attempts), ('failed', 2))
+
+    def test_expired_claim_is_taken_over(self):
+        job = enqueue('paypal.capture')
+        [claimed] = claim_jobs('w1')
+        self.assertEqual(claim_jobs('w2'), [])
+        self.expire(job)
+        [taken_over] = claim_jobs('w2')
+        self.assertEqual(taken_over.attempts, 2)
+
+        # The first worker finishing late must not overwrite the second worker's claim
+        self.assertEqual(run_job(claimed), 'succeeded')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), ('running', 'w2'))
+
+    def test_batch_claims_renewed_before_each_job(self):
+        slow, waiting, lost = enqueue('paypal.capture'), enqueue('paypal.capture'), enqueue('paypal.capture')
+
+        def slow_first_job(job):
+            if job.pk == slow.pk:
+                # Outlasts the batch's claim: one waiting job is still ours, the other is taken over
+                self.expire(waiting)
+                self.expire(lost)
+                Job.objects.filter(pk=lost.pk).update(locked_by='w2')
+        self.handler.side_effect = slow_first_job
+
+        self.assertEqual(run_due_jobs('w1'), 2)
+        self.assertEqual([call.args[0].pk for call in self.handler.call_args_list], [slow.pk, waiting.pk])
+        lost.refresh_from_db()
+        self.assertEqual((lost.status, lost.locked_by), ('running', 'w2'))
+        waiting.refresh_from_db()
+        self.assertEqual(waiting.status, 'succeeded')
+
+
+class PayPalCaptureJobTests(TestCase):
+    """The capture job only captures payments still awaiting capture"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        cls.renter = CustomUser.objects.create_user(username='renter', email='renter@example.com', password='pw')
+        equipment = Equipment.objects.create(
+            owner=owner, category=EquipmentCategory.objects.create(name='Consoles'), title='Xbox Series X',
+            description='Console', brand='Microsoft', model='Series X', condition='good',
+            daily_rate=Decimal('10.00'), location_city='Austin', location_state='TX', status='active',
+        )
+        cls.rental = Rental.objects.create(
+            equipment=equipment, renter=cls.renter, owner=owner, start_date=date(2026, 11, 1),
+            end_date=date(2026, 11, 2), daily_rate=Decimal('10.00'), total_days=2, subtotal=Decimal('20.00'),
+            security_deposit=Decimal('0.00'), total_amount=Decimal('20.00'), status='approved',
+        )
+
+    def payment(self, status):
+        return Payment.objects.create(
+            rental=self.rental, payer=self.renter, payment_type='rental_payment', amount=Decimal('20.00'),
+            paypal_order_id=f'ORDER-{status}', status=status,
+        )
+
+    def test_only_payments_awaiting_capture_are_captured(self):
+        with mock.patch.object(PayPalService, 'capture_order') as capture_order:
+            capture_payment_job(Job(payload={'payment_id': str(self.payment('completed').pk)}))
+            for status in ('refunded', 'failed', 'disputed'):
+                payment = self.payment(status)
+                with self.assertRaises(PermanentJobError):
+                    capture_payment_job(Job(payload={'payment_id': str(payment.pk)}))
+                payment.refresh_from_db()
+                self.assertEqual(payment.status, status)
+        capture_order.assert_not_called()
+
+    def test_enqueued_capture_fails_for_refunded_payment(self):
+        payment = self.payment('pending')
+        job = enqueue_capture(payment)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'processing')
+        Payment.objects.filter(pk=payment.pk).update(status='refunded')
+        with mock.patch.object(PayPalService, 'capture_order') as capture_order:
+            self.assertEqual(run_due_jobs('w1'), 1)
+        capture_order.assert_not_called()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('refunded', job.last_error)
+
+
+@override_settings(PAYPAL_WEBHOOK_ID='WH-TEST', PAYPAL_CERT_CACHE_SECONDS=60)
+class PayPalWebhookTests(TestCase):
+    """Webhook deliveries (rentals/paypal_webhooks.py) are verified offline, stored once and queued"""
+    CERT_URL = 'https://api.paypal.com/v1/notifications/certs/CERT-TEST'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'messageverificationcerts.paypal.com')])
+        now = timezone.now()
+        certificate = x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(
+            cls.key.public_key()
+        ).serial_number(1).not_valid_before(now - timedelta(days=1)).not_valid_after(
+            now + timedelta(days=1)
+        ).sign(cls.key, hashes.SHA256())
+        cls.pem = certificate.public_bytes(serialization.Encoding.PEM)
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.dict(_certificates, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.session = mock.Mock()
+        self.session.get.return_value = mock.Mock(status_code=200, content=self.pem)
+        patcher = mock.patch('rentals.paypal_webhooks.get_http_session', return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def deliver(self, event, tamper=False):
+        body = json.dumps(event).encode()
+        message = f'TX-1|2026-10-17T10:00:00Z|WH-TEST|{zlib.crc32(body) & 0xffffffff}'.encode()
+        signature = self.key.sign(message, padding.PKCS1v15(), hashes.SHA256())
+        if tamper:
+            body = body.replace(b'ORDER-1', b'ORDER-2')
+        return self.client.post(reverse('paypal_webhook'), body, content_type='application/json', secure=True, headers={
+            'Paypal-Transmission-Id': 'TX-1',
+            'Paypal-Transmission-Time': '2026-10-17T10:00:00Z',
+            'Paypal-Transmission-Sig': base64.b64encode(signature).decode(),
+            'Paypal-Cert-Url': self.CERT_URL,
+            'Paypal-Auth-Algo': 'SHA256withRSA',
+        })
+
+    def test_signed_event_stored_once_and_queued(self):
+        event = {'id': 'WH-EVENT-1', 'event_type': 'CHECKOUT.ORDER.APPROVED', 'resource': {'id': 'ORDER-1'}}
+        self.assertEqual(self.deliver(event).json(), {'received': True, 'duplicate': False})
+        self.assertEqual(self.deliver(event).json(), {'received': True, 'duplicate': True})
+        self.assertEqual(PayPalWebhookEvent.objects.count(), 1)
+        self.assertEqual(Job.objects.filter(kind='paypal.webhook').count(), 1)
+        self.assertEqual(self.session.get.call_count, 1)
+
+        self.assertEqual(run_due_jobs('w1'), 1)
+        stored = PayPalWebhookEvent.objects.get()
+        self.assertEqual((stored.status, stored.error), ('ignored', 'No matching payment'))
+
+    def test_tampered_body_rejected(self):
+        event = {'id': 'WH-EVENT-1', 'event_type': 'CHECKOUT.ORDER.APPROVED', 'resource': {'id': 'ORDER-1'}}
+        self.assertEqual(self.deliver(event, tamper=True).status_code, 400)
+        self.assertFalse(PayPalWebhookEvent.objects.exists())
+
+    def test_certificates_only_fetched_from_paypal(self):
+        for url in ('https://evil.example.com/cert.pem', 'https://paypal.com.evil.example/cert.pem',
+                    'http://api.paypal.com/v1/notifications/certs/CERT-TEST'):
+            with self.assertRaises(WebhookVerificationError):
+                get_certificate(url)
+        self.session.get.assert_not_called()
+
+    def test_certificate_cache_expires(self):
+        now = timezone.now()
+        get_certificate(self.CERT_URL)
+        with mock.patch('rentals.paypal_webhooks.timezone.now', return_value=now + timedelta(seconds=30)):
+            cache.clear()
+            get_certificate(self.CERT_URL)
+            self.assertEqual(self.session.get.call_count, 1)
+        with mock.patch('rentals.paypal_webhooks.timezone.now', return_value=now + timedelta(seconds=61)):
+            get_certificate(self.CERT_URL)
+            self.assertEqual(self.session.get.call_count, 2)
+        # Another worker reading the shared cache keeps the first fetch's expiry
+        _certificates.clear()
+        with mock.patch('rentals.paypal_webhooks.timezone.now', return_value=now + timedelta(seconds=62)):
+            get_certificate(self.CERT_URL)
+            self.assertEqual(self.session.get.call_count, 2)
+            self.assertLessEqual(_certificates[self.CERT_URL][1], now + timedelta(seconds=122))
+
+
+class PaymentReconciliationTests(TestCase):
+    """Reconciliation (rentals/reconciliation.py) reports each kind of discrepancy"""
+    EXPORT = (
+        'Date,Time,Name,Type,Status,Gross,Transaction ID,Order ID\n'
+        '10/01/2026,10:00:00,Buyer,Express Checkout Payment,Completed,20.00,C1,O1\n'
+        '10/01/2026,10:05:00,Buyer,Express Checkout Payment,Completed,"25.00",C2,O2\n'
+        '10/01/2026,10:10:00,Buyer,Express Checkout Payment,Completed,20.00,C3,O3\n'
+        '10/01/2026,10:15:00,Buyer,Express Checkout Payment,Completed,20.00,C4,O4\n'
+        '10/01/2026,10:20:00,Buyer,Express Checkout Payment,Refunded,20.00,C6,O6\n'
+        '10/01/2026,10:21:00,Buyer,Payment Refund,Completed,-20.00,R6,O6\n'
+        '10/01/2026,10:25:00,Buyer,Express Checkout Payment,Completed,"1,000.00",C9,O9\n'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        cls.renter = CustomUser.objects.create_user(username='renter', email='renter@example.com', password='pw')
+        equipment = Equipment.objects.create(
+            owner=owner, category=EquipmentCategory.objects.create(name='Consoles'), title='Xbox Series X',
+            description='Console', brand='Microsoft', model='Series X', condition='good',
+            daily_rate=Decimal('10.00'), location_city='Austin', location_state='TX', status='active',
+        )
+        cls.rental = Rental.objects.create(
+            equipment=equipment, renter=cls.renter, owner=owner, start_date=date(2026, 10, 5),
+            end_date=date(2026, 10, 6), daily_rate=Decimal('10.00'), total_days=2, subtotal=Decimal('20.00'),
+            security_deposit=Decimal('0.00'), total_amount=Decimal('20.00'), status='confirmed',
+        )
+        cls.start = datetime(2026, 10, 1, tzinfo=dt_timezone.utc)
+        cls.end = datetime(2026, 10, 2, tzinfo=dt_timezone.utc)
+        processed = cls.start + timedelta(hours=10)
+        cls.payment('O1', 'C1', 'completed', processed)
+        cls.payment('O2', 'C2', 'completed', processed)
+        cls.payment('O3', None, 'pending', None)
+        cls.payment('O4', 'C4-OLD', 'completed', processed)
+        cls.payment('O5', 'C5', 'completed', processed)
+        cls.payment('O6', 'C6', 'refunded', processed)
+        cls.payment('O7', 'C7', 'completed', cls.end + timedelta(days=1))
+
+    @classmethod
+    def payment(cls, order_id, capture_id, status, processed_at):
+        return Payment.objects.create(
+            rental=cls.rental, payer=cls.renter, payment_type='rental_payment', amount=Decimal('20.00'),
+            paypal_order_id=order_id, paypal_capture_id=capture_id, status=status, processed_at=processed_at,
+        )
+
+    def test_discrepancies_reported(self):
+        output = io.StringIO()
+        records = iter_csv_export(io.StringIO(self.EXPORT))
+        summary = reconcile_payments(records, output, self.start, self.end, batch_size=2)
+        self.assertEqual(dict(summary), {
+            'transactions': 6, 'matched': 5, 'missing_locally': 1, 'amount_mismatch': 1,
+            'status_mismatch': 1, 'capture_id_mismatch': 2, 'missing_in_paypal': 1,
+        })
+
+        rows = list(csv.DictReader(io.StringIO(output.getvalue())))
+        self.assertEqual(sorted((row['kind'], row['paypal_order_id']) for row in rows), [
+            ('amount_mismatch', 'O2'),
+            ('capture_id_mismatch', 'O3'),
+            ('capture_id_mismatch', 'O4'),
+            ('missing_in_paypal', 'O5'),
+            ('missing_locally', 'O9'),
+            ('status_mismatch', 'O3'),
+        ])
+        missing = next(row for row in rows if row['kind'] == 'missing_locally')
+        self.assertEqual((missing['paypal_capture_id'], missing['paypal_amount']), ('C9', '1000.00'))
+
+    def test_without_period_payments_are_only_matched(self):
+        summary = reconcile_payments(iter_csv_export(io.StringIO(self.EXPORT)), io.StringIO())
+        self.assertNotIn('missing_in_paypal', summary)
+        self.assertEqual(summary['matched'], 5)
+
+
+class AvailabilityTests(TestCase):
+    """Bookings (rentals/availability.py) hold equipment for half-open [start_date, end_date)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        cls.renter = CustomUser.objects.create_user(username='renter', email='renter@example.com', password='pw')
+        category = EquipmentCategory.objects.create(name='Consoles')
+        cls.xbox, cls.ps5 = [
+            Equipment.objects.create(
+                owner=cls.owner, category=category, title=title, description='Console', brand='Brand',
+                model='Model', condition='good', daily_rate=Decimal('10.00'), location_city='Austin',
+                location_state='TX', status='active',
+            )
+            for title in ('Xbox Series X', 'PlayStation 5')
+        ]
+        cls.booked = cls.rental(cls.xbox, 10, 13, 'confirmed')
+        cls.rental(cls.xbox, 20, 22, 'pending')
+        cls.rental(cls.ps5, 10, 13, 'cancelled')
+
+    @classmethod
+    def rental(cls, equipment, first_day, return_day, status):
+        start, end = date(2026, 11, first_day), date(2026, 11, return_day)
+        return Rental.objects.create(
+            equipment=equipment, renter=cls.renter, owner=cls.owner, start_date=start, end_date=end,
+            daily_rate=Decimal('10.00'), total_days=(end - start).days, subtotal=Decimal('30.00'),
+            security_deposit=Decimal('0.00'), total_amount=Decimal('30.00'), status=status,
+        )
+
+    def test_adjacent_bookings_do_not_overlap(self):
+        self.assertTrue(is_available(self.xbox, date(2026, 11, 13), date(2026, 11, 15)))
+        self.assertTrue(is_available(self.xbox, date(2026, 11, 7), date(2026, 11, 10)))
+        self.assertFalse(is_available(self.xbox, date(2026, 11, 12), date(2026, 11, 14)))
+        self.assertFalse(is_available(self.xbox, date(2026, 11, 9), date(2026, 11, 14)))
+        self.assertTrue(is_available(self.xbox, date(2026, 11, 12), date(2026, 11, 14), exclude_rental=self.booked))
+        with self.assertRaises(ValueError):
+            is_available(self.xbox, date(2026, 11, 14), date(2026, 11, 14))
+
+    def test_non_blocking_statuses_ignored(self):
+        self.assertTrue(is_available(self.xbox, date(2026, 11, 20), date(2026, 11, 22)))
+        free = available_equipment(date(2026, 11, 10), date(2026, 11, 13), Equipment.objects.all())
+        self.assertEqual(list(free), [self.ps5])
+
+    def test_booked_intervals_merged(self):
+        self.rental(self.xbox, 13, 15, 'approved')
+        self.rental(self.xbox, 25, 27, 'active')
+        self.assertEqual(booked_intervals(self.xbox), [
+            (date(2026, 11, 10), date(2026, 11, 15)), (date(2026, 11, 25), date(2026, 11, 27)),
+        ])
+        self.assertEqual(booked_intervals(self.xbox, start=date(2026, 11, 15)), [(date(2026, 11, 25), date(2026, 11, 27))])
+        self.assertEqual(booked_intervals(self.xbox, end=date(2026, 11, 10)), [])
+        self.assertEqual(booked_intervals(self.ps5), [])
+
+    def test_hold_rental(self):
+        clash = self.rental(self.xbox, 12, 14, 'pending')
+        with self.assertRaises(BookingConflict):
+            hold_rental(clash, 'approved')
+        clash.refresh_from_db()
+        self.assertEqual(clash.status, 'pending')
+
+        later = self.rental(self.xbox, 13, 16, 'pending')
+        hold_rental(later, 'approved')
+        later.refresh_from_db()
+        self.assertEqual(later.status, 'approved')
+        with self.assertRaises(ValueError):
+            hold_rental(clash, 'completed')
+
+    def test_api(self):
+        url = reverse('equipment_availability')
+        data = self.client.get(url, {'start': '2026-11-13', 'end': '2026-11-15'}, secure=True).json()
+        self.assertEqual(set(data['available']), {str(self.xbox.pk), str(self.ps5.pk)})
+        data = self.client.get(url, {'start': '2026-11-12', 'end': '2026-11-14', 'id': f'{self.xbox.pk},{self.ps5.pk}'},
+                               secure=True).json()
+        self.assertEqual(data['available'], [str(self.ps5.pk)])
+
+        for params in ({'start': '2026-11-12'}, {'start': '2026-11-31', 'end': '2026-12-02'},
+                       {'start': 'soon', 'end': '2026-11-14'}, {'start': '2026-11-14', 'end': '2026-11-14'},
+                       {'start': '2026-11-12', 'end': '2026-11-14', 'id': 'xbox'}):
+            self.assertEqual(self.client.get(url, params, secure=True).status_code, 400, params)
+
+    def test_migration_lists_existing_double_bookings(self):
+        migration = import_module('rentals.migrations.0010_rental_booked_intervals')
+        schema_editor = mock.Mock()
+        schema_editor.connection.vendor = 'postgresql'
+        schema_editor.connection.alias = 'default'
+        migration.check_no_double_bookings(apps, schema_editor)
+
+        clash = self.rental(self.xbox, 12, 14, 'active')
+        with self.assertRaisesMessage(RuntimeError, '2 approved/payment_pending/confirmed/active rentals') as caught:
+            migration.check_no_double_bookings(apps, schema_editor)
+        for rental in (self.booked, clash):
+            self.assertIn(str(rental.pk), str(caught.exception))
+        # Elsewhere the constraint is neither created nor validated
+        schema_editor.connection.vendor = 'sqlite'
+        migration.check_no_double_bookings(apps, schema_editor)
+        clash.validate_constraints()
+
+
+@override_settings(VIEW_COUNT_FLUSH_SECONDS=3600, VIEW_COUNT_FLUSH_MAX_PENDING=3)
+class ViewCountTests(TestCase):
+    """Listing views (rentals/view_counts.py) are buffered and added to view_count in bulk"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        category = EquipmentCategory.objects.create(name='Consoles')
+        cls.xbox, cls.ps5, cls.switch = [
+            Equipment.objects.create(
+                owner=owner, category=category, title=title, description='Console', brand='Brand',
+                model='Model', condition='good', daily_rate=Decimal('10.00'), location_city='Austin',
+                location_state='TX', status='active', view_count=5,
+            )
+            for title in ('Xbox Series X', 'PlayStation 5', 'Switch')
+        ]
+
+    def setUp(self):
+        cache.clear()
+        for name, value in (('_pending', Counter()), ('_last_flush', time.monotonic())):
+            patcher = mock.patch(f'rentals.view_counts.{name}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def view_counts(self):
+        return dict(Equipment.objects.values_list('title', 'view_count'))
+
+    def test_flush_adds_each_listing_its_views(self):
+        view_counts.record_view(self.xbox.pk, 3)
+        view_counts.record_view(self.ps5.pk)
+        view_counts.record_view(str(self.ps5.pk))
+        with mock.patch('rentals.view_counts.FLUSH_BATCH_SIZE', 1):
+            self.assertEqual(view_counts.flush_views(), 2)
+        self.assertEqual(self.view_counts(), {'Xbox Series X': 8, 'PlayStation 5': 7, 'Switch': 5})
+        self.assertEqual(view_counts.pending_views(), Counter())
+        self.assertEqual(view_counts.flush_views(), 0)
+
+    def test_views_kept_when_the_write_fails(self):
+        view_counts.record_view(self.xbox.pk, 2)
+        with mock.patch('rentals.view_counts.apply_view_counts', side_effect=DatabaseError('deadlock detected')), \
+                self.assertLogs('rentals.view_counts', 'ERROR'):
+            self.assertEqual(view_counts.flush_views(), 0)
+        view_counts.record_view(self.xbox.pk)
+        self.assertEqual(view_counts.pending_views(), Counter({str(self.xbox.pk): 3}))
+        view_counts.flush_views()
+        self.assertEqual(self.view_counts()['Xbox Series X'], 8)
+
+    def test_flush_due(self):
+        self.assertFalse(view_counts.flush_due())
+        view_counts.record_view(self.xbox.pk, 2)
+        self.assertFalse(view_counts.flush_due())
+        view_counts.record_view(self.ps5.pk)
+        self.assertTrue(view_counts.flush_due())
+        view_counts.flush_views()
+        view_counts.record_view(self.xbox.pk)
+        self.assertFalse(view_counts.flush_due())
+        with mock.patch('rentals.view_counts._last_flush', time.monotonic() - 3600):
+            self.assertTrue(view_counts.flush_due())
+
+    def test_cached_pages_count(self):
+        url = reverse('equipment_detail', kwargs={'equipment_id': self.switch.pk})
+        for _ in range(2):
+            self.assertEqual(self.client.get(url, secure=True).status_code, 200)
+        missing = reverse('equipment_detail', kwargs={'equipment_id': uuid.uuid4()})
+        self.assertEqual(self.client.get(missing, secure=True).status_code, 404)
+        self.assertEqual(view_counts.pending_views(), Counter({str(self.switch.pk): 2}))
+        # The third view reaches VIEW_COUNT_FLUSH_MAX_PENDING and is written once the request finishes
+        with self.assertNumQueries(1):
+            self.client.get(url, secure=True)
+        self.assertEqual(self.view_counts()['Switch'], 8)
+
+
+class PlatformStatsTests(TestCase):
+    """The DailyPlatformStats snapshot (rentals/analytics.py) stays correct between full rebuilds"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        cls.renter = CustomUser.objects.create_user(username='renter', email='renter@example.com', password='pw')
+        category = EquipmentCategory.objects.create(name='Consoles')
+        cls.xbox = Equipment.objects.create(
+            owner=cls.owner, category=category, title='Xbox Series X', description='Console', brand='Brand',
+            model='Model', condition='good', daily_rate=Decimal('10.00'), location_city='Austin',
+            location_state='TX', status='active',
+        )
+        cls.today = timezone.localdate()
+        cls.two_days_ago, cls.yesterday = cls.today - timedelta(days=2), cls.today - timedelta(days=1)
+        Equipment.objects.filter(pk=cls.xbox.pk).update(created_at=timezone.now() - timedelta(days=3))
+        cls.early, cls.late = cls.rental('completed', 2), cls.rental('pending', 2)
+        cls.recent = cls.rental('confirmed', 1)
+
+    @classmethod
+    def rental(cls, status, days_ago):
+        rental = Rental.objects.create(
+            equipment=cls.xbox, renter=cls.renter, owner=cls.owner, start_date=date(2026, 11, 10),
+            end_date=date(2026, 11, 13), daily_rate=Decimal('10.00'), total_days=3, subtotal=Decimal('30.00'),
+            security_deposit=Decimal('0.00'), total_amount=Decimal('30.00'), status=status,
+        )
+        Rental.objects.filter(pk=rental.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        rental.refresh_from_db()
+        return rental
+
+    def snapshot(self, field):
+        return dict(DailyPlatformStats.objects.values_list('date', field))
+
+    def test_incremental_refresh_recomputes_changed_days(self):
+        self.assertEqual(refresh_daily_stats(full=True), 4)
+        self.assertEqual(self.snapshot('new_rentals'), {
+            self.today: 0, self.yesterday: 1, self.two_days_ago: 2, self.today - timedelta(days=3): 0,
+        })
+        self.assertEqual(refresh_daily_stats(), 0)
+
+        self.late.status = 'completed'
+        self.late.save()
+        self.assertEqual(refresh_daily_stats(), 1)
+        row = DailyPlatformStats.objects.get(date=self.two_days_ago)
+        self.assertEqual(row.rentals_by_status, {'completed': 2})
+        self.assertEqual(row.completed_revenue, Decimal('60.00'))
+
+    def test_totals_include_changes_since_the_snapshot(self):
+        refresh_daily_stats(full=True)
+        self.recent.status = 'completed'
+        self.recent.save()
+        self.rental('pending', 0)
+
+        totals = platform_totals()
+        self.assertEqual(totals['total_rentals'], 4)
+        self.assertEqual(totals['rentals_by_status'], {'completed': 2, 'pending': 2})
+        self.assertEqual(totals['completed_revenue'], Decimal('60.00'))
+        self.assertEqual(self.snapshot('new_rentals')[self.today], 0)
+
+    def test_deleted_rows_leave_the_snapshot(self):
+        refresh_daily_stats(full=True)
+        self.recent.delete()
+        self.late.delete()
+        self.assertEqual(set(DailyPlatformStats.objects.filter(stale=True).values_list('date', flat=True)),
+                         {self.yesterday, self.two_days_ago})
+
+        totals = platform_totals()
+        self.assertEqual(totals['total_rentals'], 1)
+        self.assertEqual(totals['rentals_by_status'], {'completed': 1})
+
+        self.assertEqual(refresh_daily_stats(), 1)
+        self.assertEqual(self.snapshot('new_rentals'), {
+            self.today: 0, self.two_days_ago: 1, self.today - timedelta(days=3): 0,
+        })
+        self.assertFalse(DailyPlatformStats.objects.filter(stale=True).exists())
+        self.assertEqual(platform_totals()['total_rentals'], 1)
+
+
+class AdminSeriesTests(TestCase):
+    """Time-bucketed admin charts (rentals/analytics.py) and their query parameters"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user(
+            username='staff', email='staff@example.com', password='pw', is_staff=True
+        )
+        joined = {
+            'ada': datetime(2026, 3, 2, 9), 'bob': datetime(2026, 3, 2, 23, 59),
+            'cy': datetime(2026, 3, 4), 'di': datetime(2026, 5, 31, 12),
+        }
+        for username, when in joined.items():
+            user = CustomUser.objects.create_user(username=username, email=f'{username}@example.com', password='pw')
+            CustomUser.objects.filter(pk=user.pk).update(date_joined=timezone.make_aware(when))
+        CustomUser.objects.filter(pk=cls.staff.pk).update(date_joined=timezone.make_aware(datetime(2025, 1, 1)))
+        cls.sensor = Sensor.objects.create(name='Tracker', sensor_type='battery')
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def test_daily_series_fills_empty_days(self):
+        with self.assertNumQueries(1):
+            series = time_series(CustomUser.objects.all(), 'date_joined', date(2026, 3, 1), date(2026, 3, 5))
+        self.assertEqual(series, [
+            (date(2026, 3, 1), 0), (date(2026, 3, 2), 2), (date(2026, 3, 3), 0),
+            (date(2026, 3, 4), 1), (date(2026, 3, 5), 0),
+        ])
+        self.assertEqual(daily_series(CustomUser.objects.all(), 'date_joined', 3, end=date(2026, 3, 4)),
+                         [(date(2026, 3, 2), 2), (date(2026, 3, 3), 0), (date(2026, 3, 4), 1)])
+
+    def test_weekly_and_monthly_buckets(self):
+        users = CustomUser.objects.all()
+        self.assertEqual(time_series(users, 'date_joined', date(2026, 3, 1), date(2026, 3, 10), interval='week'), [
+            (date(2026, 2, 23), 0), (date(2026, 3, 2), 3), (date(2026, 3, 9), 0),
+        ])
+        self.assertEqual(time_series(users, 'date_joined', date(2026, 2, 15), date(2026, 6, 1), interval='month'), [
+            (date(2026, 2, 1), 0), (date(2026, 3, 1), 3), (date(2026, 4, 1), 0),
+            (date(2026, 5, 1), 1), (date(2026, 6, 1), 0),
+        ])
+        with self.assertRaises(ValueError):
+            time_series(users, 'date_joined', date(2026, 3, 1), date(2026, 3, 5), interval='year')
+
+    def test_dashboard_growth_window(self):
+        url = reverse('admin_dashboard')
+        response = self.client.get(url, {'days': '7'}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['growth_days'], 7)
+        self.assertEqual(len(json.loads(response.context['user_growth_data'])), 7)
+        self.assertEqual(self.client.get(url, {'days': '5000'}, secure=True).context['growth_days'], 365)
+        self.assertEqual(self.client.get(url, {'days': 'week'}, secure=True).status_code, 400)
+
+    def test_sensor_series_rejects_malformed_parameters(self):
+        url = reverse('admin_sensor_series', kwargs={'sensor_id': self.sensor.pk})
+        self.assertEqual(self.client.get(url, {'hours': '6'}, secure=True).status_code, 200)
+        for params in ({'hours': 'six'}, {'max_points': '1e3'}, {'start': 'yesterday'},
+                       {'start': '2026-03-02T10:00', 'end': '2026-03-02T09:00'}):
+            response = self.client.get(url, params, secure=True)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('error', response.json())
+
+
+class MonthlyRevenueTests(TestCase):
+    """Completed-rental revenue per calendar month (analytics.monthly_revenue and its JSON API)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user(
+            username='staff', email='staff@example.com', password='pw', is_staff=True
+        )
+        cls.renter = CustomUser.objects.create_user(username='renter', email='renter@example.com', password='pw')
+        cls.xbox = Equipment.objects.create(
+            owner=cls.staff, category=EquipmentCategory.objects.create(name='Consoles'), title='Xbox Series X',
+            description='Console', brand='Brand', model='Model', condition='good', daily_rate=Decimal('10.00'),
+            location_city='Austin', location_state='TX', status='active',
+        )
+        cls.rental(datetime(2026, 1, 31, 23), '100.00')
+        cls.rental(datetime(2026, 3, 1, 0, 30), '40.00')
+        cls.rental(datetime(2026, 3, 31, 22), '2.50')
+        cls.rental(datetime(2026, 3, 15), '500.00', status='cancelled')
+        cls.rental(timezone.now(), '25.00')
+
+    @classmethod
+    def rental(cls, created_at, amount, status='completed'):
+        rental = Rental.objects.create(
+            equipment=cls.xbox, renter=cls.renter, owner=cls.staff, start_date=date(2026, 11, 10),
+            end_date=date(2026, 11, 11), daily_rate=Decimal(amount), total_days=1, subtotal=Decimal(amount),
+            security_deposit=Decimal('0.00'), total_amount=Decimal(amount), status=status,
+        )
+        if timezone.is_naive(created_at):
+            created_at = timezone.make_aware(created_at)
+        Rental.objects.filter(pk=rental.pk).update(created_at=created_at)
+
+    def test_calendar_months(self):
+        with self.assertNumQueries(1):
+            revenue = monthly_revenue(months=4, end=date(2026, 4, 30))
+        self.assertEqual(revenue, [
+            {'month': '2026-01', 'revenue': 100.0}, {'month': '2026-02', 'revenue': 0.0},
+            {'month': '2026-03', 'revenue': 42.5}, {'month': '2026-04', 'revenue': 0.0},
+        ])
+        self.assertEqual([row['month'] for row in monthly_revenue(months=14, end=date(2026, 3, 1))][:3],
+                         ['2025-02', '2025-03', '2025-04'])
+
+    def test_revenue_api(self):
+        url = reverse('admin_revenue_api')
+        self.assertEqual(self.client.get(url, secure=True).status_code, 302)
+
+        self.client.force_login(self.staff)
+        data = self.client.get(url, {'months': '3'}, secure=True).json()
+        self.assertEqual(data['months'], 3)
+        self.assertEqual(len(data['revenue']), 3)
+        self.assertEqual(data['revenue'][-1], {'month': timezone.localdate().strftime('%Y-%m'), 'revenue': 25.0})
+
+        self.assertEqual(self.client.get(url, {'months': '0'}, secure=True).json()['months'], 1)
+        self.assertEqual(self.client.get(url, secure=True).json()['months'], 12)
+        response = self.client.get(url, {'months': 'all'}, secure=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': "Invalid months 'all'"})
+
+
+class StatusHistogramTests(TestCase):
+    """Status counters collapsed into one conditional aggregate per model"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        category = EquipmentCategory.objects.create(name='Consoles')
+        for title, status, rate in (('Xbox', 'active', '10.00'), ('PS5', 'active', '12.50'),
+                                    ('Switch', 'pending', '8.00'), ('Wii', 'suspended', '3.00')):
+            Equipment.objects.create(
+                owner=owner, category=category, title=title, description='Console', brand='Brand',
+                model='Model', condition='good', daily_rate=Decimal(rate), location_city='Austin',
+                location_state='TX', status=status,
+            )
+
+    def test_status_histogram(self):
+        with self.assertNumQueries(1):
+            counts = status_histogram(Equipment.objects.all())
+        self.assertEqual(counts, {
+            'draft': 0, 'pending': 1, 'active': 2, 'rented': 0, 'inactive': 0, 'suspended': 1, 'total': 4,
+        })
+        self.assertEqual(
+            status_histogram(Equipment.objects.filter(daily_rate__gt=5), choices=[('active', 'Active')],
+                             cheap=Q(daily_rate__lt=10)),
+            {'active': 2, 'cheap': 1, 'total': 3},
+        )
+
+    def test_count_buckets(self):
+        with self.assertNumQueries(1):
+            counts = count_buckets(
+                Equipment.objects.order_by('title'),
+                listed=Q(status__in=['active', 'pending']),
+                hidden=~Q(status__in=['active', 'pending']),
+                listed_rates=Sum('daily_rate', filter=Q(status='active')),
+            )
+        self.assertEqual(counts, {'listed': 3, 'hidden': 1, 'listed_rates': Decimal('22.50')})
+        self.assertEqual(count_buckets(Equipment.objects.none(), any=Q()), {'any': 0})
+
+
+class AdminSensorListTests(TestCase):
+    """Connectivity counts and the ?online= facet on the admin sensor list"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user(
+            username='staff', email='staff@example.com', password='pw', is_staff=True
+        )
+        now = timezone.now()
+        for name, age in (('Fresh', timedelta(minutes=5)), ('Recent', timedelta(minutes=50)),
+                          ('Quiet', timedelta(hours=3)), ('Gone', timedelta(days=3)), ('New', None)):
+            Sensor.objects.create(name=name, sensor_type='battery', last_reading=age and now - age)
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def names(self, online):
+        response = self.client.get(reverse('admin_sensors'), {'online': online}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        return {sensor.name for sensor in response.context['page_obj']}
+
+    def test_counts(self):
+        response = self.client.get(reverse('admin_sensors'), secure=True)
+        counts = {key: response.context[key] for key in (
+            'total_sensors', 'online_sensors', 'not_online_sensors', 'stale_sensors', 'offline_sensors'
+        )}
+        self.assertEqual(counts, {
+            'total_sensors': 5, 'online_sensors': 2, 'not_online_sensors': 3, 'stale_sensors': 1, 'offline_sensors': 2,
+        })
+        self.assertContains(response, 'Not online (3)')
+
+    def test_online_filter(self):
+        self.assertEqual(self.names('true'), {'Fresh', 'Recent'})
+        self.assertEqual(self.names('false'), {'Quiet', 'Gone', 'New'})
+        self.assertEqual(self.names('stale'), {'Quiet'})
+        self.assertEqual(self.names('offline'), {'Gone', 'New'})
+        self.assertEqual(self.names('all'), {'Fresh', 'Recent', 'Quiet', 'Gone', 'New'})
+        self.assertEqual(self.names('bogus'), {'Fresh', 'Recent', 'Quiet', 'Gone', 'New'})
+
+    def test_connectivity_annotation(self):
+        response = self.client.get(reverse('admin_sensors'), secure=True)
+        self.assertEqual(
+            {sensor.name: sensor.connectivity for sensor in response.context['page_obj']},
+            {'Fresh': 'online', 'Recent': 'online', 'Quiet': 'stale', 'Gone': 'offline', 'New': 'offline'},
+        )
+
+
+class FakePayPalTests(TestCase):
+    """The local PayPal stand-in (rentals/fake_paypal.py) and a checkout run against it"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        renter = CustomUser.objects.create_user(username='renter', email='renter@example.com', password='pw')
+        equipment = Equipment.objects.create(
+            owner=owner, category=EquipmentCategory.objects.create(name='Consoles'), title='Xbox Series X',
+            description='Console', brand='Microsoft', model='Series X', condition='good',
+            daily_rate=Decimal('10.00'), location_city='Austin', location_state='TX', status='active',
+        )
+        cls.rental = Rental.objects.create(
+            equipment=equipment, renter=renter, owner=owner, start_date=date(2026, 11, 1),
+            end_date=date(2026, 11, 2), daily_rate=Decimal('10.00'), total_days=2, subtotal=Decimal('20.00'),
+            security_deposit=Decimal('0.00'), total_amount=Decimal('20.00'), status='approved',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.fake = FakePayPalServer().start()
+        self.addCleanup(self.fake.stop)
+
+    def post(self, path, body=None, **headers):
+        token = requests.post(f'{self.fake.url}/v1/oauth2/token', timeout=5).json()['access_token']
+        headers['Authorization'] = f'Bearer {token}'
+        return requests.post(f'{self.fake.url}{path}', json=body, headers=headers, timeout=5)
+
+    def create_order(self, **headers):
+        body = {'intent': 'CAPTURE', 'purchase_units': [{'amount': {'currency_code': 'USD', 'value': '20.00'}}]}
+        return self.post('/v2/checkout/orders', body, **headers)
+
+    def test_request_id_replays_the_first_response(self):
+        first = self.create_order(**{'PayPal-Request-Id': 'checkout-1'})
+        again = self.create_order(**{'PayPal-Request-Id': 'checkout-1'})
+        other = self.create_order(**{'PayPal-Request-Id': 'checkout-2'})
+        self.assertEqual((first.status_code, again.status_code), (201, 201))
+        self.assertEqual(again.json(), first.json())
+        self.assertNotEqual(other.json()['id'], first.json()['id'])
+        self.assertEqual(len(self.fake.orders), 2)
+        self.assertEqual(self.fake.stats['replayed'], 1)
+
+    def test_injected_errors(self):
+        self.fake.error_rate = 1.0
+        response = requests.post(f'{self.fake.url}/v1/oauth2/token', timeout=5)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['name'], 'SERVICE_UNAVAILABLE')
+        self.assertEqual(self.fake.stats['injected_errors'], 1)
+        self.assertFalse(self.fake.tokens)
+
+    def test_manual_approval(self):
+        self.fake.auto_approve = False
+        order = self.create_order().json()
+        capture_path = f"/v2/checkout/orders/{order['id']}/capture"
+
+        response = self.post(capture_path)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json()['details'][0]['issue'], 'ORDER_NOT_APPROVED')
+
+        approve = next(link['href'] for link in order['links'] if link['rel'] == 'approve')
+        self.assertEqual(requests.get(approve, timeout=5).json(), {'id': order['id'], 'status': 'APPROVED'})
+        response = self.post(capture_path)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['purchase_units'][0]['payments']['captures'][0]['amount']['value'], '20.00')
+        self.assertEqual(self.post(capture_path).json()['details'][0]['issue'], 'ORDER_ALREADY_CAPTURED')
+
+    def test_checkout_end_to_end(self):
+        request = RequestFactory().get('/', secure=True)
+        with override_settings(PAYPAL_BASE_URL=self.fake.url):
+            initiated = initiate_payment(self.rental, request)
+            self.assertTrue(initiated['success'], initiated.get('error'))
+            self.assertTrue(initiated['approval_url'].startswith(f'{self.fake.url}/checkoutnow?token='))
+            captured = capture_payment(initiated['order_id'], initiated['payment_id'])
+        self.assertTrue(captured['success'], captured.get('error'))
+
+        payment = Payment.objects.get(pk=initiated['payment_id'])
+        self.assertEqual((payment.status, payment.paypal_order_id), ('completed', initiated['order_id']))
+        self.assertEqual(payment.amount, Decimal('20.00'))
+        self.rental.refresh_from_db()
+        self.assertEqual(self.rental.status, 'confirmed')
+        self.assertEqual(self.fake.stats['POST /v2/checkout/orders/{id}/capture'], 1)
+
+
+class BenchmarkCheckoutTests(TransactionTestCase):
+    """benchmark_checkout runs real checkouts from worker threads, so its data has to be committed"""
+
+    def test_smoke(self):
+        out = io.StringIO()
+        call_command(
+            'benchmark_checkout', '--checkouts', '5', '--concurrency', '2', '--latency', '0', '--jitter', '0',
+            stdout=out,
+        )
+        # Counted before cleanup: every rental was confirmed by its capture
+        self.assertIn('Completed 5, failed 0, confirmed 5', out.getvalue())
+        self.assertIn('5 POST /v2/checkout/orders/{id}/capture', out.getvalue())
+        # Cleanup removes the benchmark users, and with them their listings, rentals and payments
+        self.assertFalse(CustomUser.objects.filter(username__startswith='benchmark-').exists())
+        self.assertFalse(EquipmentCategory.objects.filter(name__startswith='benchmark-').exists())
+        self.assertFalse(Equipment.objects.exists())
+        self.assertFalse(Rental.objects.exists())
+        self.assertFalse(Payment.objects.exists())
@@ -2,6 +2,7 @@ from django.urls import path
 from . import views
 from . import admin_views
 from . import auth_views
+from . import api_views
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -35,25 +36,35 @@ urlpatterns = [
     path('admin-logout/', views.admin_logout, name='custom_admin_logout'),
     path('admin-panel/', views.custom_admin_dashboard, name='custom_admin_dashboard'),
     # Admin URLs
+    path('admin-panel/dashboard/', admin_views.admin_dashboard, name='admin_dashboard'),
     path('admin-panel/users/', auth_views.AdminUserListView.as_view(), name='admin_users'),
     path('admin-panel/users/<int:pk>/', auth_views.AdminUserDetailView.as_view(), name='admin_user_detail'),
     path('admin-panel/users/<int:user_id>/action/', auth_views.admin_user_action, name='admin_user_action'),
     path('admin-panel/equipment/', admin_views.admin_equipment, name='admin_equipment'),
-    path('admin-panel/equipment/<int:equipment_id>/', admin_views.admin_equipment_detail, name='admin_equipment_detail'),
+    path('admin-panel/equipment/<uuid:equipment_id>/', admin_views.admin_equipment_detail, name='admin_equipment_detail'),
     path('admin-panel/rentals/', admin_views.admin_rentals, name='admin_rentals'),
-    path('admin-panel/rentals/<int:rental_id>/', admin_views.admin_rental_detail, name='admin_rental_detail'),
+    path('admin-panel/rentals/<uuid:rental_id>/', admin_views.admin_rental_detail, name='admin_rental_detail'),
     path('admin-panel/categories/', admin_views.admin_categories, name='admin_categories'),
     path('admin-panel/analytics/', admin_views.admin_analytics, name='admin_analytics'),
+    path('admin-panel/analytics/revenue/', admin_views.admin_revenue_api, name='admin_revenue_api'),
     path('admin-panel/settings/', admin_views.admin_settings, name='admin_settings'),
     
     # New Admin URLs for Sensors and Payments
     path('admin-panel/sensors/', admin_views.admin_sensors, name='admin_sensors'),
     path('admin-panel/sensors/<uuid:sensor_id>/', admin_views.admin_sensor_detail, name='admin_sensor_detail'),
+    path('admin-panel/sensors/<uuid:sensor_id>/series/', admin_views.admin_sensor_series, name='admin_sensor_series'),
     path('admin-panel/payments/', admin_views.admin_payments, name='admin_payments'),
     path('admin-panel/payments/<uuid:payment_id>/', admin_views.admin_payment_detail, name='admin_payment_detail'),
     path('admin-panel/rentals/<uuid:rental_id>/initiate-payment/', admin_views.admin_payment_initiation, name='admin_payment_initiation'),
     
+    # Device / integration APIs
+    path('api/sensors/readings/', api_views.sensor_readings_ingest, name='sensor_readings_ingest'),
+    path('api/equipment/availability/', api_views.equipment_availability, name='equipment_availability'),
+    path('api/equipment/nearby/', api_views.equipment_nearby, name='equipment_nearby'),
+    
     # PayPal Payment URLs
     path('paypal/payment/success/<uuid:rental_id>/', views.paypal_payment_success, name='paypal_payment_success'),
     path('paypal/payment/cancel/<uuid:rental_id>/', views.paypal_payment_cancel, name='paypal_payment_cancel'),
+    path('payments/<uuid:payment_id>/status/', views.payment_status, name='payment_status'),
+    path('paypal/webhook/', api_views.paypal_webhook, name='paypal_webhook'),
 ]
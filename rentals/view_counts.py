@@ -0,0 +1,120 @@
+"""
+Buffered listing view counts
+Rationale: Writing Equipment.view_count on every detail view turns each page view
+into a row lock and an updated_at change on the listing, and a popular listing's
+viewers queue behind each other on that lock; views are tallied in memory instead
+and written in one UPDATE per flush
+
+Each process (e.g. gunicorn worker) keeps its own tally and adds it to the stored
+count with view_count = view_count + CASE id WHEN ... END, so any number of
+processes can flush concurrently without losing increments. A flush runs after a
+request finishes once VIEW_COUNT_FLUSH_SECONDS have passed or
+VIEW_COUNT_FLUSH_MAX_PENDING views are waiting, and when the process exits.
+Views still buffered in a process that is killed outright are lost, which is an
+acceptable price for a popularity counter.
+
+The UPDATE bypasses save() and its signals: updated_at is left alone and the
+catalog page cache is not invalidated by views.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DatabaseError
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from .models import Equipment
+
+logger = logging.getLogger(__name__)
+
+# Listings per UPDATE statement
+FLUSH_BATCH_SIZE = 500
+
+_lock = threading.Lock()
+_pending = Counter()
+_last_flush = time.monotonic()
+
+
+def record_view(equipment_id, count=1):
+    """Count a view of a listing; it is written on the next flush"""
+    with _lock:
+        _pending[str(equipment_id)] += count
+
+
+def pending_views():
+    """Copy of the views buffered in this process and not yet written"""
+    with _lock:
+        return Counter(_pending)
+
+
+def apply_view_counts(counts):
+    """Add {equipment id: views} to the stored view counts; returns rows updated"""
+    updated = 0
+    ids = list(counts)
+    # Batches bound the CASE expression. The database picks the row lock order inside
+    # an UPDATE, so concurrent flushes of the same listings can still deadlock; the
+    # loser raises DatabaseError and flush_views keeps its views for the next flush
+    for start in range(0, len(ids), FLUSH_BATCH_SIZE):
+        batch = ids[start:start + FLUSH_BATCH_SIZE]
+        increment = Case(
+            *[When(pk=equipment_id, then=Value(counts[equipment_id])) for equipment_id in batch],
+            default=Value(0),
+            output_field=PositiveIntegerField(),
+        )
+        updated += Equipment.objects.filter(pk__in=batch).update(view_count=F('view_count') + increment)
+    return updated
+
+
+def flush_views():
+    """Write and clear this process's buffered views; they are kept for the next flush on failure"""
+    global _last_flush
+    with _lock:
+        counts = Counter(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    if not counts:
+        return 0
+    try:
+        return apply_view_counts(counts)
+    except DatabaseError:
+        logger.exception('Could not write %d buffered equipment views', sum(counts.values()))
+        with _lock:
+            _pending.update(counts)
+        return 0
+
+
+def flush_due():
+    with _lock:
+        if not _pending:
+            return False
+        return (
+            time.monotonic() - _last_flush >= settings.VIEW_COUNT_FLUSH_SECONDS
+            or sum(_pending.values()) >= settings.VIEW_COUNT_FLUSH_MAX_PENDING
+        )
+
+
+def flush_if_due(**kwargs):
+    """request_finished receiver"""
+    if flush_due():
+        flush_views()
+
+
+def counts_views(view):
+    """
+    View decorator recording a view of kwargs['equipment_id'] for every 200 response
+    Apply it outside cache_for_anonymous so pages served from the cache count too
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if request.method == 'GET' and response.status_code == 200:
+            record_view(kwargs['equipment_id'])
+        return response
+    return wrapped
+
+
+request_finished.connect(flush_if_due, dispatch_uid='rentals.view_counts.flush_if_due')
+atexit.register(flush_views)
@@ -3,7 +3,18 @@ from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from .models import CustomUser
+from django.db.models import Q
+from django.http import Http404, JsonResponse
+from django.template.loader import render_to_string
+from .models import CustomUser, Equipment, Payment
+from .forms import EquipmentFilterForm
+from .caching import CATALOG, PAGES, cache_for_anonymous
+from .equipment_detail import build_equipment_detail, detail_queryset
+from .facets import catalog_facets
+from .pagination import InvalidCursor
+from .paypal_service import enqueue_capture
+from .search import search_page
+from .view_counts import counts_views
 
 files_to_delete = [
     "gamezone_env/rentals/templates/account/verification_sent.html",
@@ -50,24 +61,113 @@ def custom_admin_dashboard(request):
     # You can use your existing dashboard logic here, or just render the dashboard template
     return render(request, 'admin/dashboard.html')
 
+def _catalog_request(request):
+    """(form, search params, cursor, query string without the cursor) of a catalog request"""
+    form = EquipmentFilterForm(request.GET or None)
+    params = {}
+    if form.is_bound:
+        form.is_valid()
+        # An invalid filter is dropped on its own; the search text and other filters still apply
+        params = {name: value for name, value in form.cleaned_data.items() if name not in form.errors}
+    query = request.GET.copy()
+    cursor = query.pop('cursor', [None])[-1]
+    return form, params, cursor, query.urlencode()
+
+def _facet_groups(facets, query):
+    """Facet counts as template-ready groups of options linking to the toggled filter"""
+    def option(label, count, **changes):
+        selected = all(query.get(name, '') == ('' if value is None else str(value)) for name, value in changes.items())
+        toggled = query.copy()
+        for name, value in changes.items():
+            if selected or value is None:
+                toggled.pop(name, None)
+            else:
+                toggled[name] = str(value)
+        return {'label': label, 'count': count, 'selected': selected, 'url': f'?{toggled.urlencode()}'}
+
+    availability = []
+    if facets['pickup']:
+        availability.append(option('Pickup', facets['pickup'], available_for_pickup='on'))
+    if facets['delivery']:
+        availability.append(option('Delivery', facets['delivery'], available_for_delivery='on'))
+    return [
+        {'name': 'Category', 'options': [
+            option(entry['label'], entry['count'], category=entry['value']) for entry in facets['category']
+        ]},
+        {'name': 'Condition', 'options': [
+            option(entry['label'], entry['count'], condition=entry['value']) for entry in facets['condition']
+        ]},
+        {'name': 'Price per day', 'options': [
+            option(entry['label'], entry['count'], min_price=entry['min_price'], max_price=entry['max_price'])
+            for entry in facets['price']
+        ]},
+        {'name': 'Availability', 'options': availability},
+    ]
+
+@cache_for_anonymous(CATALOG)
 def equipment_list(request):
-    return render(request, 'equipment/list.html')
-
+    """Catalog search over active listings, paginated by cursor, with facet counts"""
+    form, params, cursor, query_string = _catalog_request(request)
+    try:
+        page = search_page(params, cursor=cursor)
+    except InvalidCursor:
+        page = search_page(params)
+    facets = catalog_facets(params)
+    query = request.GET.copy()
+    query.pop('cursor', None)
+    return render(request, 'equipment/list.html', {
+        'form': form,
+        'page': page,
+        'query_string': query_string,
+        'facets': facets,
+        'facet_groups': _facet_groups(facets, query),
+    })
+
+@counts_views
+@cache_for_anonymous(CATALOG)
 def equipment_detail(request, equipment_id):
-    return render(request, 'equipment/detail.html', {'equipment_id': equipment_id})
+    """Listing page; unpublished listings are only visible to their owner and staff"""
+    queryset = detail_queryset(request.user)
+    if not request.user.is_staff:
+        visible = Q(status='active')
+        if request.user.is_authenticated:
+            visible |= Q(owner=request.user)
+        queryset = queryset.filter(visible)
+    try:
+        detail = build_equipment_detail(equipment_id, queryset=queryset)
+    except Equipment.DoesNotExist:
+        raise Http404('Equipment not found')
+    return render(request, 'equipment/detail.html', {'detail': detail, 'equipment': detail.equipment})
 
+@cache_for_anonymous(PAGES)
 def home(request):
     return render(request, 'index.html')
 
 def create_rental_request(request, equipment_id):
     return render(request, 'rentals/create_rental_request.html', {'equipment_id': equipment_id})
 
+@cache_for_anonymous(CATALOG)
 def load_more_equipment(request):
-    return render(request, 'rentals/load_more_equipment.html')
-
+    """
+    Next slice of catalog results for infinite scroll: the rendered cards and the
+    cursor to request after them (null once the results are exhausted)
+    """
+    _, params, cursor, _ = _catalog_request(request)
+    try:
+        page = search_page(params, cursor=cursor)
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    return JsonResponse({
+        'html': render_to_string('equipment/_cards.html', {'page': page}, request=request),
+        'count': len(page),
+        'next_cursor': page.next_cursor,
+    })
+
+@cache_for_anonymous(PAGES)
 def how_it_works(request):
     return render(request, 'how_it_works.html')
 
+@cache_for_anonymous(PAGES)
 def about(request):
     return render(request, 'about.html')
 
@@ -101,14 +201,29 @@ def toggle_equipment_status(request, equipment_id):
 def paypal_payment_success(request, rental_id):
     """
     Handle PayPal payment success redirect.
+    PayPal passes the approved order as ?token=; its capture is queued (see
+    paypal_service.enqueue_capture) and the page polls payment_status until done
     """
-    # You may want to capture the payment here using order_id from request.GET
-    # order_id = request.GET.get('token')  # PayPal usually returns 'token' as the order ID
-
-    # Optionally, add logic to update payment/rental status here
-
-    # For now, just render a simple success page or redirect
-    return render(request, 'rentals/payment_success.html', {'rental_id': rental_id})
+    order_id = request.GET.get('token')
+    payment = None
+    if order_id:
+        payment = Payment.objects.filter(rental_id=rental_id, paypal_order_id=order_id).first()
+    if payment is not None and payment.status == 'pending':
+        enqueue_capture(payment)
+        payment.status = 'processing'
+    return render(request, 'rentals/payment_success.html', {'rental_id': rental_id, 'payment': payment})
+
+@login_required
+def payment_status(request, payment_id):
+    """Payment and rental status for the payment page to poll"""
+    payment = Payment.objects.select_related('rental').filter(pk=payment_id).first()
+    if payment is None or (payment.payer_id != request.user.pk and not request.user.is_staff):
+        raise Http404('Payment not found')
+    return JsonResponse({
+        'status': payment.status,
+        'done': payment.status not in ('pending', 'processing'),
+        'rental_status': payment.rental.status,
+    })
 
 def paypal_payment_cancel(request, rental_id):
     """